@@ -0,0 +1,24 @@
+# Sweeps the U-I curve (cell voltage over current density) of the electrolyzer for several temperatures. The voltage
+# functions are evaluated on the whole current density x temperature grid at once.
+import numpy as np
+import matplotlib.pyplot as plt
+from electrolyzer import Electrolyzer
+import u_act
+import u_ohm
+import u_rev
+
+
+Ely = Electrolyzer()
+
+# Current densities as column [A/cm²] and temperatures as row [K], the voltage functions broadcast them to a grid.
+cur_dens = np.linspace(0.001, Ely.cur_dens_max, 400)[:, np.newaxis]
+temps = np.linspace(Ely.temp_0, Ely.temp_end, 4)[np.newaxis, :]
+cell_voltage = u_rev.ely_voltage_u_rev(Ely, temps) + u_act.ely_voltage_u_act(Ely, cur_dens, temps) + \
+    u_ohm.ely_voltage_u_ohm(Ely, cur_dens, temps)
+
+for i_temp, temp in enumerate(temps[0]):
+    plt.plot(cur_dens[:, 0], cell_voltage[:, i_temp], label="{:.0f} K".format(temp))
+plt.xlabel("Current density [A/cm²]")
+plt.ylabel("Cell voltage [V]")
+plt.legend()
+plt.show()
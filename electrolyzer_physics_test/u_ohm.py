@@ -2,6 +2,7 @@
 # (resistanceElectrolyte) and other losses like the presence of bubbles (resistanceOther).
 # Source: 'Modeling an alkaline electrolysis cell through reduced-order and loss estimate approaches'
 # from Milewski et al. (2014)
+# The current density and the temperature can also be NumPy arrays (e.g. to sweep U-I curves, see u_i_curve.py).
 
 
 # cur_dens separate because of U / I iteration
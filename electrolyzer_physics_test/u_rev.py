@@ -2,8 +2,9 @@
 # due to temperature changes, the second part due to pressure changes.
 # Source: 'Modeling an alkaline electrolysis cell through reduced-order and loss estimate approaches'
 # from Milewski et al. (2014)
+# The temperature can also be a NumPy array (e.g. to sweep U-I curves, see u_i_curve.py).
 
-import math
+import numpy as np
 
 
 def ely_voltage_u_rev(ely, temp):
@@ -19,17 +20,17 @@ def ely_voltage_u_rev(ely, temp):
     # Get the temperature for this loop run [K].
     this_temp = temp
     # Compute the part of the reversible cell voltage that changes due to temperature [V].
-    voltage_temperature = 1.5184 - 1.5421e-03 * this_temp + 9.526e-05 * this_temp * math.log(this_temp) + 9.84e-08 \
+    voltage_temperature = 1.5184 - 1.5421e-03 * this_temp + 9.526e-05 * this_temp * np.log(this_temp) + 9.84e-08 \
                            * this_temp**2
     # Calculate the vapor pressure of water [bar].
-    pressure_water = math.exp(81.6179 - 7699.68 / this_temp - 10.9 * math.log(this_temp) + 9.5891e-03 * this_temp)
+    pressure_water = np.exp(81.6179 - 7699.68 / this_temp - 10.9 * np.log(this_temp) + 9.5891e-03 * this_temp)
     # Calculate the vapor pressure of KOH solution [bar].
-    pressure_koh = math.exp(2.302 * c1 + c2 * math.log(pressure_water))
+    pressure_koh = np.exp(2.302 * c1 + c2 * np.log(pressure_water))
     # Calculate the water activity value.
-    water_activity = math.exp(-0.05192 * ely.molality_KOH + 0.003302 * ely.molality_KOH**2 + (3.177 * ely.molality_KOH -
+    water_activity = np.exp(-0.05192 * ely.molality_KOH + 0.003302 * ely.molality_KOH**2 + (3.177 * ely.molality_KOH -
                               2.131 * ely.molality_KOH**2) / this_temp)
     # Compute the part of the reversible cell voltage that changes due to pressure [V].
-    voltage_pressure = ely.gas_const * this_temp / (ely.n * ely.faraday) * math.log((ely.pressure - pressure_koh) *
+    voltage_pressure = ely.gas_const * this_temp / (ely.n * ely.faraday) * np.log((ely.pressure - pressure_koh) *
                        (ely.pressure - pressure_koh)**0.5 / water_activity)
     # Calculate the reversible voltage [V].
     voltage_reversible = voltage_temperature + voltage_pressure
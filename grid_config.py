@@ -19,6 +19,25 @@ class ConfigurationMixin:
             Market structure 
         """
         self.pricing_rule = 'pab'  # 'pac', 'pab' or 'mcafee'
+        # Define how bids and offers are linked into the aggregated demand/supply curve. 'order_book' sorts, merges and
+        # clears on the NumPy columns of the order books, 'incremental' does the same but only re-sorts the orders of
+        # agents whose prices changed since the last step (see IncrementalSort, pays off for books of more than about
+        # 10,000 orders), 'merge' walks both sorted curves once in Python, 'scan' is the original (quadratic) forward
+        # search.
+        self.sorting_engine = 'order_book'  # 'order_book', 'incremental', 'merge' or 'scan'
+        # Number of worker threads that solve the bidding optimizations of all storage agents (electrolyzer, commercial
+        # battery) of a step in parallel, before the pre-auction round (see source/solver_pool.py). With 0, each agent
+        # solves its optimization in its own pre-auction round.
+        self.solver_pool_workers = 0
+
+        """
+            Profiles
+        """
+        # A ProfileStore (see source/profile_store.py) to read the time series from instead of parsing the csv files,
+        # e.g. one that is shared by all runs of a sweep. None parses the csv files for this run.
+        self.profile_store = None
+        # Cache the parsed csv files as .npy binaries (in source/profiles/.profile_cache) and read them memory-mapped.
+        self.profile_cache = True
 
         """ 
             Electrolyzer
@@ -105,9 +124,27 @@ class ConfigurationMixin:
         """
 
         """ ESS constants"""
+        # Forecast horizon of the ESS strategy [steps]. A household can have its own horizon as third entry of its ESS
+        # characteristics [initial soc, max capacity, horizon].
         self.horizon = 24
+        # With True, the ESS strategy gets the sums over the forecast horizon from prefix sums of the time series, in
+        # constant time for any horizon. These differ from the sums over the horizon by rounding (about 1e-12 kWh),
+        # which can change the decisions of the households. False sums up the time series over the horizon exactly.
+        self.ess_forecast_prefix_sums = False
         self.constraints_setting = "off"  # "off" or "on"
+        # With "on", the aging of all ESS is computed at once (vectorized) after the post-auction round, with "off" each
+        # ESS computes its aging in its own state update.
         self.battery_aging = "off"  # "off" or "on"
+        # Number of the last ESS temperatures that are kept as history (ESS.temperature), 0 keeps none. The aging uses
+        # the running average of the temperatures of all steps either way.
+        self.ess_temperature_history = 0
+        # Update the ESS states of all households at once (see source/ess_fleet.py) instead of one by one in their
+        # post-auction round.
+        self.ess_fleet = True
+        # Make the bids and offers of the households with a strategy with a batch entry point for all of them at once
+        # (e.g. the price curves of all ESS households) and post the orders of all households in one batch (see
+        # HouseholdFleet.announce_bids_and_offers), instead of one by one in their pre-auction round.
+        self.strategy_batches = True
 
         if self.constraints_setting == 'off':
             config_log.warning("Physical battery constraints are not active")
@@ -13,15 +13,17 @@ formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(messag
 fh.setFormatter(formatter)
 grid_log.addHandler(fh)
 
-trade_deals_list_per_step = {}
-clearing_price = {}
-clearing_quantity = {}
+# Tracked data of each run, indexed by run.
+trade_deals_list_per_step = []
+clearing_price = []
+clearing_quantity = []
 
 
-def extract_data():
-    trade_deals_list_per_step[microgrid.step_count] = microgrid.auction.trade_pairs
-    clearing_price[microgrid.step_count] = microgrid.auction.clearing_price
-    clearing_quantity[microgrid.step_count] = microgrid.auction.clearing_quantity
+def extract_data(i_run):
+    microgrid = microgrids[i_run]
+    trade_deals_list_per_step[i_run][microgrid.step_count] = microgrid.auction.trade_pairs
+    clearing_price[i_run][microgrid.step_count] = microgrid.auction.clearing_price
+    clearing_quantity[i_run][microgrid.step_count] = microgrid.auction.clearing_quantity
 
 
 def create_microgrid():
@@ -31,10 +33,13 @@ def create_microgrid():
     return microgrid_
 
 
-def step_microgrid():
-    microgrid.sim_step()
-    grid_log.info('Step %d' % microgrid.step_count)
-    extract_data()
+def step_microgrids():
+    # The runs are independent of each other. They are stepped in lockstep, so the auctions of all runs with the
+    # 'order_book' sorting engine are cleared in one batched call.
+    microgrid_environment.sim_step_batched(microgrids)
+    grid_log.info('Step %d' % microgrids[0].step_count)
+    for i_run in range(len(microgrids)):
+        extract_data(i_run)
 
 # Create multiple options for the bidding price of the ely, which consists of 4 prices. The prices have a range from 6
 # to 24 ct/kWh and the distance of the prices varies between 2, 4 or 6 ct/kWh.
@@ -47,17 +52,25 @@ ely_bidding_price += [[i, i+4, i+8, i+12] for i in range(6, 14, 2)]
 # Distance of 2 ct/kWh.
 ely_bidding_price += [[i, i+2, i+4, i+6] for i in range(6, 20, 2)]
 
+microgrids = []
 for i_run in range(len(ely_bidding_price)):
     microgrid = create_microgrid()
     # Update ely bidding prices [EUR/kWh].
     microgrid.agents["Electrolyzer"].stepwise_bid_price = [i / 100 for i in ely_bidding_price[i_run]]
-    for step in range(microgrid.data.num_steps):
-        if step % 1000 == 0:
-            print("\n*******************************************************")
-            print("                     step", microgrid.step_count)
-            print("*******************************************************")
-        step_microgrid()
+    microgrids.append(microgrid)
+    trade_deals_list_per_step.append({})
+    clearing_price.append({})
+    clearing_quantity.append({})
+
+for step in range(microgrids[0].data.num_steps):
+    if step % 1000 == 0:
+        print("\n*******************************************************")
+        print("                     step", microgrids[0].step_count)
+        print("*******************************************************")
+    step_microgrids()
 
+for i_run in range(len(ely_bidding_price)):
+    microgrid = microgrids[i_run]
     assert microgrid.step_count == microgrid.data.num_steps
 
     write_output_to_csv = False
@@ -66,14 +79,14 @@ for i_run in range(len(ely_bidding_price)):
 
         with open("test_result.csv", "w", newline='') as file:
             writer = csv.writer(file)
-            for i in range(len(trade_deals_list_per_step)):
+            for i in range(len(trade_deals_list_per_step[i_run])):
                 this_row = []
-                if trade_deals_list_per_step[i + 1] is None:
+                if trade_deals_list_per_step[i_run][i + 1] is None:
                     # Case: This trade entry is None. While a time step without a trade might lead to an entry of None or
                     # an empty list, make all Nones to empty lists for further processing.
-                    trade_deals_list_per_step[i + 1] = []
-                if len(trade_deals_list_per_step[i + 1]) > 0:
-                    for row_entry in trade_deals_list_per_step[i + 1]:
+                    trade_deals_list_per_step[i_run][i + 1] = []
+                if len(trade_deals_list_per_step[i_run][i + 1]) > 0:
+                    for row_entry in trade_deals_list_per_step[i_run][i + 1]:
                         this_row += row_entry
                 else:
                     this_row = ['No trade was made']
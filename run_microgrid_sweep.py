@@ -0,0 +1,44 @@
+from source.sweep_runner import run_sweep
+from source.profile_store import ProfileStore
+from grid_config_profile import ConfigurationUtility50prosumerEly as Config
+
+import logging
+
+logging.basicConfig(level=logging.WARNING)
+grid_log = logging.getLogger('run_microgrid')
+
+# Create multiple options for the bidding price of the ely, which consists of 4 prices. The prices have a range from 6
+# to 24 ct/kWh and the distance of the prices varies between 2, 4 or 6 ct/kWh.
+
+# Distance of 6 ct/kWh.
+ely_bidding_price = [[6, 12, 18, 24]]
+# Distance of 4 ct/kWh.
+ely_bidding_price += [[i, i+4, i+8, i+12] for i in range(6, 14, 2)]
+# Distance of 2 ct/kWh.
+ely_bidding_price += [[i, i+2, i+4, i+6] for i in range(6, 20, 2)]
+
+# Each combination of the config attributes given here is run in its own worker process [EUR/kWh].
+param_grid = {'ely_stepwise_bid_price': [[i / 100 for i in prices] for prices in ely_bidding_price]}
+# KPI of finished runs are stored here. If the sweep is started again, runs with an existing result are skipped.
+result_loc = 'eval_result/stored_session/sweep/'
+
+if __name__ == '__main__':
+    household_earnings = {}
+    failed_runs = []
+    # The profiles are parsed once here, the workers attach to them in shared memory.
+    with ProfileStore() as profile_store:
+        profile_store.preload(Config())
+        for params, kpi in run_sweep(Config, param_grid, result_loc, profile_store=profile_store,
+                                     failed_runs=failed_runs):
+            household_earnings[str(params['ely_stepwise_bid_price'])] = kpi['Households']['avg_expense_per_household']
+            print('Run finished:', params, kpi['Households']['avg_expense_per_household'])
+
+    print('\nResults are: \n')
+    print(household_earnings)
+    if failed_runs:
+        print('\nFailed runs (run again by the next sweep): \n')
+        print(failed_runs)
+
+    print("\n*******************************************************")
+    print("                  Sweep finished")
+    print("*******************************************************")
@@ -1,4 +1,5 @@
 from source.auctioneer_methods import *
+from source.order_book import AgentIndex, OrderBook, IncrementalSort, sort_order_books, clear_order_books_batched
 
 from plots import clearing_snapshot
 from mesa import Agent
@@ -22,11 +23,17 @@ class Auctioneer(Agent):
 
         self.id = _unique_id
         self.pricing_rule = self.model.data.pricing_rule
+        self.sorting_engine = self.model.data.sorting_engine
         self.aggregate_demand_curve = []
         self.aggregate_supply_curve = []
 
-        self.bid_list = []
-        self.offer_list = []
+        # bids and offers [price, quantity, id] are appended by the agents into columnar order books
+        self.agent_index = AgentIndex()
+        self.bid_list = OrderBook(self.agent_index)
+        self.offer_list = OrderBook(self.agent_index)
+        # Sort orders of the bids and offers kept from step to step by the 'incremental' sorting engine.
+        self.bid_sort = IncrementalSort(descending=True)
+        self.offer_sort = IncrementalSort(descending=False)
         self.utility_market_maker_rate = 10
 
         self.sorted_bid_list = None
@@ -34,6 +41,8 @@ class Auctioneer(Agent):
         self.clearing_quantity = None
         self.clearing_price = None
         self.trade_pairs = None
+        # [clearing quantity, clearing price, break even index] if already found while sorting, else None
+        self.clearing_point = None
 
         self.percentage_sellers = None
         self.percentage_buyers = None
@@ -41,8 +50,11 @@ class Auctioneer(Agent):
 
         self.who_gets_what_dict = []
 
-    def auction_round(self):
-        """check whether all agents have submitted their bids"""
+    def auction_round(self, sorting_result=None):
+        """check whether all agents have submitted their bids
+
+            sorting_result can be given if bids and offers were already sorted (see order_book_sorting_batched)
+        """
         self.user_participation()
 
         """ resets the acquired energy for all households """
@@ -60,7 +72,11 @@ class Auctioneer(Agent):
             """ only proceed to auction if there is demand and supply (i.e. supply in the form of
             prosumers or utility grid) 
             """
-            self.sorted_bid_list, self.sorted_offer_list, sorted_x_y_y_pairs_list = self.sorting()
+            if sorting_result is None:
+                self.sorted_bid_list, self.sorted_offer_list, sorted_x_y_y_pairs_list = self.sorting()
+            else:
+                self.sorted_bid_list, self.sorted_offer_list, sorted_x_y_y_pairs_list, self.clearing_point = \
+                    sorting_result
             self.execute_auction(sorted_x_y_y_pairs_list)
 
             if self.trade_pairs:
@@ -68,19 +84,19 @@ class Auctioneer(Agent):
             else:
                 auction_log.warning("no trade at this step")
                 """ clear lists for later use in next step """
-                self.bid_list = []
-                self.offer_list = []
+                self.bid_list.clear()
+                self.offer_list.clear()
                 return
 
             """ clear lists for later use in next step """
-            self.bid_list = []
-            self.offer_list = []
+            self.bid_list.clear()
+            self.offer_list.clear()
             return
 
         else:
             """ clear lists for later use in next step """
-            self.bid_list = []
-            self.offer_list = []
+            self.bid_list.clear()
+            self.offer_list.clear()
             auction_log.warning("no trade at this step")
             return
 
@@ -117,7 +133,7 @@ class Auctioneer(Agent):
         """ picks pricing rule and generates trade_pairs"""
         if self.pricing_rule == 'pab':
             self.clearing_quantity, self.clearing_price, total_turnover, self.trade_pairs = \
-                pab_pricing(sorted_x_y_y_pairs_list)
+                pab_pricing(sorted_x_y_y_pairs_list, self.clearing_point)
             # print(f"Clearing rate was (on average): {self.clearing_price} [EUR/kWh]")
             # print(f"Clearing volume was: {self.clearing_quantity} [kWh]")
             auction_log.info("Clearing quantity %f, avg price %f, total turnover is %f",
@@ -125,7 +141,7 @@ class Auctioneer(Agent):
 
         elif self.pricing_rule == 'pac':
             self.clearing_quantity, self.clearing_price, total_turnover, self.trade_pairs = \
-                pac_pricing(sorted_x_y_y_pairs_list)
+                pac_pricing(sorted_x_y_y_pairs_list, self.clearing_point)
             # print(f"Clearing rate was: {self.clearing_price} [EUR/kWh]")
             # print(f"Clearing volume was: {self.clearing_quantity} [kWh]")
             auction_log.info("Clearing quantity %f, price %f, total turnover is %f",
@@ -133,7 +149,7 @@ class Auctioneer(Agent):
 
         elif self.pricing_rule == 'mcafee':
             self.clearing_quantity, self.clearing_price, total_turnover, self.trade_pairs = \
-                mcafee_pricing(sorted_x_y_y_pairs_list)
+                mcafee_pricing(sorted_x_y_y_pairs_list, self.clearing_point)
             # print(f"Clearing rate was (on average): {self.clearing_price} [EUR/kWh]")
             # print(f"Clearing volume was: {self.clearing_quantity} [kWh]")
             auction_log.info("Clearing quantity %f, price %f, total turnover is %f",
@@ -181,6 +197,63 @@ class Auctioneer(Agent):
 
     def sorting(self):
         """sorts bids and offers into an aggregated demand/supply curve"""
+        self.clearing_point = None
+        if self.sorting_engine == 'order_book':
+            return self.order_book_sorting()
+        elif self.sorting_engine == 'incremental':
+            return self.order_book_sorting(incremental=True)
+        elif self.sorting_engine == 'merge':
+            return merge_sorting(self.bid_list, self.offer_list)
+        elif self.sorting_engine == 'scan':
+            return self.scan_sorting()
+        else:
+            raise ValueError('Auctioneer: No valid sorting engine name given.')
+
+    def order_book_sorting(self, incremental=False):
+        """sorts bids and offers column-wise on the order books, applies the market rules and finds the clearing
+            point on the arrays, before handing the curve to the pricing rules
+            with incremental, only the orders of agents that changed their prices since the last step are re-sorted"""
+        bid_book = self.bid_list
+        offer_book = self.offer_list
+        if not isinstance(bid_book, OrderBook):
+            bid_book = OrderBook.from_orders(bid_book, self.agent_index)
+        if not isinstance(offer_book, OrderBook):
+            offer_book = OrderBook.from_orders(offer_book, self.agent_index)
+
+        if incremental:
+            sorted_bid_list, sorted_offer_list, merged_curve = sort_order_books(
+                bid_book, offer_book, self.bid_sort.sort(bid_book), self.offer_sort.sort(offer_book))
+        else:
+            sorted_bid_list, sorted_offer_list, merged_curve = sort_order_books(bid_book, offer_book)
+        merged_curve = merged_curve.market_rules()
+        self.clearing_point = merged_curve.break_even()
+
+        return sorted_bid_list, sorted_offer_list, merged_curve.to_list()
+
+    @staticmethod
+    def order_book_sorting_batched(auctioneers):
+        """order_book_sorting for the auctioneers of independent microgrids at the same step in one batched call,
+            returns a sorting result [sorted bids, sorted offers, sorted_x_y_y_pairs_list, clearing point] per
+            auctioneer, to be handed to its auction_round"""
+        bid_books = []
+        offer_books = []
+        for auctioneer in auctioneers:
+            bid_book = auctioneer.bid_list
+            offer_book = auctioneer.offer_list
+            if not isinstance(bid_book, OrderBook):
+                bid_book = OrderBook.from_orders(bid_book, auctioneer.agent_index)
+            if not isinstance(offer_book, OrderBook):
+                offer_book = OrderBook.from_orders(offer_book, auctioneer.agent_index)
+            bid_books.append(bid_book)
+            offer_books.append(offer_book)
+
+        return [[sorted_bid_list, sorted_offer_list, merged_curve.to_list(), clearing_point]
+                for sorted_bid_list, sorted_offer_list, merged_curve, clearing_point in
+                clear_order_books_batched(bid_books, offer_books)]
+
+    def scan_sorting(self):
+        """sorts bids and offers into an aggregated demand/supply curve, linking bids and offers by scanning forward
+            from every segment (O(n^2), kept as reference for the merge engine)"""
 
         # TODO: when ALL supply falls (far) under demand price, all supply is of course matched by pricing rule??
         # this creates a bug, which I currently avoid by breaking the sequence. But should be fixed
@@ -23,9 +23,66 @@ def check_demand_supply(sorted_bid_list_, sorted_offer_list_):
     return total_demand_, total_supply_
 
 
-def pac_pricing(sorted_x_y_y_pairs_list_):
+def merge_sorting(bid_list, offer_list):
+    """ sorts bids and offers and links them into an aggregated demand/supply curve with a single two-pointer walk
+
+        produces the same [x-axis location, bid price, offer price, buyer id, seller id] segments as the scanning
+        implementation in Auctioneer.sorting, but in O(n log n) instead of O(n^2).
+    """
+    # bid = (price, quantity, id); empty bids/offers do not add information
+    sorted_bid_list = sorted([bid for bid in bid_list if len(bid) != 0],
+                             key=lambda location: location[0], reverse=True)
+    sorted_offer_list = sorted([offer for offer in offer_list if len(offer) != 0],
+                               key=lambda location: location[0])
+
+    # x-axis location of each bid and offer on the aggregate demand and supply curve
+    aggregate_quantity_points_bid = []
+    prev = 0
+    for bid in sorted_bid_list:
+        prev = bid[1] + prev
+        aggregate_quantity_points_bid.append(prev)
+
+    aggregate_quantity_points_offer = []
+    prev = 0
+    for offer in sorted_offer_list:
+        prev = offer[1] + prev
+        aggregate_quantity_points_offer.append(prev)
+
+    # walk both curves along the x-axis at once. On equal quantity points the bid goes first, which matches the
+    # stable sort of [bids + offers] in the scanning implementation. Each point is linked to the next point of the
+    # other curve (at or after its own location), or to None if the other curve has already ended.
+    num_bids = len(sorted_bid_list)
+    num_offers = len(sorted_offer_list)
+    sorted_x_y_y_pairs_list = []
+    i = 0
+    j = 0
+    while i < num_bids or j < num_offers:
+        if j == num_offers or (i < num_bids and aggregate_quantity_points_bid[i] <= aggregate_quantity_points_offer[j]):
+            bid = sorted_bid_list[i]
+            if j < num_offers:
+                offer_price, seller_id = sorted_offer_list[j][0], sorted_offer_list[j][2]
+            else:
+                offer_price, seller_id = None, None
+            sorted_x_y_y_pairs_list.append([aggregate_quantity_points_bid[i], bid[0], offer_price, bid[2], seller_id])
+            i += 1
+        else:
+            offer = sorted_offer_list[j]
+            if i < num_bids:
+                bid_price, buyer_id = sorted_bid_list[i][0], sorted_bid_list[i][2]
+            else:
+                bid_price, buyer_id = None, None
+            sorted_x_y_y_pairs_list.append([aggregate_quantity_points_offer[j], bid_price, offer[0], buyer_id,
+                                            offer[2]])
+            j += 1
+
+    return sorted_bid_list, sorted_offer_list, sorted_x_y_y_pairs_list
+
+
+def pac_pricing(sorted_x_y_y_pairs_list_, clearing=None):
     """ trade matching according pay-as-clear pricing rule """
-    clearing_quantity, clearing_price, breakeven_index_k = clearing_quantity_calc(sorted_x_y_y_pairs_list_)
+    if clearing is None:
+        clearing = clearing_quantity_bisect(sorted_x_y_y_pairs_list_)
+    clearing_quantity, clearing_price, breakeven_index_k = clearing
 
     if clearing_quantity is None:
         method_logger.warning("No clearing quantity or price was found")
@@ -83,9 +140,11 @@ def pac_pricing(sorted_x_y_y_pairs_list_):
     return clearing_quantity, clearing_price, total_turnover_, trade_pairs_pac_
 
 
-def pab_pricing(sorted_x_y_y_pairs_list):
+def pab_pricing(sorted_x_y_y_pairs_list, clearing=None):
     """ trade matching according pay-as-bid pricing rule """
-    clearing_quantity, clearing_price, breakeven_index_k = clearing_quantity_calc(sorted_x_y_y_pairs_list)
+    if clearing is None:
+        clearing = clearing_quantity_bisect(sorted_x_y_y_pairs_list)
+    clearing_quantity, clearing_price, breakeven_index_k = clearing
 
     if clearing_quantity is None:
         return clearing_quantity, clearing_price, None, None
@@ -129,7 +188,7 @@ def pab_pricing(sorted_x_y_y_pairs_list):
     return clearing_quantity, average_clearing_price, total_turnover_, trade_pairs_pab_
 
 
-def mcafee_pricing(sorted_x_y_y_pairs_list):
+def mcafee_pricing(sorted_x_y_y_pairs_list, clearing=None):
 
     # # TEST sorted_x_y_y_pairs_list #
     # # [volume, bid price, offer price, buyer, seller]
@@ -141,7 +200,9 @@ def mcafee_pricing(sorted_x_y_y_pairs_list):
     #         [1.4, 3, 8, 1, 'Utility']
     #     ]
 
-    clearing_quantity, clearing_price, k = clearing_quantity_calc(sorted_x_y_y_pairs_list)
+    if clearing is None:
+        clearing = clearing_quantity_bisect(sorted_x_y_y_pairs_list)
+    clearing_quantity, clearing_price, k = clearing
 
     if clearing_quantity is None:
         return clearing_quantity, clearing_price, None, None
@@ -250,6 +311,51 @@ def mcafee_pricing(sorted_x_y_y_pairs_list):
     return clearing_quantity, clearing_price, total_turnover_, trade_pairs_mcafee_
 
 
+def clearing_quantity_bisect(sorted_x_y_y_pairs_list):
+    """ Same result as clearing_quantity_calc, but found by bisection in O(log n) without copying the list.
+
+        Relies on the structure of the merged curve: segments without bid or offer only occur at its tail, bid prices
+        are non-increasing and offer prices non-decreasing along it. Thus the segments where the bid price is lower
+        than the offer price form a contiguous block at the end of the complete segments.
+    """
+    # number of segments that have both a bid and an offer (points without one of them don't add information)
+    lower = 0
+    upper = len(sorted_x_y_y_pairs_list)
+    while lower < upper:
+        middle = (lower + upper) // 2
+        if sorted_x_y_y_pairs_list[middle][1] is None or sorted_x_y_y_pairs_list[middle][2] is None:
+            upper = middle
+        else:
+            lower = middle + 1
+    num_complete = lower
+
+    # number of segments in which the bid price is still higher than (or equal to) the offer price
+    lower = 0
+    upper = num_complete
+    while lower < upper:
+        middle = (lower + upper) // 2
+        if sorted_x_y_y_pairs_list[middle][1] < sorted_x_y_y_pairs_list[middle][2]:
+            upper = middle
+        else:
+            lower = middle + 1
+    num_executed = lower
+
+    if num_executed == 0:
+        # execute nothing: all bids prices are lower than offer prices
+        method_logger.info('nothing executed')
+        return None, None, None
+    elif num_executed == num_complete:
+        method_logger.info('fully executed')
+    else:
+        method_logger.info('partially executed')
+
+    # clearing quantity is the last executed quantity point, clearing price the bid price of that segment
+    break_even_index = num_executed - 1
+    clearing_quantity_ = sorted_x_y_y_pairs_list[break_even_index][0]
+    clearing_price_ = sorted_x_y_y_pairs_list[break_even_index][1]
+    return clearing_quantity_, clearing_price_, break_even_index
+
+
 def clearing_quantity_calc(sorted_x_y_y_pairs_list):
     """ This can be used both for PaC as for PaB, returns clearing quantity and uniform clearing price"""
     clearing_quantity_ = None
@@ -33,6 +33,11 @@ class Battery(Agent):
 
         """ Trading. """
         self.bidding_solver = "dummy"
+        # Define the number of steps the perfect foresight optimization should look in the future.
+        self.forecast_horizon = 5
+        # Optimized charging and costs of this step, if it was solved by the solver pool of the microgrid (see
+        # source/solver_pool.py).
+        self.pool_solution = None
         self.wallet = Wallet(_unique_id)
         self.trading_state = None
         # Bid in the format [price, quantity, self ID]
@@ -62,8 +67,9 @@ class Battery(Agent):
         self.time_in_use = 0
         # Total charge throughput Q [Ah].
         self.total_charge_throughput = 0
-        # Track the temperature of the different time steps [K].
-        self.temperature = []
+        # Running sum and number of the temperatures of the different time steps [K], for the average temperature.
+        self.temperature_sum = 0
+        self.temperature_count = 0
 
     def pre_auction_round(self):
         # Update the current time step.
@@ -78,122 +84,15 @@ class Battery(Agent):
         pass
 
     def update_bid(self):
-        # Define the number of steps the perfect foresight optimization should look in the future.
-        n_step = 5
+        n_step = self.forecast_horizon
 
         if self.bidding_solver == 'linprog':
-            """ Linear program """
-            # To derive the bid for this time step, a linear optimization (linprog) determines the optimal amount of
-            # electricity that should be stored or sold. The basis of the optimization is the grid electricity price and
-            # the storage charging and discharging efficiency.
-            #
-            # The optimization problem is formulated in the way:
-            # min  c * x
-            # s.t. A * x <= b
-            # x >= 0 and x < max. producible hydrogen
-            #
-            # Here, x is a vector with the amount of electricity charged and another set of x for the values of
-            # discharged energy, c is the estimated cost function for each time step (EEX spot marked costs are used),
-            # A * x <= b is used to make sure that the storage never goes below empty or above full.
-            # Number of time steps of the future used for the optimization.
-            #
-            # NOTE: Charging and discharging for each time step are two separated x values and they are referring to the
-            # energy bought or sold to the energy system. Hereby charging values are positive and discharging values are
-            # negative
-            # e.g. for 3 time steps the x vector looks like this:
-            # x = [x_1, x_2, x_3, x_4, x_5, x_6]
-            # The indices 1-3 are for charging (>= 0), the indices 4-6 are for discharging (<= 0).
-
-            from cvxopt import matrix, solvers
-            import numpy as np
-
-            # To be able to account for charging and discharging efficiencies, there are separated x values for charging
-            # and discharging. The cost values are set accordingly.
-            electricity_cost = self.model.data.utility_pricing_profile[self.current_step:self.current_step+n_step]
-            c_charge = electricity_cost[:] / self.charge_eff
-            c_discharge = electricity_cost[:] * self.discharge_eff
-            c = np.concatenate((c_charge, c_discharge))
-
-            # Using the inequality constraints first to make sure that the battery is never below empty or above full.
-            # Further it is made sure that charging speeds are not violated. A little example for three time steps
-            # forecast would look like this:
-            #
-            #               A           *x <=        b
-            #
-            #       [ C  0  0  0  0  0]       [Capacity_init - SoC_init]  \
-            #       [ C  C  0  D  0  0]       [Capacity_init - SoC_init]   |-> 1. Ensure storage is never above full
-            #       [ C  C  C  D  D  0]       [Capacity_init - SoC_init]  /
-            #       [ 0  0  0 -D  0  0]       [SoC_init]   |-> 2. Ensure storage is never below empty
-            #       [-C  0  0 -D -D  0]       [SoC_init]   |-> 2. Ensure storage is never below empty
-            #       [-C -C -C -D -D -D]       [0]          |-> 3. Ensure storage SoC at the end is not below SoC_init
-            #       [ C  0  0  0  0  0]       [C*cap_init*interval_time/60min]  \
-            #       [ 0  C  0  0  0  0]       [C*cap_init*interval_time/60min]   |-> 4. Ensure C rate charging
-            #       [ 0  0  C  0  0  0]       [C*cap_init*interval_time/60min]  /           not violated
-            #       [ 0  0  0 -D  0  0] *x <= [C*cap_init*interval_time/60min]  \
-            #       [ 0  0  0  0 -D  0]       [C*cap_init*interval_time/60min]   |-> 5. Ensure C rate discharging
-            #       [ 0  0  0  0  0 -D]       [C*cap_init*interval_time/60min]  /           not violated
-            #       [-C  0  0  0  0  0]       [0]  \
-            #       [ 0 -C  0  0  0  0]       [0]   |-> 6. Ensure charging value not below 0
-            #       [ 0  0 -C  0  0  0]       [0]  /
-            #       [ 0  0  0  D  0  0]       [0]  \
-            #       [ 0  0  0  0  D  0]       [0]   |-> 7. Ensure discharging value not above 0
-            #       [ 0  0  0  0  0  D]       [0]  /
-            #
-            #   C: Factor charging efficiency = self.charge_eff
-            #   D: Factor discharging efficiency = 1 / self.discharge_eff
-            #   x: Vector of charging and discharging for each time step (in this example 3 time steps):
-            #      x = [charge_ts1, charge_ts2, charge_ts3, discharge_ts1, discharge_ts2, discharge_ts3]
-
-            C = self.charge_eff
-            D = 1 / self.discharge_eff
-
-            # OK, so let's start and define A.
-            # 1. First ensure that the storage is never above full.
-            A = [[C] * (i + 1) + [0.0] * (n_step - i - 1) + [D] * i + [0.0] * (n_step - i)
-                 for i in range(n_step)]
-            # 2. Then ensure that the storage is never below empty.
-            A += [[-C] * i + [0.0] * (n_step - i) + [-D] * (i + 1) + [0.0] * (n_step - i - 1)
-                  for i in range(n_step-1)]
-            # 3. Then ensure that the state of charge at the end of the simulation is not below the initial SoC.
-            A += [[-C] * n_step + [-D] * n_step]
-            # 4. Then ensure that charging speed doesn't violate the c-rate constraint.
-            A += [[0.0] * i + [C] + [0.0] * (2 * n_step - i - 1) for i in range(n_step)]
-            # 5. Then ensure that discharging speed doesn't violate the c-rate constraint.
-            A += [[0.0] * (n_step + i) + [-D] + [0.0] * (n_step - i - 1) for i in range(n_step)]
-            # 6. Then ensure that charging cannot be negative.
-            A += [[0.0] * i + [-C] + [0.0] * (2 * n_step - i - 1) for i in range(n_step)]
-            # 7. Finally ensure that discharging cannot be positive.
-            A += [[0.0] * (n_step + i) + [D] + [0.0] * (n_step - i - 1) for i in range(n_step)]
-
-            # Now b can be defined.
-            # 1.
-            b = [self.capacity_init - self.stored_electricity] * n_step
-            # 2.
-            b += [self.stored_electricity] * (n_step - 1)
-            # 3.
-            b += [0]
-            # 4. & 5.
-            b += [self.c_rate * self.capacity_init * self.interval_time / 60] * n_step * 2
-            # 6. & 7.
-            b += [0] * n_step * 2
-
-            # Starting the optimization process.
-            # First bring c, A and b to the matrix format of the package cvxopt.
-            A = matrix(np.array(A).T.tolist())
-            b = matrix(b)
-            c = matrix(c)
-            # Silence the optimizer output.
-            solvers.options['show_progress'] = False
-            # Execute the optimization.
-            sol = solvers.lp(c, A, b)
-            print('Optimization finished: ')
-            # Add up charging and discharging to get the actual charging.
-            res = []
-            for i in range(n_step):
-                res.append(sol['x'][i] + sol['x'][i + n_step])
-
-            # print(res)
-            # Return the power value needed for the optimized production and the price [kW, EUR/kWh]
+            if self.pool_solution is not None:
+                # The optimization of this step was already solved by the solver pool.
+                [res, c] = self.pool_solution
+                self.pool_solution = None
+            else:
+                [res, c] = self.optimize_charging_linprog(n_step)
 
         elif self.bidding_solver == 'dummy':
             res = [10]
@@ -218,6 +117,133 @@ class Battery(Agent):
             self.offer = [[price, charging_power, self.id]]
             self.trading_state = "supplying"
 
+    def get_optimization_problem(self):
+        # Get the bidding optimization of this step as [function, arguments] for the solver pool of the microgrid (see
+        # source/solver_pool.py), or None if the bid of this step is derived without an optimization.
+        self.current_step = self.model.step_count
+        if self.bidding_solver != 'linprog':
+            return None
+        return [self.optimize_charging_linprog, [self.forecast_horizon]]
+
+    def set_optimization_solution(self, solution, solve_time):
+        # Keep the optimized charging and the costs for the next update_bid.
+        self.pool_solution = solution
+
+    def optimize_charging_linprog(self, n_step):
+        """ Linear program """
+        # To derive the bid for this time step, a linear optimization (linprog) determines the optimal amount of
+        # electricity that should be stored or sold. The basis of the optimization is the grid electricity price and
+        # the storage charging and discharging efficiency.
+        #
+        # The optimization problem is formulated in the way:
+        # min  c * x
+        # s.t. A * x <= b
+        # x >= 0 and x < max. producible hydrogen
+        #
+        # Here, x is a vector with the amount of electricity charged and another set of x for the values of
+        # discharged energy, c is the estimated cost function for each time step (EEX spot marked costs are used),
+        # A * x <= b is used to make sure that the storage never goes below empty or above full.
+        # Number of time steps of the future used for the optimization.
+        #
+        # NOTE: Charging and discharging for each time step are two separated x values and they are referring to the
+        # energy bought or sold to the energy system. Hereby charging values are positive and discharging values are
+        # negative
+        # e.g. for 3 time steps the x vector looks like this:
+        # x = [x_1, x_2, x_3, x_4, x_5, x_6]
+        # The indices 1-3 are for charging (>= 0), the indices 4-6 are for discharging (<= 0).
+
+        from cvxopt import matrix, solvers
+        import numpy as np
+
+        # To be able to account for charging and discharging efficiencies, there are separated x values for charging
+        # and discharging. The cost values are set accordingly.
+        electricity_cost = self.model.data.utility_pricing_profile[self.current_step:self.current_step+n_step]
+        c_charge = electricity_cost[:] / self.charge_eff
+        c_discharge = electricity_cost[:] * self.discharge_eff
+        c = np.concatenate((c_charge, c_discharge))
+
+        # Using the inequality constraints first to make sure that the battery is never below empty or above full.
+        # Further it is made sure that charging speeds are not violated. A little example for three time steps
+        # forecast would look like this:
+        #
+        #               A           *x <=        b
+        #
+        #       [ C  0  0  0  0  0]       [Capacity_init - SoC_init]  \
+        #       [ C  C  0  D  0  0]       [Capacity_init - SoC_init]   |-> 1. Ensure storage is never above full
+        #       [ C  C  C  D  D  0]       [Capacity_init - SoC_init]  /
+        #       [ 0  0  0 -D  0  0]       [SoC_init]   |-> 2. Ensure storage is never below empty
+        #       [-C  0  0 -D -D  0]       [SoC_init]   |-> 2. Ensure storage is never below empty
+        #       [-C -C -C -D -D -D]       [0]          |-> 3. Ensure storage SoC at the end is not below SoC_init
+        #       [ C  0  0  0  0  0]       [C*cap_init*interval_time/60min]  \
+        #       [ 0  C  0  0  0  0]       [C*cap_init*interval_time/60min]   |-> 4. Ensure C rate charging
+        #       [ 0  0  C  0  0  0]       [C*cap_init*interval_time/60min]  /           not violated
+        #       [ 0  0  0 -D  0  0] *x <= [C*cap_init*interval_time/60min]  \
+        #       [ 0  0  0  0 -D  0]       [C*cap_init*interval_time/60min]   |-> 5. Ensure C rate discharging
+        #       [ 0  0  0  0  0 -D]       [C*cap_init*interval_time/60min]  /           not violated
+        #       [-C  0  0  0  0  0]       [0]  \
+        #       [ 0 -C  0  0  0  0]       [0]   |-> 6. Ensure charging value not below 0
+        #       [ 0  0 -C  0  0  0]       [0]  /
+        #       [ 0  0  0  D  0  0]       [0]  \
+        #       [ 0  0  0  0  D  0]       [0]   |-> 7. Ensure discharging value not above 0
+        #       [ 0  0  0  0  0  D]       [0]  /
+        #
+        #   C: Factor charging efficiency = self.charge_eff
+        #   D: Factor discharging efficiency = 1 / self.discharge_eff
+        #   x: Vector of charging and discharging for each time step (in this example 3 time steps):
+        #      x = [charge_ts1, charge_ts2, charge_ts3, discharge_ts1, discharge_ts2, discharge_ts3]
+
+        C = self.charge_eff
+        D = 1 / self.discharge_eff
+
+        # OK, so let's start and define A.
+        # 1. First ensure that the storage is never above full.
+        A = [[C] * (i + 1) + [0.0] * (n_step - i - 1) + [D] * i + [0.0] * (n_step - i)
+             for i in range(n_step)]
+        # 2. Then ensure that the storage is never below empty.
+        A += [[-C] * i + [0.0] * (n_step - i) + [-D] * (i + 1) + [0.0] * (n_step - i - 1)
+              for i in range(n_step-1)]
+        # 3. Then ensure that the state of charge at the end of the simulation is not below the initial SoC.
+        A += [[-C] * n_step + [-D] * n_step]
+        # 4. Then ensure that charging speed doesn't violate the c-rate constraint.
+        A += [[0.0] * i + [C] + [0.0] * (2 * n_step - i - 1) for i in range(n_step)]
+        # 5. Then ensure that discharging speed doesn't violate the c-rate constraint.
+        A += [[0.0] * (n_step + i) + [-D] + [0.0] * (n_step - i - 1) for i in range(n_step)]
+        # 6. Then ensure that charging cannot be negative.
+        A += [[0.0] * i + [-C] + [0.0] * (2 * n_step - i - 1) for i in range(n_step)]
+        # 7. Finally ensure that discharging cannot be positive.
+        A += [[0.0] * (n_step + i) + [D] + [0.0] * (n_step - i - 1) for i in range(n_step)]
+
+        # Now b can be defined.
+        # 1.
+        b = [self.capacity_init - self.stored_electricity] * n_step
+        # 2.
+        b += [self.stored_electricity] * (n_step - 1)
+        # 3.
+        b += [0]
+        # 4. & 5.
+        b += [self.c_rate * self.capacity_init * self.interval_time / 60] * n_step * 2
+        # 6. & 7.
+        b += [0] * n_step * 2
+
+        # Starting the optimization process.
+        # First bring c, A and b to the matrix format of the package cvxopt.
+        A = matrix(np.array(A).T.tolist())
+        b = matrix(b)
+        c = matrix(c)
+        # Silence the optimizer output.
+        solvers.options['show_progress'] = False
+        # Execute the optimization.
+        sol = solvers.lp(c, A, b)
+        print('Optimization finished: ')
+        # Add up charging and discharging to get the actual charging.
+        res = []
+        for i in range(n_step):
+            res.append(sol['x'][i] + sol['x'][i + n_step])
+
+        # print(res)
+        # Return the power value needed for the optimized production and the price [kW, EUR/kWh]
+        return [res, c]
+
     def announce_bid(self):
         # If the electrolyzer is bidding on electricity, the bid is added to the bidding list.
         battery_log.info('Battery bidding state is {}'.format(self.trading_state))
@@ -237,7 +263,8 @@ class Battery(Agent):
         :param charging_energy: The amount of electricity received (pos) or distributed (neg) [kWh].
         :param temperature: The battery temperature [K]
         """
-        self.temperature.append(temperature)
+        self.temperature_sum += temperature
+        self.temperature_count += 1
         # Check if received energy is within physical limits, otherwise correct that value.
         [max_charge, max_discharge] = self.get_charging_limit()
         if charging_energy < -max_discharge:
@@ -312,7 +339,7 @@ class Battery(Agent):
             voltage = self.cell_voltage
 
         # Calculate the average temperature [K]
-        avg_temperature = sum(self.temperature) / len(self.temperature)
+        avg_temperature = self.temperature_sum / self.temperature_count
         # Value considering the aging by calendar.
         alpha = (7.543 * voltage - 23.75) * 10**6 * exp(-6976/avg_temperature)
         capacity_loss_aging = alpha * self.time_in_use ** 0.75
@@ -56,6 +56,10 @@ class Data(ConfigurationMixin, object):
             if self.num_households_with_ess > 0:
                 assert len(self.ess_list) == self.num_households_with_ess
             self.agent_data_array = self.fill_in_classification_array()
+            if self.ess_forecast_prefix_sums is True:
+                self.forecast_prefix_sums = self.fill_in_forecast_prefix_sums()
+            else:
+                self.forecast_prefix_sums = [[None, None]] * len(self.agent_data_array)
 
         else:
             data_log.error("data type not found")
@@ -67,8 +71,10 @@ class Data(ConfigurationMixin, object):
                 assert len(self.utility_pricing_profile) >= self.num_steps
                 self.utility_pricing_profile = np.asarray(self.utility_pricing_profile)
 
-                if self.negative_pricing is False:
-                    self.utility_pricing_profile[self.utility_pricing_profile < 0] = 0
+                if self.negative_pricing is False and (self.utility_pricing_profile < 0).any():
+                    # The profile may be a view on a shared one, it is only copied if there are prices to change.
+                    self.utility_pricing_profile = np.where(self.utility_pricing_profile < 0, 0,
+                                                            self.utility_pricing_profile)
             else:
                 self.utility_pricing_profile = []
 
@@ -82,6 +88,8 @@ class Data(ConfigurationMixin, object):
         self.clearing_quantity = np.zeros([self.num_steps, 1])
         self.utility_price = np.zeros([self.num_steps, 1])
         self.household_demand = np.zeros([self.num_steps, 1])
+        # Time needed by the solver pool to solve the optimizations of all storage agents of a step [s].
+        self.solver_pool_time = np.zeros(self.num_steps)
 
         # to be expanded after all agents are initialized
         self.agent_measurements = {}
@@ -94,8 +102,16 @@ class Data(ConfigurationMixin, object):
                 "bid_energy_over_time": np.zeros(self.num_steps),
                 "traded_volume_over_time": np.zeros(self.num_steps),
                 "revenue_over_time": np.zeros(self.num_steps),
+                # Time needed to solve the bidding optimization of the agent in the solver pool [s].
+                "solve_time_over_time": np.zeros(self.num_steps),
             }
 
+    def fill_solve_time(self, solve_time, pool_time):
+        # Track the solve time of each agent {agent ID: time [s]} and of the whole solver pool of this step [s].
+        for agent_id, agent_solve_time in solve_time.items():
+            self.agent_measurements[agent_id]["solve_time_over_time"][self.model.step_count] = agent_solve_time
+        self.solver_pool_time[self.model.step_count] = pool_time
+
     def fill_measurement_dict(self, agent_id):
 
         # self.model.data.agent_measurements[agent_id]["energy_surplus_over_time"][self.model.step_count] = \
@@ -132,7 +148,10 @@ class Data(ConfigurationMixin, object):
             load_list = np.ones([self.num_households, self.num_steps]) * 0.01
             return load_list
 
-        load_list = csv_read_load_file(self.num_households, self.household_loads_folder)
+        data_directory = path + '/data_load_profiles/' + self.household_loads_folder
+        load_list = [self.read_profile(('household_load', self.household_loads_folder, profile),
+                                       data_directory + '/' + profile, lambda: csv_load_file(data_directory, profile))
+                     for profile in household_load_profile_names(self.num_households, self.household_loads_folder)]
 
         """ load is in minutes, now convert to intervals """
         # TODO: add all consumption within 15 step interval to i interval element, instead of (naive) sampling
@@ -144,8 +163,14 @@ class Data(ConfigurationMixin, object):
         assert [len(load_list[i]) == self.num_steps for i in range(len(load_list))]
 
         """ manual tuning of data can happen here """
-        load_array = np.array(load_list)
-        load_array[np.isnan(load_array)] = 0
+        # Each household keeps its time series as read (e.g. a view on the one in the profile store), only time series
+        # with missing values are copied to set these to 0.
+        load_array = []
+        for load in load_list:
+            load = np.asarray(load, dtype=float)
+            if np.isnan(load).any():
+                load = np.where(np.isnan(load), 0, load)
+            load_array.append(self.read_only(load))
         # TODO: german consumption rates?
         # WHAT WAS HAPPENING HERE? LOAD PROFILES WERE TUNED, THIS SHOULDN'T HAPPEN????
         """
@@ -167,10 +192,12 @@ class Data(ConfigurationMixin, object):
         pv_gen_list = []
         if self.num_pv_panels > 0:
             # Case: There is PV present, thus the timeseries has to be loaded.
-            pv_gen_list = csv_read_pv_output_file(self.num_pv_panels, self.pv_output_profile)
-            # pv_gen_array = np.array(pv_gen_list)
-
-            pv_gen_list = self.slice_from_to(pv_gen_list)
+            # All panels use the same profile, it is read once into one array that all of them share.
+            pv_gen = self.read_profile(('pv_output', self.pv_output_profile),
+                                       path + '/pv_output_profiles/' + self.pv_output_profile,
+                                       lambda: csv_read_pv_output_file(1, self.pv_output_profile)[0])
+            pv_gen = self.read_only(np.asarray(self.slice_from_to(pv_gen), dtype=float))
+            pv_gen_list = [pv_gen] * self.num_pv_panels
             if self.num_pv_panels > 0:
                 # Case: PV panels are present. Then test if the pv time series have the correct length.
                 assert [len(pv_gen_list[i]) == self.num_steps for i in range(len(pv_gen_list))]
@@ -184,8 +211,10 @@ class Data(ConfigurationMixin, object):
         # Return only the values (second column of the matrix) [EUR/kWh].
         return [x[1] for x in electricity_price]
         """
-        utility_profile_dict = csv_read_utility_file(self.utility_profile)
-        utility_profile_dict = self.slice_from_to(utility_profile_dict, self.forecast_horizon)
+        utility_profile_dict = self.read_profile(('utility_price', self.utility_profile),
+                                                 path + '/utility_price_profiles/' + self.utility_profile,
+                                                 lambda: csv_read_utility_file(self.utility_profile))
+        utility_profile_dict = self.read_only(self.slice_from_to(utility_profile_dict, self.forecast_horizon))
         assert len(utility_profile_dict) == self.num_steps + self.forecast_horizon
 
 
@@ -200,15 +229,19 @@ class Data(ConfigurationMixin, object):
         # Return only the H2 load values of the matrix (second column) [kg].
         return [x[1] for x in h2_load]
         """
-        electrolyzer_list = csv_read_electrolyzer_profile(self.fuel_station_load)
-        electrolyzer_list = self.slice_from_to(electrolyzer_list, self.forecast_horizon)
+        electrolyzer_list = self.read_profile(('fuel_station_load', self.fuel_station_load),
+                                              path + '/electrolyzer_load_profiles/' + self.fuel_station_load,
+                                              lambda: csv_read_electrolyzer_profile(self.fuel_station_load))
+        electrolyzer_list = self.read_only(self.slice_from_to(electrolyzer_list, self.forecast_horizon))
         assert len(electrolyzer_list) == self.num_steps + self.forecast_horizon
 
         return electrolyzer_list
 
     def get_pv_commercial_profiles(self):
-        pv_commercial_list = csv_read_pv_profile(self.pv_commercial_profile)
-        pv_commercial_list = self.slice_from_to(pv_commercial_list, self.forecast_horizon)
+        pv_commercial_list = self.read_profile(('pv_commercial', self.pv_commercial_profile),
+                                               path + '/pv_output_profiles/' + self.pv_commercial_profile,
+                                               lambda: csv_read_pv_profile(self.pv_commercial_profile))
+        pv_commercial_list = self.read_only(self.slice_from_to(pv_commercial_list, self.forecast_horizon))
         assert len(pv_commercial_list) == self.num_steps + self.forecast_horizon
 
         return pv_commercial_list
@@ -228,12 +261,13 @@ class Data(ConfigurationMixin, object):
                 agent_data_array[agent][0] = None
 
             if self.classification_array[agent][1]:
-                agent_data_array[agent][1] = self.pv_gen_array[pv]
+                multiplier = 1
                 if type(self.classification_array[agent][1]) is not bool:
                     # If the classification value for PV for this household is not a boolean, it is treated as a
                     # multiplier for the PV time series.
                     multiplier = self.classification_array[agent][1]
-                    agent_data_array[agent][1] = [i * multiplier for i in agent_data_array[agent][1]]
+                # The household gets a view on the shared PV time series instead of a scaled copy of it.
+                agent_data_array[agent][1] = ScaledProfile(self.pv_gen_array[pv], multiplier)
                 pv += 1
             else:
                 agent_data_array[agent][1] = None
@@ -246,10 +280,67 @@ class Data(ConfigurationMixin, object):
 
         return agent_data_array
 
+    def fill_in_forecast_prefix_sums(self):
+        """ prefix sums [load, PV] of the time series of each household, None if it has no load or PV
+
+            The sum of a time series from step a to b (excluded) is prefix_sum[b] - prefix_sum[a], so the forecast of
+            the ESS strategy takes constant time for any horizon.
+        """
+        pv_prefix_sums = {}
+        forecast_prefix_sums = []
+        for agent in range(len(self.agent_data_array)):
+            load_data = self.agent_data_array[agent][0]
+            pv_data = self.agent_data_array[agent][1]
+
+            load_prefix_sum = None
+            if load_data is not None:
+                load_prefix_sum = np.concatenate(([0.0], np.cumsum(load_data)))
+
+            pv_prefix_sum = None
+            if pv_data is not None:
+                if isinstance(pv_data, ScaledProfile):
+                    # Households sharing a PV base time series share its prefix sum as well.
+                    if id(pv_data.base) not in pv_prefix_sums:
+                        pv_prefix_sums[id(pv_data.base)] = np.concatenate(([0.0], np.cumsum(pv_data.base)))
+                    pv_prefix_sum = ScaledProfile(pv_prefix_sums[id(pv_data.base)], pv_data.multiplier)
+                else:
+                    pv_prefix_sum = np.concatenate(([0.0], np.cumsum(pv_data)))
+
+            forecast_prefix_sums.append([load_prefix_sum, pv_prefix_sum])
+
+        return forecast_prefix_sums
+
+    def read_profile(self, key, csv_file, parse):
+        # Time series are taken from the profile store if one is configured. Otherwise (or if it is not in the store
+        # yet) parse reads the csv file, or its memory-mapped .npy binary if the profile cache is on.
+        def loader():
+            if self.profile_cache is True:
+                return npy_cached(csv_file, key[0], parse)
+            return parse()
+
+        if self.profile_store is None:
+            return loader()
+        return self.profile_store.get(key, loader)
+
+    @staticmethod
+    def read_only(file):
+        # Time series from the profile store or cache are (sliced) NumPy arrays, which all runs share. The agents get
+        # read-only views on them instead of copies, time series parsed from the csv files are left as they are.
+        if isinstance(file, np.ndarray):
+            # Memory-mapped arrays from the cache are viewed as plain arrays, like the ones from the profile store.
+            file = file.view(np.ndarray)
+            file.flags.writeable = False
+        elif type(file) == list and len(file) > 0 and isinstance(file[0], np.ndarray):
+            file = [Data.read_only(profile) for profile in file]
+        return file
+
     def slice_from_to(self, file, foresight_timeframe=0):
         # Slice the loaded timeseries to the needed length, which is the simulation time frame plus for some time series
         # the amount of time steps that are looked into with the optimization.
-        if type(file[0]) == list:
+        if isinstance(file, np.ndarray):
+            # Case: a single time series from the profile store or cache, slicing gives a view on it.
+            file = file[self.sim_start:self.sim_start + self.num_steps + foresight_timeframe]
+        elif type(file[0]) == list or isinstance(file[0], np.ndarray):
             # Case: the first list entry is also a list, thus we have multiple timeseries here.
             for profile in range(len(file)):
                 file[profile] = file[profile][self.sim_start:self.sim_start + self.num_steps + foresight_timeframe]
@@ -1,5 +1,6 @@
 import csv
 import os
+import tempfile
 import numpy as np
 
 import logging
@@ -10,6 +11,47 @@ data_methods_log = logging.getLogger('run_microgrid.data_methods')
 path = "./source" + "/profiles"
 #print(path)
 
+# Parsed time series are cached as .npy binaries in this folder.
+cache_path = path + "/.profile_cache"
+
+
+def npy_cached(csv_file, reader_name, parse):
+    """ returns the time series parse() reads from csv_file, memory-mapped from a .npy binary of it
+
+        The binary is created on first use and keyed by size and modification time of the csv file, so it is created
+        again if the csv file changes (binaries of older versions are left in the cache folder, other processes may
+        still use them). Only the pages of the slices that are actually used are read from disk. Several processes
+        (e.g. the runs of a sweep) can create the same binary at the same time, the first one in place is used.
+    """
+    if not os.path.exists(csv_file):
+        # Let the csv reader report the missing file.
+        return parse()
+
+    file_stat = os.stat(csv_file)
+    # The same csv file can be parsed differently (e.g. PV output with and without small values set to 0).
+    cache_name = reader_name + '_' + os.path.relpath(csv_file, path).replace(os.sep, '__').replace('/', '__')
+    cache_file = '{}/{}_{}_{}.npy'.format(cache_path, cache_name, file_stat.st_size, file_stat.st_mtime_ns)
+
+    if not os.path.exists(cache_file):
+        os.makedirs(cache_path, exist_ok=True)
+        data = np.asarray(parse(), dtype=float)
+        # Another process may have created the binary while this one parsed the csv file.
+        if not os.path.exists(cache_file):
+            # Write to a temporary file of this process first, so an interrupted write does not leave a broken binary
+            # and processes writing the same binary do not write into the same file. The rename is atomic.
+            file_descriptor, tmp_file = tempfile.mkstemp(dir=cache_path, prefix=cache_name + '_', suffix='.tmp')
+            try:
+                with os.fdopen(file_descriptor, 'wb') as npy_file:
+                    np.save(npy_file, data)
+                os.replace(tmp_file, cache_file)
+            except BaseException:
+                os.remove(tmp_file)
+                raise
+            data_methods_log.info("cached profile '%s' at '%s'" % (csv_file, cache_file))
+
+    return np.load(cache_file, mmap_mode='r')
+
+
 # def csv_read_load_profile(num_households_):
 #     data_dict = {}
 #     data_directory = "data_load_profiles"
@@ -31,6 +73,17 @@ def csv_load_file(data_directory, profile):
 def csv_read_load_file(num_households_with_load, household_loads_folder):
     data_list = []
     data_directory = path + '/data_load_profiles/' + household_loads_folder
+
+    for profile in household_load_profile_names(num_households_with_load, household_loads_folder):
+        data_array = csv_load_file(data_directory, profile)
+        data_list.append(data_array)
+
+    return data_list
+
+
+def household_load_profile_names(num_households_with_load, household_loads_folder):
+    # Names of the load profile files in the folder that are used for the households with load.
+    data_directory = path + '/data_load_profiles/' + household_loads_folder
     try:
         if household_loads_folder not in os.listdir(path + '/data_load_profiles'):
             data_methods_log.warning("household demand profile file '%s' not found" % household_loads_folder)
@@ -51,37 +104,51 @@ def csv_read_load_file(num_households_with_load, household_loads_folder):
             profiles_to_use.append(load_profiles[i_profile_used])
             i_profile_used += 1
 
-    for profile in profiles_to_use:
-        data_array = csv_load_file(data_directory, profile)
-        data_list.append(data_array)
-
-    return data_list
+    return profiles_to_use
 
 
 def csv_read_pv_output_file(num_pv_panels, pv_output_profile):
-    data_list = []
     data_directory = path + '/pv_output_profiles'
 
     if pv_output_profile not in os.listdir(data_directory):
         data_methods_log.warning("pv file '%s' not found" % pv_output_profile)
         exit()
 
-    i = 0
-    while i < num_pv_panels:
-        for profile in os.listdir(data_directory):
-            data_array = []
-            if profile == pv_output_profile and profile.endswith(".csv"):
-                with open(data_directory + '/' + profile) as csv_file:
-                    data_file = csv.reader(csv_file, delimiter=',')
-                    for row in data_file:
-                        if float(row[1]) < 0.000001:
-                            row[1] = 0
-                        data_array.append(float(row[1]))
+    # All panels use the same profile, thus it is only parsed once.
+    data_array = []
+    with open(data_directory + '/' + pv_output_profile) as csv_file:
+        data_file = csv.reader(csv_file, delimiter=',')
+        for row in data_file:
+            if float(row[1]) < 0.000001:
+                row[1] = 0
+            data_array.append(float(row[1]))
 
-                data_list.append(data_array)
-                i += 1
+    return [data_array] * num_pv_panels
 
-    return data_list
+
+class ScaledProfile(object):
+    """ read-only view of a time series scaled by a multiplier, e.g. the PV generation of one household
+
+        Many households share one base array, the multiplier is only applied to the values that are read. Indexing
+        returns a float, slicing a list, like the list of scaled values it replaces.
+    """
+    def __init__(self, base, multiplier=1):
+        self.base = base
+        self.multiplier = multiplier
+
+    def __len__(self):
+        return len(self.base)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return (self.base[index] * self.multiplier).tolist()
+        return float(self.base[index] * self.multiplier)
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def tolist(self):
+        return (self.base * self.multiplier).tolist()
 
 
 def csv_read_utility_file(selected_utility_price_profile):
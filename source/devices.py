@@ -1,3 +1,4 @@
+from collections import deque
 from math import exp
 from source.devices_methods import *
 
@@ -34,9 +35,11 @@ class ESS(object):
         self.this_step_energy_balance = None
 
         """ SOC forecasting """
-        self.horizon = self.agent.data.horizon
-        self.production_horizon = 0
-        self.load_horizon = 0
+        # An optional third ESS characteristic is the forecast horizon of this household [steps].
+        self.horizon = ess_data[2] if len(ess_data) > 2 else self.agent.data.horizon
+        # Prefix sums of the load and PV time series of this house, None if they are not used (see
+        # Data.fill_in_forecast_prefix_sums).
+        self.load_prefix_sum, self.production_prefix_sum = self.agent.data.forecast_prefix_sums[self.agent.id]
 
         """ Physics """
         # Charging and discharging efficiency (0 -> 0 %, 1 -> 100 %).
@@ -54,8 +57,13 @@ class ESS(object):
         self.time_in_use = 0
         # Total charge throughput Q [Ah].
         self.total_charge_throughput = 0
-        # Track the temperature of the different time steps [K].
-        self.temperature = []
+        # Running sum and number of the temperatures of the different time steps [K], for the average temperature.
+        self.temperature_sum = 0
+        self.temperature_count = 0
+        # History of the last temperatures [K], if the config keeps one (see ess_temperature_history).
+        self.temperature = None
+        if self.agent.data.ess_temperature_history > 0:
+            self.temperature = deque(maxlen=self.agent.data.ess_temperature_history)
 
         # charging limits
         self.max_in = None
@@ -66,6 +74,10 @@ class ESS(object):
         """ ask an update from all devices within the information sphere
             (this is of course, all devices within the same house """
 
+        if self.agent.fleet is not None:
+            # The fleet already has the sum of load and generation of this house for the current step.
+            return self.agent.fleet.surplus_on_step[self.agent.fleet_index]
+
         current_step = self.agent.model.step_count
         device_log.info('devices list of household %d:' % self.agent.id, self.agent.devices)
 
@@ -123,7 +135,7 @@ class ESS(object):
             voltage = self.cell_voltage
 
         # Calculate the average temperature [K]
-        avg_temperature = sum(self.temperature) / len(self.temperature)
+        avg_temperature = self.temperature_sum / self.temperature_count
         # Value considering the aging by calendar.
         alpha = (7.543 * voltage - 23.75) * 10**6 * exp(-6976/avg_temperature)
         capacity_loss_aging = alpha * self.time_in_use ** 0.75
@@ -135,6 +147,26 @@ class ESS(object):
         # Return relative capacity loss (1 is 100% loss).
         return capacity_loss_rel
 
+    def update_aging(self):
+        """ updates the capacity by aging and the time the battery was used, once per step """
+        # Update the capacity due to aging [kWh].
+        capacity_loss_rel = self.get_capacity_loss_by_aging()
+        self.max_capacity = (1 - capacity_loss_rel) * self.max_capacity_init
+
+        if self.soc_actual > self.max_capacity:
+            self.soc_actual = self.max_capacity
+
+        # Update the time the battery was used [d].
+        self.time_in_use += self.agent.data.market_interval / 60 / 24
+        device_log.info("Battery states updated. Capacity loss due to aging is {} kWh.".format(capacity_loss_rel))
+
+    def track_temperature(self, temperature):
+        # Add the temperature of this step [K] to the running average (and the history).
+        self.temperature_sum += temperature
+        self.temperature_count += 1
+        if self.temperature is not None:
+            self.temperature.append(temperature)
+
     @staticmethod
     def get_ess_temperature(self, temperature=273.15+10):
         """ here ESS temperature model can go """
@@ -149,7 +181,7 @@ class ESS(object):
         """
         # Getting the temperature [K].
         temperature = self.get_ess_temperature(self)
-        self.temperature.append(temperature)
+        self.track_temperature(temperature)
         [max_charge, max_discharge] = self.get_charging_limit()
 
         if energy_influx < -max_discharge:
@@ -214,16 +246,9 @@ class ESS(object):
         """ Aging of battery """
         # calculate total charge throughput Q
         self.total_charge_throughput += abs(self.cell_capacity * rel_throughput)
-        # Update the capacity due to aging [kWh].
-        capacity_loss_rel = self.get_capacity_loss_by_aging()
-        self.max_capacity = (1 - capacity_loss_rel) * self.max_capacity_init
-
-        if self.soc_actual > self.max_capacity:
-            self.soc_actual = self.max_capacity
-
-        # Update the time the battery was used [d].
-        self.time_in_use += self.agent.data.market_interval / 60 / 24
-        device_log.info("Battery states updated. Capacity loss due to aging is {} kWh.".format(capacity_loss_rel))
+        if self.agent.data.battery_aging != 'on':
+            self.update_aging()
+        # Otherwise all ESS are aged at once after the post-auction round (see update_ess_aging).
 
         self.agent.data.soc_list_over_time[self.agent.id][self.agent.model.step_count] = self.soc_actual
 
@@ -252,20 +277,32 @@ class ESS(object):
         count = self.agent.model.step_count
         """ 'Estimate' the coming X hours of load and production forecast """
 
+        # With prefix sums, the sums over the horizon are differences of them, which are independent of the horizon
+        # length (but not exactly equal to the sums over the horizon).
         if self.agent.has_load is True:
             max_horizon = min(len(self.agent.load_data), count + self.horizon)
-            self.load_horizon = self.agent.load_data[count: max_horizon]
+            if self.load_prefix_sum is None:
+                load_horizon_sum = sum(self.agent.load_data[count: max_horizon])
+            else:
+                load_horizon_sum = self.load_prefix_sum[max_horizon] - self.load_prefix_sum[count]
+            load_now = self.agent.load_data[count]
         else:
-            self.load_horizon = [0]
+            load_horizon_sum = 0
+            load_now = 0
 
         if self.agent.has_pv is True:
             max_horizon = min(len(self.agent.pv_data), count + self.horizon)
-            self.production_horizon = self.agent.pv_data[count: max_horizon]
+            if self.production_prefix_sum is None:
+                production_horizon_sum = sum(self.agent.pv_data[count: max_horizon])
+            else:
+                production_horizon_sum = self.production_prefix_sum[max_horizon] - self.production_prefix_sum[count]
+            production_now = self.agent.pv_data[count]
         else:
-            self.production_horizon = [0]
+            production_horizon_sum = 0
+            production_now = 0
 
-        self.soc_preferred = sum(self.load_horizon) - sum(self.production_horizon)
-        self.soc_essential = max(0, self.load_horizon[0] - self.production_horizon[0])
+        self.soc_preferred = load_horizon_sum - production_horizon_sum
+        self.soc_essential = max(0, load_now - production_now)
 
         if self.soc_preferred is None:
             self.soc_preferred = 0
@@ -278,6 +315,27 @@ class ESS(object):
         return
 
 
+def update_ess_aging(ess_devices):
+    """ updates the capacity by aging and the time in use of all ESS at once, as ESS.update_aging does for one """
+    if len(ess_devices) == 0:
+        return
+    capacity_loss_rel = ess_capacity_loss_by_aging_array(
+        [ess.cell_voltage for ess in ess_devices],
+        [ess.temperature_sum / ess.temperature_count for ess in ess_devices],
+        [ess.time_in_use for ess in ess_devices],
+        [ess.total_charge_throughput for ess in ess_devices],
+        [ess.delta_dod for ess in ess_devices])
+    max_capacity = (1 - capacity_loss_rel) * np.array([ess.max_capacity_init for ess in ess_devices])
+    soc_actual = np.minimum([ess.soc_actual for ess in ess_devices], max_capacity)
+
+    for ess, this_max_capacity, this_soc in zip(ess_devices, max_capacity.tolist(), soc_actual.tolist()):
+        ess.max_capacity = this_max_capacity
+        ess.soc_actual = this_soc
+        ess.time_in_use += ess.agent.data.market_interval / 60 / 24
+        ess.agent.data.soc_list_over_time[ess.agent.id][ess.agent.model.step_count] = this_soc
+    device_log.info("Battery states of %d ESS updated.", len(ess_devices))
+
+
 class PVPanel(object):
     def __init__(self, agent, pv_data):
         """PVPanel device"""
@@ -1,4 +1,5 @@
 import math
+import numpy as np
 
 
 def ely_voltage_u_act(ely, cur_dens, temp):
@@ -78,6 +79,110 @@ def ely_voltage_u_rev(ely, temp):
     return voltage_reversible
 
 
+def ely_voltage_u_act_array(ely, cur_dens, temp):
+    # ely_voltage_u_act for arrays of current densities [A/cm²] and temperatures [K] (broadcast against each other).
+    cur_dens = np.asarray(cur_dens, dtype=float)
+    temp = np.asarray(temp, dtype=float)
+    # The "alpha" values are valid for Ni - based electrodes.
+    alpha_a = 0.0675 + 0.00095 * temp
+    alpha_c = 0.1175 + 0.00095 * temp
+    log_cur_dens = np.log10(cur_dens / ely.fitting_value_exchange_current_density)
+    # The two parts of the activation voltage [V].
+    u_act_a = 2.306 * (ely.gas_const * temp) / (ely.n * ely.faraday * alpha_a) * log_cur_dens
+    u_act_c = 2.306 * (ely.gas_const * temp) / (ely.n * ely.faraday * alpha_c) * log_cur_dens
+    return u_act_a + u_act_c
+
+
+def ely_voltage_u_ohm_array(ely, cur_dens, temp):
+    # ely_voltage_u_ohm for arrays of current densities [A/cm²] and temperatures [K] (broadcast against each other).
+    cur_dens = np.asarray(cur_dens, dtype=float)
+    temp = np.asarray(temp, dtype=float)
+    electrolyte_thickness = ely.fitting_value_electrolyte_thickness
+    # The conductivity of the the potassium hydroxide (KOH) solution [1/(Ohm*cm)].
+    conductivity_electrolyte = -2.041 * ely.molarity_KOH - 0.0028 * ely.molarity_KOH**2 + 0.001043 * \
+                                ely.molarity_KOH**3 + 0.005332 * ely.molarity_KOH * temp + 207.2 * \
+                                ely.molarity_KOH / temp - 0.0000003 * ely.molarity_KOH**2 * temp**2
+    # Void fraction of the electrolyte [-].
+    epsilon = 0.023 * 2/3 * (cur_dens * 10**4)**0.3
+    # Total ohmic resistance of the electrolyte and of bubbles and other effects [Ohm*cm²].
+    resistance_total = electrolyte_thickness / conductivity_electrolyte + \
+        electrolyte_thickness / ((1 - epsilon)**1.5 * conductivity_electrolyte)
+    return resistance_total * cur_dens
+
+
+def ely_voltage_u_rev_array(ely, temp):
+    # ely_voltage_u_rev for an array of temperatures [K].
+    temp = np.asarray(temp, dtype=float)
+    # Coefficients for the vapor pressure of the KOH solution.
+    c1 = -0.0151 * ely.molality_KOH - 1.6788e-03 * ely.molarity_KOH**2 + 2.2588e-05 * ely.molality_KOH**3
+    c2 = 1.0 - 1.2062e-03 * ely.molality_KOH + 5.6024e-04 * ely.molality_KOH**2 - 7.8228e-06 * ely.molality_KOH**3
+    # The part of the reversible cell voltage that changes due to temperature [V].
+    voltage_temperature = 1.5184 - 1.5421e-03 * temp + 9.526e-05 * temp * np.log(temp) + 9.84e-08 * temp**2
+    # Vapor pressure of water and of the KOH solution [bar] and the water activity.
+    pressure_water = np.exp(81.6179 - 7699.68 / temp - 10.9 * np.log(temp) + 9.5891e-03 * temp)
+    pressure_koh = np.exp(2.302 * c1 + c2 * np.log(pressure_water))
+    water_activity = np.exp(-0.05192 * ely.molality_KOH + 0.003302 * ely.molality_KOH**2 + (3.177 * ely.molality_KOH -
+                            2.131 * ely.molality_KOH**2) / temp)
+    # The part of the reversible cell voltage that changes due to pressure [V].
+    voltage_pressure = ely.gas_const * temp / (ely.n * ely.faraday) * np.log((ely.pressure - pressure_koh) *
+                       (ely.pressure - pressure_koh)**0.5 / water_activity)
+    return voltage_temperature + voltage_pressure
+
+
+def ely_cell_voltage_array(ely, cur_dens, temp):
+    # Cell voltage (u_rev + u_act + u_ohm) [V] for arrays of current densities [A/cm²] and temperatures [K], e.g. a
+    # current density column and a temperature row give the U-I curves of all temperatures in one call.
+    return ely_voltage_u_rev_array(ely, temp) + ely_voltage_u_act_array(ely, cur_dens, temp) + \
+        ely_voltage_u_ohm_array(ely, cur_dens, temp)
+
+
+def ely_voltage_derivative(ely, cur_dens, temp):
+    # Derivative of the cell voltage (u_act + u_ohm, u_rev does not depend on the current density) with respect to the
+    # current density [V/(A/cm²)].
+
+    # The "alpha" values are valid for Ni - based electrodes.
+    alpha_a = 0.0675 + 0.00095 * temp
+    alpha_c = 0.1175 + 0.00095 * temp
+    # u_act is linear in log10(cur_dens).
+    d_u_act = 2.306 * (ely.gas_const * temp) / (ely.n * ely.faraday) * (1 / alpha_a + 1 / alpha_c) / \
+        (cur_dens * math.log(10))
+
+    conductivity_electrolyte = -2.041 * ely.molarity_KOH - 0.0028 * ely.molarity_KOH**2 + 0.001043 * \
+                                ely.molarity_KOH**3 + 0.005332 * ely.molarity_KOH * temp + 207.2 * \
+                                ely.molarity_KOH / temp - 0.0000003 * ely.molarity_KOH**2 * temp**2
+    # Void fraction of the electrolyte [-], it rises with cur_dens^0.3.
+    epsilon = 0.023 * 2/3 * (cur_dens * 10**4)**0.3
+    # u_ohm = thickness / conductivity * (1 + (1 - epsilon)^-1.5) * cur_dens
+    d_u_ohm = ely.fitting_value_electrolyte_thickness / conductivity_electrolyte * \
+        (1 + (1 - epsilon)**-1.5 + 0.45 * epsilon * (1 - epsilon)**-2.5)
+
+    return d_u_act + d_u_ohm
+
+
+def get_cur_dens_newton(ely, power, temp, cur_dens_start, relative_error=1e-5, max_iterations=50):
+    """ solves (u_rev + u_act + u_ohm) * cur_dens * area_cell * z_cell = power [kW] for the current density by Newton's
+        method, starting at cur_dens_start (e.g. the current density of the last step)
+
+        Returns [current density, cell voltage, number of iterations], the current density is None if the power
+        deviation did not get below relative_error [kW] within max_iterations.
+    """
+    # Stack power per current density and cell voltage [kW/(A/cm² * V)].
+    power_factor = ely.area_cell * ely.z_cell / 1000
+    v_rev = ely_voltage_u_rev(ely, temp)
+    cur_dens = cur_dens_start
+    for iteration in range(1, max_iterations + 1):
+        cell_voltage = v_rev + ely_voltage_u_act(ely, cur_dens, temp) + ely_voltage_u_ohm(ely, cur_dens, temp)
+        power_deviation = cell_voltage * cur_dens * power_factor - power
+        if abs(power_deviation) <= relative_error:
+            return [cur_dens, cell_voltage, iteration]
+        derivative = power_factor * (cell_voltage + cur_dens * ely_voltage_derivative(ely, cur_dens, temp))
+        cur_dens_next = cur_dens - power_deviation / derivative
+        # At very low powers a Newton step can overshoot below zero, where u_act is not defined.
+        cur_dens = cur_dens_next if cur_dens_next > 0 else cur_dens / 2
+
+    return [None, None, max_iterations]
+
+
 def cell_temp(self):
     # Constant factor for temperature rise/ drop within 2.5 hours until end value.
     a = 0.0007
@@ -106,6 +211,25 @@ def cell_temp(self):
 
 def get_v_i(self):
     relative_error = 1e-5
+    # Solve with Newton's method, warm started at the current density of the last step. If it does not converge, the
+    # fixed point iteration below is used.
+    if self.power > 0:
+        cur_dens_start = self.cur_dens if self.cur_dens > 0 else \
+            (self.power * self.eta_ely * 2 * self.faraday) / (self.area_cell * self.z_cell * self.molarity *
+                                                              self.upp_heat_val)
+        [cur_dens, cell_voltage, iterations] = get_cur_dens_newton(self, self.power, self.temp, cur_dens_start,
+                                                                   relative_error)
+        if getattr(self, 'solver_stats', None) is not None:
+            self.solver_stats['calls'] += 1
+            self.solver_stats['iterations'] += iterations
+            self.solver_stats['converged'] += cur_dens is not None
+        if cur_dens is not None:
+            self.voltage = cell_voltage * self.z_cell
+            self.current = cur_dens * self.area_cell
+            self.cur_dens = cur_dens
+            self.power = self.voltage * self.current / 1000
+            return
+
     power_iteration = 0
     voltage_iteration = 0
     this_temp = self.temp
@@ -136,3 +260,16 @@ def get_v_i(self):
     self.power = power_iteration
 
 
+
+
+def ess_capacity_loss_by_aging_array(voltage, avg_temperature, time_in_use, total_charge_throughput, delta_dod):
+    # ESS.get_capacity_loss_by_aging for arrays of batteries: cell voltages [V], average temperatures [K], times in use
+    # [d], total charge throughputs [Ah] and delta DODs. Returns the relative capacity loss (1 is 100% loss).
+    voltage = np.asarray(voltage, dtype=float)
+    # Value considering the aging by calendar.
+    alpha = (7.543 * voltage - 23.75) * 10**6 * np.exp(-6976 / np.asarray(avg_temperature, dtype=float))
+    capacity_loss_aging = alpha * np.asarray(time_in_use, dtype=float) ** 0.75
+    # Value to consider the aging by cycle.
+    beta = 7.348 * 10**-3 * (voltage - 3.667)**2 + 7.6 * 10**-4 + 4.081 * 10**-3 * np.asarray(delta_dod, dtype=float)
+    capacity_loss_charge = beta * np.asarray(total_charge_throughput, dtype=float)**0.5
+    return capacity_loss_aging + capacity_loss_charge
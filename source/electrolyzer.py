@@ -1,12 +1,20 @@
 import math
+import time
 import warnings
 from mesa import Agent
 from source.wallet import Wallet
+from source.devices_methods import get_cur_dens_newton, ely_cell_voltage_array
+from source.electrolyzer_methods import cheapest_hours_production
 import logging
 import numpy as np
 from scipy.optimize import linprog as lp
+from scipy import sparse
+from scipy.interpolate import CubicSpline, RectBivariateSpline
 electrolyzer_log = logging.getLogger("electrolyzer")
 
+# Polarization curve lookup tables, per parameter set (see Electrolyzer.build_lookup_tables).
+lookup_table_cache = {}
+
 
 class Electrolyzer(Agent):
     """ Electrolyzer agents are created through this class """
@@ -27,11 +35,15 @@ class Electrolyzer(Agent):
         self.track_bought_energy = []
         self.track_produced_hydrogen = []
         self.track_stored_hydrogen = []
+        # Log of the steps the electrolyzer was switched on or off, in the format [step, 'on' or 'off'].
+        self.track_on_off_events = []
+        self.is_on = False
 
         """ Trading. """
         # Different methods can be chosen for deriving the bidding of the electrolyzer. Options are 'linprog' and
         # 'quadprog'. Quadprog by now seems to be the superior method in regard to result and computation time.
-        # 'stepwise' uses a stepwise bid
+        # 'greedy' solves the linprog problem directly, by producing in the cheapest steps (see
+        # cheapest_hours_production). 'stepwise' uses a stepwise bid
         self.bidding_solver = 'stepwise'
         # If stepwise bidding is chosen, prices are distributed equally over 4 bedding prices [EUR/kWh].
         self.stepwise_bid_price = [0.2, 0.16, 0.12, 0.08]
@@ -39,6 +51,28 @@ class Electrolyzer(Agent):
         # In case a forecast based bidding strategy is chosen, define how many time steps the method is supposed to look
         # in the future [steps].
         self.forecast_horizon = self.model.data.forecast_horizon
+        # The constraint matrices of the linprog and quadprog bidding only depend on the horizon, they are built once
+        # per solver and horizon length (see get_constraint_matrices).
+        self.constraint_matrices = {}
+        # In receding horizon mode (for linprog, quadprog and greedy), the production optimized for the horizon is
+        # followed in the next steps and only optimized again every replan_interval steps, or earlier if a price of the
+        # forecast deviates more than replan_price_deviation [EUR/kWh] or the H2 demand forecast or the stored hydrogen
+        # deviate more than replan_mass_deviation [kg] from the plan. The quadprog optimization is warm started at the
+        # plan.
+        self.receding_horizon = False
+        self.replan_interval = 96
+        self.replan_price_deviation = 0.001
+        self.replan_mass_deviation = 0.1
+        self.plan = None
+        # If the plan does not buy electricity in the next steps, the electrolyzer is advanced over all of them in the
+        # first one (see advance_idle) and neither bids nor optimizes in the others: [first step, number of steps].
+        self.idle_run = None
+        # Optimized production and solve time [kg, s] of this step, if it was solved by the solver pool of the microgrid
+        # (see source/solver_pool.py).
+        self.pool_solution = None
+        # Track the time needed to derive the linprog/quadprog/greedy bid [s] and whether the optimization was run.
+        self.track_solve_time = []
+        self.track_bidding_solved = []
         self.wallet = Wallet(_unique_id)
         self.trading_state = None
         # Bid in the format [price, quantity, self ID]
@@ -116,24 +150,67 @@ class Electrolyzer(Agent):
         self.max_production_per_step = self.cur_dens_max * self.area_cell * self.interval_time * 60 * self.z_cell / \
             (2 * self.faraday) * self.molarity / 1000
 
+        # Factor by which the temperature difference to the aimed temperature decays in one time step. The exponent
+        # (-t[s]/2310) was parameterized such that the 98 % of the temperature change are reached after 2.5 hours.
+        self.cooling_factor = math.exp(-self.interval_time*60 / 2310)
+
         # saves last value of current density
         self.cur_dens_before = self.cur_dens
         # saves last temperature value
         self.temp_before = self.temp
 
+        """ Physics model. """
+        # The cell voltage for a given power can be derived by the 'iterative' solver, which evaluates the voltage
+        # equations until the power deviation is below 1e-5 kW, or by 'lookup_table', which interpolates tables of the
+        # polarization curve that are computed once per parameter set (see build_lookup_tables). The tables are faster,
+        # but the states derived from them deviate from the iterative ones (cell voltage by less than 1e-7 V, power by
+        # less than 5e-6 kW), which changes the results of a run slightly. The model can be changed at any time.
+        self.physics_model = 'iterative'
+        # Range of the tables: current density [A/cm^2] (log spaced) and temperature [K]. Outside of it (e.g. when more
+        # electricity was bought than the electrolyzer can use) the iterative solver is used.
+        self.lookup_cur_dens_range = [1e-4, 1.25 * self.cur_dens_max]
+        self.lookup_temp_range = [self.temp_min, self.temp_max]
+        # Number of grid points of the tables (current density, temperature).
+        self.lookup_grid_size = [240, 61]
+        # The tables are built on first use (see get_lookup_tables).
+        self.lookup_tables = None
+        # The iterative solver is either 'fixed_point' (started at an estimate by the system efficiency) or 'newton'
+        # (started at the current density of the last step). Newton's method needs fewer voltage evaluations, but it
+        # stops at a slightly different state within the power tolerance of 1e-5 kW, which changes the results of a
+        # run slightly. If Newton's method does not converge, the fixed point iteration is used.
+        self.iterative_solver = 'fixed_point'
+        # Counters for profiling: power states derived from the lookup tables, calls of the iterative solver, its
+        # iterations (voltage evaluations) and the calls in which the chosen solver converged.
+        self.solver_stats = {'lookups': 0, 'calls': 0, 'iterations': 0, 'converged': 0}
+
         electrolyzer_log.info("Electrolyzer object was generated.")
 
     def pre_auction_round(self):
         # Update the current time step.
         self.current_step = self.model.step_count
+        if self.in_idle_run():
+            # The electrolyzer was already advanced over this step, it does not bid.
+            self.track_bidding_solved.append(False)
+            self.track_solve_time.append(0.0)
+            return
 
         # Get the new bid.
         self.update_bid()
         self.announce_bid()
 
     def post_auction_round(self):
+        if self.idle_run is not None and self.current_step == self.idle_run[0]:
+            # Nothing is bought in the steps of the idle run, thus they are advanced at once.
+            self.advance_idle(self.idle_run[1])
+            return
+        if self.in_idle_run():
+            return
         # This energy bought [kWh].
         energy_bought = sum(self.model.auction.who_gets_what_dict[self.id])
+        if energy_bought == 0:
+            # Without power, the electrolyzer only cools down and the storage is depleted by the demand.
+            self.advance_idle()
+            return
         self.track_bought_energy.append(energy_bought)
         # Before the auction the physical states are renewed.
         self.update_power(energy_bought)
@@ -142,6 +219,58 @@ class Electrolyzer(Agent):
         #     self.model.data.utility_pricing_profile[self.current_step]
         # Update the stored mass hydrogen.
         self.update_storage()
+        self.track_on_off()
+
+    def advance_idle(self, num_steps=1):
+        # Advance the electrolyzer by num_steps steps from the current one, in which no electricity is bought: without
+        # power there is nothing to solve, the temperature decays towards the min. temperature by Newton's law of
+        # cooling (see get_cell_temp) and the demand is taken from the storage until it is empty. The current step is
+        # not changed.
+        self.power = 0
+        self.voltage = 0
+        self.current = 0
+        self.cur_dens = 0
+        if self.is_on:
+            self.track_on_off()
+
+        if num_steps > 1:
+            # Closed form over all steps: the temperature difference decays by the cooling factor in each step.
+            self.temp = self.temp_min + (self.temp - self.temp_min) * self.cooling_factor ** num_steps
+            mass_demanded = [float(x) for x in self.h2_demand[self.current_step:self.current_step + num_steps]]
+            stored_hydrogen = self.stored_hydrogen - np.cumsum(mass_demanded)
+            if stored_hydrogen[-1] < 0:
+                # The storage runs empty, the demand exceeding the stored hydrogen is not fulfilled.
+                self.demand_not_fulfilled += abs(stored_hydrogen[-1])
+                stored_hydrogen = np.maximum(stored_hydrogen, 0)
+            self.stored_hydrogen = float(stored_hydrogen[-1])
+            # Track values.
+            self.track_bought_energy += [0] * num_steps
+            self.track_stored_hydrogen += stored_hydrogen.tolist()
+            self.track_produced_hydrogen += [0.0] * num_steps
+            self.track_demand += mass_demanded
+            return
+
+        self.temp = self.temp_min + (self.temp - self.temp_min) * self.cooling_factor
+        mass_demanded = float(self.h2_demand[self.current_step])
+        self.stored_hydrogen -= mass_demanded
+        if self.stored_hydrogen < 0:
+            self.demand_not_fulfilled += abs(self.stored_hydrogen)
+            self.stored_hydrogen = 0
+        # Track values.
+        self.track_bought_energy.append(0)
+        self.track_stored_hydrogen.append(self.stored_hydrogen)
+        self.track_produced_hydrogen.append(0.0)
+        self.track_demand.append(mass_demanded)
+
+    def in_idle_run(self):
+        # Check if the current step is a later step of the idle run, which the electrolyzer was already advanced over.
+        return self.idle_run is not None and self.idle_run[0] < self.current_step < sum(self.idle_run)
+
+    def track_on_off(self):
+        # Log if the electrolyzer was switched on or off in this step.
+        if (self.power > 0) != self.is_on:
+            self.is_on = self.power > 0
+            self.track_on_off_events.append([self.current_step, 'on' if self.is_on else 'off'])
 
     def update_storage(self):
         # Update the mass of the hydrogen stored.
@@ -211,139 +340,23 @@ class Electrolyzer(Agent):
         # Define the number of steps the perfect foresight optimization should look in the future.
         n_step = self.forecast_horizon
 
-        if self.bidding_solver == "linprog":
-            """ Linear program """
-
-            # To derive the bid for this time step, a linear optimization (linprog) determines the optimal amount of
-            # hydrogen that should be produced depending on the electricity price and the demand for the next ?2 weeks?.
-            # This requires perfect foresight and in order to formulate a linear optimization problem, the temperature
-            # dependent electrolyzer efficiency is not taken into account.
-            #
-            # The optimization problem is formulated in the way:
-            # min  c * x
-            # s.t. A * x <= b
-            # x >= 0 and x < max. producible hydrogen
-            #
-            # Here, x is a vector with the amount of hydrogen produced each time step, c is the estimated cost function
-            # for each time step (EEX spot marked costs are used), A * x <= b is used to make sure that the storage
-            # never falls below the min. storage level (safety buffer).
-            # Number of time steps of the future used for the optimization.
-
+        if self.bidding_solver in ["linprog", "quadprog", "greedy"]:
             # Define the electricity costs [EUR/kWh].
             c = self.model.data.utility_pricing_profile[self.current_step:self.current_step+n_step]
-            # Define the inequality matrix (A) and vector (b) that make sure that at no time step the storage is below
-            # the wanted buffer value.
-            # The matrix A is supposed to sum up all hydrogen produced for each time step, therefore A is a lower
-            # triangular matrix with all entries being -1 (- because we want to make sure that the hydrogen amount does
-            # not fall below a certain amount, thus the <= must be turned in a >=, therefore A and b values are all set
-            # negative).
-            A = [[-1] * (i + 1) + [0] * (n_step - i - 1) for i in range(n_step)]
-            # Append A by the negative of itself to set the boundaries that the storage cannot be more than full.
-            A_append = [[1] * (i + 1) + [0] * (n_step - i - 1) for i in range(n_step)]
-            A += A_append
-            # The b value is the sum of the demand for each time step (- because see comment above).
-            cumsum_h2_demand = self.h2_demand[self.current_step:self.current_step+n_step]
-            cumsum_h2_demand = [-float(x) for x in cumsum_h2_demand]
-
-            # Accumulate all demands over time.
-            cumsum_h2_demand = np.cumsum(cumsum_h2_demand).tolist()
-            # Now the usable hydrogen is added to all values of b except the last one. This allows stored hydrogen to be
-            # used but will force the optimization to have at least as much hydrogen stored at the end of the looked at
-            # time frame as there is now stored.
-            b = [x + self.stored_hydrogen - self.storage_buffer for x in cumsum_h2_demand]
-            b_append = [-x + self.storage_size for x in b]
-            b[-1] -= self.stored_hydrogen - self.storage_buffer
-            b += b_append
-            # Define the bounds for the hydrogen produced.
-            x_bound = ((0, self.max_production_per_step),) * n_step
-            # Do the optimization with linprog.
-            opt_res = lp(c, A, b, method="interior-point", bounds=x_bound)
-            # Return the optimal value for this time slot [kg]
-            if opt_res.success:
-                opt_production = opt_res.x.tolist()
-            else:
-                # Case: Linprog couldn't derive optimal result, thus produce as much H2 as possible.
-                opt_production = [self.max_production_per_step]
-            # print("Electrolyzer bidding - Optimization success is {}".format(opt_res.success))
-            electrolyzer_log.info("Electrolyzer bidding - Optimization success is {}".format(opt_res.success))
-
-        elif self.bidding_solver == "quadprog":
-            """ Quadratic program """
-            from cvxopt import matrix, solvers
-            # The optimization problem is formulated in the way:
-            # min  0.5 x^T * P * x + q^T * x
-            # s.t. G * x <= d
-            # x >= 0 and x < max. producible hydrogen
-
-            # Define the electricity costs [EUR/kWh].
-            c = self.model.data.utility_pricing_profile[self.current_step:self.current_step+n_step]
-            # The quadratic matrix P is a diagonal matrix containing the values of c on the diagonal.
-            # Create an eye matrix with the size of c.
-            P = np.eye(len(c))
-            # Multiply c with the eye matrix and convert the matrix back to a list.
-            P = P * c
-
-            # q is a vector consisting of 1.5 * max_production_per_step / 0.4 * 2 * c. The formula is derived by the
-            # assumption, that the electrolyzer cell voltage rises linearly from 1.5 V when off to 1.9 V when on max.
-            # power. The costs are the energy needed multiplied by the energy costs, which can be boiled down to the
-            # form (w/o constants) C = (1.5 + 0.4 x / x_max) * x * c, where x_max is the max. H2 production per step.
-            # Hereof the quadratic formulation can be derived.
-            q = [1.5 * self.max_production_per_step / 0.4 * 2 * cost for cost in c]
-
-            # Define the inequality matrix (A) and vector (b) that make sure that at no time step the storage is below
-            # the wanted buffer value.
-            # The matrix A is supposed to sum up all hydrogen produced for each time step, therefore A is a lower
-            # triangular matrix with all entries being -1 (- because we want to make sure that the hydrogen amount does
-            # not fall below a certain amount, thus the <= must be turned in a >=, therefore A and b values are all set
-            # negative).
-            A = [[-1.0] * (i + 1) + [0.0] * (n_step - i - 1) for i in range(n_step)]
-            # Append A by the negative of itself to set the boundaries that the storage cannot be more than full.
-            A_append = [[1.0] * (i + 1) + [0.0] * (n_step - i - 1) for i in range(n_step)]
-            A += A_append
-            # The constraints that x can only be between 0 and max. production have to be inserted via the matrix A.
-            A += np.eye(n_step).tolist()
-            eye_neg = -np.eye(n_step)
-            A += eye_neg.tolist()
-
-            A = np.array(A).T.tolist()
-            # The b value is the sum of the demand for each time step (- because see comment above).
-            cumsum_h2_demand = self.h2_demand[self.current_step:self.current_step+n_step]
-            cumsum_h2_demand = [-float(x) for x in cumsum_h2_demand]
-
-            # Accumulate all demands over time.
-            cumsum_h2_demand = np.cumsum(cumsum_h2_demand).tolist()
-            # Now the usable hydrogen is added to all values of b except the last one. This allows stored hydrogen to be
-            # used but will force the optimization to have at least as much hydrogen stored at the end of the looked at
-            # time frame as there is now stored.
-            """ IDEA: Maybe the goal should be to have a filling level of half the storage at the end of the opt. """
-            b = [x + self.stored_hydrogen - self.storage_buffer for x in cumsum_h2_demand]
-            b_append = [-x + self.storage_size for x in b]
-            b[-1] -= self.stored_hydrogen - self.storage_buffer
-            b += b_append
-            # Set the x boundaries (0 <= x <= max. H2 production per step).
-            b += [self.max_production_per_step for _ in range(n_step)]
-            b += [0 for _ in range(n_step)]
-
-            # Convert all the lists needed to cvxopt matrix format.
-            P = matrix(P)
-            q = matrix(q)
-            G = matrix(A)
-            d = matrix(b)
-
-            # Silence the optimizer output.
-            solvers.options['show_progress'] = False
-            # Do the optimization with linprog.
-            opt_res = solvers.qp(P, q, G, d)
-            # Transform cvxopt matrix format to list.
-            if opt_res['status'] == 'optimal':
-                opt_production = np.array(opt_res['x']).tolist()
-                opt_production = [x[0] for x in opt_production]
-            else:
-                opt_production = [self.max_production_per_step]
-
-            # Return the optimal value for this time slot [kg]
-            # print("Electrolyzer bidding - Optimization status is '{}'".format(opt_res['status']))
-            electrolyzer_log.info("Optimization status is '{}'".format(opt_res['status']))
+            solve_start = time.perf_counter()
+            # In receding horizon mode, the production planned in an earlier step is used as long as it is valid.
+            opt_production = self.get_planned_production(c) if self.receding_horizon else None
+            self.track_bidding_solved.append(opt_production is None)
+            solve_time = None
+            if opt_production is None:
+                if self.pool_solution is not None:
+                    # The optimization of this step was already solved by the solver pool.
+                    [opt_production, solve_time] = self.pool_solution
+                else:
+                    opt_production = self.optimize_production(n_step, c)
+                self.set_plan(opt_production, c)
+            self.pool_solution = None
+            self.track_solve_time.append(time.perf_counter() - solve_start if solve_time is None else solve_time)
 
         elif self.bidding_solver == "dummy":
             """ Return a dummy bid """
@@ -387,19 +400,243 @@ class Electrolyzer(Agent):
 
         # self.plot_optimization_result(opt_production, cumsum_h2_demand, c)
 
-        # Return the energy value needed for the optimized production and the price [kWh, EUR/kWh]
-        energy_demand = self.get_power_by_production(opt_production[0]) * self.interval_time / 60
+        # Return the energy value needed for the optimized production and the price [kWh, EUR/kWh]. The energy of the
+        # whole production plan is calculated at the current temperature, the one of this step is bid.
+        planned_energy = self.get_power_by_production_curve(opt_production) * self.interval_time / 60
+        energy_demand = float(planned_energy[0])
         price = c[0]
 
         if energy_demand == 0:
             # Case: Do not bid.
             self.bid = None
             self.trading_state = None
+            if self.receding_horizon:
+                self.idle_run = [self.current_step, self.get_idle_steps(planned_energy)]
         else:
             # Case: Bid on energy.
             self.bid = [price, energy_demand, self.id]
             self.trading_state = "buying"
 
+    def get_idle_steps(self, planned_energy):
+        # Get the number of steps from the current one in which the plan does not buy electricity [kWh], as long as the
+        # plan is valid: within the replan interval and the simulation, and while the stored hydrogen covers the demand
+        # (else it deviates from the plan). The forecasts are taken from the profiles, which do not change in a run.
+        idle_steps = min(np.argmax(planned_energy > 0) if planned_energy.any() else len(planned_energy),
+                         self.replan_interval - (self.current_step - self.plan['step']),
+                         self.model.data.num_steps - self.current_step)
+        mass_demanded = np.cumsum([float(x) for x in self.h2_demand[self.current_step:self.current_step + idle_steps]])
+        return max(int(np.searchsorted(mass_demanded, self.stored_hydrogen, side='right')), 1)
+
+    def get_optimization_problem(self):
+        # Get the bidding optimization of this step as [function, arguments] for the solver pool of the microgrid (see
+        # source/solver_pool.py), or None if the bid of this step is derived without an optimization.
+        self.current_step = self.model.step_count
+        if self.in_idle_run() or self.bidding_solver not in ["linprog", "quadprog", "greedy"]:
+            return None
+        n_step = self.forecast_horizon
+        c = self.model.data.utility_pricing_profile[self.current_step:self.current_step+n_step]
+        if self.receding_horizon and self.get_planned_production(c) is not None:
+            return None
+        return [self.optimize_production, [n_step, c]]
+
+    def set_optimization_solution(self, opt_production, solve_time):
+        # Keep the production optimized by the solver pool [kg] and its solve time [s] for the next update_bid.
+        self.pool_solution = [opt_production, solve_time]
+
+    def optimize_production(self, n_step, c):
+        # Optimize the hydrogen production of the next n_step steps [kg] with the bidding solver.
+        if self.bidding_solver == "linprog":
+            return self.optimize_production_linprog(n_step, c)
+        elif self.bidding_solver == "greedy":
+            return self.optimize_production_greedy(n_step, c)
+        warm_start = self.get_warm_start(n_step) if self.receding_horizon else None
+        return self.optimize_production_quadprog(n_step, c, warm_start)
+
+    def optimize_production_linprog(self, n_step, c):
+        """ Linear program """
+
+        # To derive the bid for this time step, a linear optimization (linprog) determines the optimal amount of
+        # hydrogen that should be produced depending on the electricity price and the demand for the next ?2 weeks?.
+        # This requires perfect foresight and in order to formulate a linear optimization problem, the temperature
+        # dependent electrolyzer efficiency is not taken into account.
+        #
+        # The optimization problem is formulated in the way:
+        # min  c * x
+        # s.t. A * x <= b
+        # x >= 0 and x < max. producible hydrogen
+        #
+        # Here, x is a vector with the amount of hydrogen produced each time step, c is the estimated cost function
+        # for each time step (EEX spot marked costs are used), A * x <= b is used to make sure that the storage
+        # never falls below the min. storage level (safety buffer).
+        # Number of time steps of the future used for the optimization.
+
+        # The optimization is done over the accumulated hydrogen production y = A x (see get_constraint_matrices),
+        # thus the storage constraints (A x <= b) are bounds of y, and the bounds of x are sparse constraints.
+        matrices = self.get_constraint_matrices(n_step)
+        difference_matrix = matrices['difference']
+        b = self.get_constraint_bounds(n_step)[0]
+        y_bound = list(zip((-b[:n_step]).tolist(), b[n_step:].tolist()))
+        # 0 <= x = D y <= max. production.
+        x_bound = np.concatenate((np.full(n_step, float(self.max_production_per_step)), np.zeros(n_step)))
+        # Do the optimization with linprog, the costs of y are D^T c.
+        opt_res = lp(difference_matrix.T @ np.asarray(c, dtype=float), matrices['inequality'], x_bound,
+                     method="interior-point", bounds=y_bound, options={'sparse': True})
+        # Return the optimal value for this time slot [kg]
+        if opt_res.success:
+            opt_production = (difference_matrix @ opt_res.x).tolist()
+        else:
+            # Case: Linprog couldn't derive optimal result, thus produce as much H2 as possible.
+            opt_production = [self.max_production_per_step]
+        # print("Electrolyzer bidding - Optimization success is {}".format(opt_res.success))
+        electrolyzer_log.info("Electrolyzer bidding - Optimization success is {}".format(opt_res.success))
+
+        return opt_production
+
+    def optimize_production_greedy(self, n_step, c):
+        # Solve the linprog problem (see optimize_production_linprog) without a generic solver: the storage constraints
+        # are bounds of the accumulated production, which is met in the cheapest steps first.
+        b = self.get_constraint_bounds(n_step)[0]
+        opt_production = cheapest_hours_production([float(cost) for cost in c], (-b[:n_step]).tolist(),
+                                                   b[n_step:].tolist(), self.max_production_per_step)
+        if opt_production is None:
+            # Case: The storage constraints can't be met, thus produce as much H2 as possible.
+            electrolyzer_log.info("Electrolyzer bidding - Storage constraints can't be met")
+            opt_production = [self.max_production_per_step]
+        return opt_production
+
+    def optimize_production_quadprog(self, n_step, c, warm_start=None):
+        """ Quadratic program """
+        from cvxopt import matrix, solvers, spmatrix
+        # The optimization problem is formulated in the way:
+        # min  0.5 x^T * P * x + q^T * x
+        # s.t. G * x <= d
+        # x >= 0 and x < max. producible hydrogen
+
+        # The quadratic matrix P is a diagonal matrix containing the values of c on the diagonal.
+        P = sparse.diags(np.asarray(c, dtype=float))
+
+        # q is a vector consisting of 1.5 * max_production_per_step / 0.4 * 2 * c. The formula is derived by the
+        # assumption, that the electrolyzer cell voltage rises linearly from 1.5 V when off to 1.9 V when on max.
+        # power. The costs are the energy needed multiplied by the energy costs, which can be boiled down to the
+        # form (w/o constants) C = (1.5 + 0.4 x / x_max) * x * c, where x_max is the max. H2 production per step.
+        # Hereof the quadratic formulation can be derived.
+        q = [1.5 * self.max_production_per_step / 0.4 * 2 * cost for cost in c]
+
+        # The optimization is done over the accumulated hydrogen production y = A x (see get_constraint_matrices).
+        # With x = D y, the objective becomes 0.5 y^T * D^T P D * y + (D^T q)^T * y, D^T P D is tridiagonal.
+        matrices = self.get_constraint_matrices(n_step)
+        difference_matrix = matrices['difference']
+        P = (difference_matrix.T @ P @ difference_matrix).tocoo()
+        P = spmatrix(P.data.tolist(), P.row.tolist(), P.col.tolist(), size=P.shape)
+        q = matrix(difference_matrix.T @ np.asarray(q, dtype=float))
+        # The inequality matrix (G) and vector (d) make sure that at no time step the storage is below the wanted
+        # buffer value or above the storage size and that 0 <= x <= max. H2 production per step.
+        G = matrices['inequality']
+        """ IDEA: Maybe the goal should be to have a filling level of half the storage at the end of the opt. """
+        b = self.get_constraint_bounds(n_step)[0]
+        d = matrix(np.concatenate((b, np.full(n_step, float(self.max_production_per_step)), np.zeros(n_step))))
+
+        # Silence the optimizer output.
+        solvers.options['show_progress'] = False
+        # A warm start is given as accumulated production y.
+        initvals = None if warm_start is None else {'x': matrix(np.asarray(warm_start, dtype=float))}
+        # Do the optimization with linprog.
+        opt_res = solvers.qp(P, q, G, d, initvals=initvals)
+        # Transform cvxopt matrix format to list.
+        if opt_res['status'] == 'optimal':
+            opt_production = (difference_matrix @ np.array(opt_res['x'])[:, 0]).tolist()
+        else:
+            opt_production = [self.max_production_per_step]
+
+        # Return the optimal value for this time slot [kg]
+        # print("Electrolyzer bidding - Optimization status is '{}'".format(opt_res['status']))
+        electrolyzer_log.info("Optimization status is '{}'".format(opt_res['status']))
+
+        return opt_production
+
+    def set_plan(self, opt_production, c):
+        # Save the optimized production [kg] with the forecasts and the storage level it was derived for.
+        self.plan = {'step': self.current_step,
+                     'production': opt_production,
+                     'prices': np.asarray(c, dtype=float),
+                     'demand': np.array([float(x) for x in
+                                         self.h2_demand[self.current_step:self.current_step + len(c)]]),
+                     'stored_hydrogen': self.stored_hydrogen}
+
+    def get_planned_production(self, c):
+        # Get the rest of the production planned in an earlier step, shifted to this step, or None if it has to be
+        # optimized again: every replan_interval steps or if the forecasts or the stored hydrogen deviate from the plan.
+        if self.plan is None:
+            return None
+        steps = self.current_step - self.plan['step']
+        production = self.plan['production']
+        if steps >= self.replan_interval or steps >= len(production):
+            return None
+
+        remaining = len(production) - steps
+        prices = np.asarray(c[:remaining], dtype=float)
+        demand = np.array([float(x) for x in self.h2_demand[self.current_step:self.current_step + remaining]])
+        # Storage level the plan leads to in this step [kg].
+        stored_hydrogen_planned = self.plan['stored_hydrogen'] + sum(production[:steps]) - \
+            self.plan['demand'][:steps].sum()
+        if np.abs(prices - self.plan['prices'][steps:steps + remaining]).max() > self.replan_price_deviation or \
+                np.abs(demand - self.plan['demand'][steps:steps + remaining]).max() > self.replan_mass_deviation or \
+                abs(self.stored_hydrogen - stored_hydrogen_planned) > self.replan_mass_deviation:
+            return None
+        return production[steps:]
+
+    def get_warm_start(self, n_step):
+        # Get the production planned in an earlier step, shifted to this step and continued with its last value, as
+        # accumulated production y to start the optimization at. None if there is no plan.
+        if self.plan is None:
+            return None
+        production = self.plan['production'][self.current_step - self.plan['step']:]
+        if len(production) == 0:
+            return None
+        production = production[:n_step] + [production[-1]] * (n_step - len(production))
+        return np.cumsum(production)
+
+    def get_constraint_matrices(self, n_step):
+        # Get the sparse matrices of the linprog/quadprog bidding for a horizon of n_step steps. They only depend on the
+        # horizon, thus they are built once and only the right hand side (see get_constraint_bounds) changes each step.
+        #
+        # The storage constraints sum up all hydrogen produced until each time step, A * x <= b with A being a lower
+        # triangular matrix with all entries being -1 (- because we want to make sure that the hydrogen amount does not
+        # fall below a certain amount, thus the <= must be turned in a >=), appended by the negative of itself to set
+        # the boundaries that the storage cannot be more than full. As this matrix is dense, the optimization is done
+        # over the accumulated production y instead: the storage constraints become -I * y <= b and I * y <= b_append,
+        # and x = D * y with the difference matrix D (1 on the diagonal, -1 below it), which has two entries per row.
+        key = (self.bidding_solver, n_step)
+        if key not in self.constraint_matrices:
+            difference_matrix = sparse.diags([np.ones(n_step), -np.ones(n_step - 1)], [0, -1], format='csr')
+            if self.bidding_solver == 'quadprog':
+                from cvxopt import spmatrix
+                # Storage constraints and 0 <= D * y <= max. H2 production per step.
+                G = sparse.vstack([-sparse.eye(n_step), sparse.eye(n_step), difference_matrix, -difference_matrix],
+                                  format='coo')
+                inequality_matrix = spmatrix(G.data.tolist(), G.row.tolist(), G.col.tolist(), size=G.shape)
+            else:
+                # The storage constraints are bounds of y, only 0 <= D * y <= max. H2 production per step is left.
+                inequality_matrix = sparse.vstack([difference_matrix, -difference_matrix], format='csr')
+            self.constraint_matrices[key] = {'difference': difference_matrix, 'inequality': inequality_matrix}
+        return self.constraint_matrices[key]
+
+    def get_constraint_bounds(self, n_step):
+        # Get the right hand side of the storage constraints (see get_constraint_matrices) [kg] and the accumulated
+        # demand. The b value is the sum of the demand for each time step (- because see get_constraint_matrices).
+        cumsum_h2_demand = self.h2_demand[self.current_step:self.current_step+n_step]
+        cumsum_h2_demand = np.array([-float(x) for x in cumsum_h2_demand])
+
+        # Accumulate all demands over time.
+        cumsum_h2_demand = np.cumsum(cumsum_h2_demand)
+        # Now the usable hydrogen is added to all values of b except the last one. This allows stored hydrogen to be
+        # used but will force the optimization to have at least as much hydrogen stored at the end of the looked at
+        # time frame as there is now stored.
+        b = cumsum_h2_demand + self.stored_hydrogen - self.storage_buffer
+        b_append = -b + self.storage_size
+        b[-1] -= self.stored_hydrogen - self.storage_buffer
+        return [np.concatenate((b, b_append)), cumsum_h2_demand]
+
     def announce_bid(self):
         # If the electrolyzer is bidding on electricity, the bid is added to the bidding list.
         electrolyzer_log.info('Electrolyzer bidding state is {}'.format(self.trading_state))
@@ -443,16 +680,41 @@ class Electrolyzer(Agent):
         current = h2_production / (self.interval_time * 60 * self.z_cell / (2 * self.faraday) * self.molarity / 1000)
         # Current density [A/cm²].
         cur_dens = current/self.area_cell
-        # Calculate the three components of the cell voltage [V].
-        v_rev = (self.ely_voltage_u_rev(self.temp))
-        v_act = (self.ely_voltage_u_act(cur_dens, self.temp))
-        v_ohm = (self.ely_voltage_u_ohm(cur_dens, self.temp))
-        # Total cell voltage [V].
-        cell_voltage = v_rev + v_act + v_ohm
+        # Total cell voltage [V], from the lookup table if it covers this state.
+        cell_voltage = self.lookup_cell_voltage(cur_dens, self.temp)
+        if cell_voltage is None:
+            # Calculate the three components of the cell voltage [V].
+            v_rev = (self.ely_voltage_u_rev(self.temp))
+            v_act = (self.ely_voltage_u_act(cur_dens, self.temp))
+            v_ohm = (self.ely_voltage_u_ohm(cur_dens, self.temp))
+            cell_voltage = v_rev + v_act + v_ohm
         # Total power of the electrolyzer [kW].
         power = current * cell_voltage * self.z_cell / 1000
         return power
 
+    def get_power_by_production_curve(self, h2_production, temp=None):
+        # Calculate the power [kW] needed for an array of H2 productions [kg] (e.g. over the forecast horizon) in one
+        # call, at the current temperature or at an array of temperatures [K].
+        h2_production = np.asarray(h2_production, dtype=float)
+        temp = self.temp if temp is None else temp
+        # Current [A] and current density [A/cm²] needed for the H2 production.
+        current = h2_production / (self.interval_time * 60 * self.z_cell / (2 * self.faraday) * self.molarity / 1000)
+        cur_dens = current / self.area_cell
+        # No power is needed if no hydrogen is supposed to be produced.
+        producing = cur_dens > 0
+        cur_dens = np.where(producing, cur_dens, 1)
+        cell_voltage = ely_cell_voltage_array(self, cur_dens, temp)
+        if self.physics_model == 'lookup_table':
+            # Like in get_power_by_production, the cell voltage is taken from the lookup table where it covers the state.
+            [cur_dens, temp] = np.broadcast_arrays(cur_dens, temp)
+            in_table = (self.lookup_cur_dens_range[0] <= cur_dens) & (cur_dens <= self.lookup_cur_dens_range[1]) & \
+                (self.lookup_temp_range[0] <= temp) & (temp <= self.lookup_temp_range[1])
+            if in_table.any():
+                cell_voltage = np.where(in_table, self.get_lookup_tables()['voltage'](
+                    np.log(np.where(in_table, cur_dens, 1)), np.where(in_table, temp, self.lookup_temp_range[0]),
+                    grid=False), cell_voltage)
+        return np.where(producing, current * cell_voltage * self.z_cell / 1000, 0)
+
     def get_cell_temp(self):
         # Calculate the electrolyzer temperature for the next time step.
 
@@ -468,9 +730,8 @@ class Electrolyzer(Agent):
         # Calculate the temperature to which the electrolyzer is heating up depending on the given current density.
         # Lin. interpolation
         temp_aim = self.temp_min + (self.temp_max - self.temp_min) * cur_dens_now / self.cur_dens_max_temp
-        # Calculate the new temperature of the electrolyzer by Newtons law of cooling. The exponent (-t[s]/2310) was
-        # parameterized such that the 98 % of the temperature change are reached after 2.5 hours.
-        temp_new = temp_aim + (temp_before - temp_aim) * math.exp(-self.interval_time*60 / 2310)
+        # Calculate the new temperature of the electrolyzer by Newtons law of cooling (see cooling_factor).
+        temp_new = temp_aim + (temp_before - temp_aim) * self.cooling_factor
         # Return the new electrolyzer temperature [K].
         return temp_new
 
@@ -483,6 +744,32 @@ class Electrolyzer(Agent):
         self.power = power
 
     def get_electricity_by_power(self, power):
+        # Without power, there is no voltage and current.
+        if power == 0:
+            return [0, 0, 0, 0]
+        # Use the lookup tables if they cover the requested power and the current temperature.
+        if self.physics_model == 'lookup_table':
+            output = self.get_electricity_by_power_lookup(power)
+            if output is not None:
+                self.solver_stats['lookups'] += 1
+                return output
+
+        self.solver_stats['calls'] += 1
+        if self.iterative_solver == 'newton':
+            # Start at the current density of the last step, or at the estimate by the system efficiency.
+            cur_dens_start = self.cur_dens if self.cur_dens > 0 else \
+                (power * self.eta_ely * 2.0 * self.faraday) / (self.area_cell * self.z_cell * self.molarity *
+                                                              self.upp_heat_val)
+            [cur_dens, cell_voltage, iterations] = get_cur_dens_newton(self, power, self.temp, cur_dens_start)
+            self.solver_stats['iterations'] += iterations
+            if cur_dens is not None:
+                self.solver_stats['converged'] += 1
+                voltage = cell_voltage * self.z_cell
+                current = cur_dens * self.area_cell
+                return [voltage, current, cur_dens, voltage * current / 1000]
+            electrolyzer_log.warning("Newton's method did not converge for a power of %f kW, the fixed point iteration "
+                                     "is used.", power)
+
         # The total electrolysis voltage consists out of three different voltage parts (u_act, u_ohm, u_ref).
         # If the current isn't given an iteration is needed to get the total voltage.
         # This is the tolerance within the el. power is allowed to differ as a result of the iteration.
@@ -518,10 +805,87 @@ class Electrolyzer(Agent):
             cur_dens_iteration = current_iteration / self.area_cell
             # Calculate the new power deviation [kW].
             power_deviation = abs(power_iteration - power)
+            if self.iterative_solver == 'fixed_point':
+                self.solver_stats['iterations'] += 1
 
+        if self.iterative_solver == 'fixed_point':
+            self.solver_stats['converged'] += 1
         output = [voltage_iteration, current_iteration, cur_dens_iteration, power_iteration]
         return output
 
+    def build_lookup_tables(self):
+        # Get the polarization curve tables for the parameters of this electrolyzer. They are computed once per parameter
+        # set and shared by all electrolyzers with the same parameters.
+        key = (self.fitting_value_exchange_current_density, self.fitting_value_electrolyte_thickness, self.gas_const,
+               self.faraday, self.n, self.molarity_KOH, self.molality_KOH, self.pressure,
+               tuple(self.lookup_cur_dens_range), tuple(self.lookup_temp_range), tuple(self.lookup_grid_size))
+        if key not in lookup_table_cache:
+            lookup_table_cache[key] = self.compute_lookup_tables()
+        self.lookup_tables = lookup_table_cache[key]
+
+    def get_lookup_tables(self):
+        # Get the polarization curve tables, they are built when they are used first.
+        if self.lookup_tables is None:
+            self.build_lookup_tables()
+        return self.lookup_tables
+
+    def compute_lookup_tables(self):
+        # Tabulate the polarization curve of one cell and fit bicubic splines to it:
+        #  'voltage': cell voltage [V] over (ln(current density [A/cm²]), temperature [K]),
+        #  'cur_dens': ln(current density [A/cm²]) over (ln(cell power density [W/cm²]), temperature [K]), the inverse.
+        # The current density axis is log spaced, as the activation voltage is linear in ln(current density). Within the
+        # table range the cell voltage deviates less than 1e-7 V from the voltage equations, thus the power of a state
+        # derived from the tables deviates less than 5e-6 kW from the requested power (the iterative solver accepts a
+        # deviation of 1e-5 kW).
+        n_cur_dens, n_temp = self.lookup_grid_size
+        log_cur_dens = np.linspace(math.log(self.lookup_cur_dens_range[0]), math.log(self.lookup_cur_dens_range[1]),
+                                   n_cur_dens)
+        temps = np.linspace(self.lookup_temp_range[0], self.lookup_temp_range[1], n_temp)
+
+        # Cell voltage on the grid [V].
+        cell_voltage = ely_cell_voltage_array(self, np.exp(log_cur_dens)[:, np.newaxis], temps[np.newaxis, :])
+
+        # The cell power density rises strictly with the current density, thus each temperature column can be inverted.
+        # The inverse table only covers power densities that lie within the table range at all temperatures.
+        log_power_density = log_cur_dens[:, np.newaxis] + np.log(cell_voltage)
+        log_power_density_grid = np.linspace(log_power_density[0].max(), log_power_density[-1].min(), n_cur_dens)
+        log_cur_dens_inverse = np.zeros((n_cur_dens, n_temp))
+        for i_temp in range(n_temp):
+            log_cur_dens_inverse[:, i_temp] = CubicSpline(log_power_density[:, i_temp], log_cur_dens)(
+                log_power_density_grid)
+
+        return {'voltage': RectBivariateSpline(log_cur_dens, temps, cell_voltage),
+                'cur_dens': RectBivariateSpline(log_power_density_grid, temps, log_cur_dens_inverse),
+                'log_power_density_range': [log_power_density_grid[0], log_power_density_grid[-1]]}
+
+    def lookup_cell_voltage(self, cur_dens, temp):
+        # Cell voltage [V] from the lookup table, None if the lookup table physics model is not used or the table does
+        # not cover the current density and temperature.
+        if self.physics_model != 'lookup_table' or not self.lookup_cur_dens_range[0] <= cur_dens <= \
+                self.lookup_cur_dens_range[1] or not self.lookup_temp_range[0] <= temp <= self.lookup_temp_range[1]:
+            return None
+        return float(self.get_lookup_tables()['voltage'](math.log(cur_dens), temp, grid=False))
+
+    def get_electricity_by_power_lookup(self, power):
+        # Get voltage, current, current density and power for the given power [kW] from the lookup tables, like
+        # get_electricity_by_power does. Returns None if the tables do not cover the power and the current temperature.
+        if power <= 0 or not self.lookup_temp_range[0] <= self.temp <= self.lookup_temp_range[1]:
+            return None
+        # Power density of one cell [W/cm²].
+        log_power_density = math.log(power * 1000 / (self.area_cell * self.z_cell))
+        lookup_tables = self.get_lookup_tables()
+        log_power_density_range = lookup_tables['log_power_density_range']
+        if not log_power_density_range[0] <= log_power_density <= log_power_density_range[1]:
+            return None
+
+        log_cur_dens = float(lookup_tables['cur_dens'](log_power_density, self.temp, grid=False))
+        # Voltage of the stack [V].
+        voltage = float(lookup_tables['voltage'](log_cur_dens, self.temp, grid=False)) * self.z_cell
+        # As in the last step of the iteration, the current follows from the power and the voltage [A].
+        current = power / voltage * 1000
+        cur_dens = current / self.area_cell
+        return [voltage, current, cur_dens, power]
+
 
 
     def ely_voltage_u_act(self, cur_dens, temp):
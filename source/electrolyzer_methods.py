@@ -0,0 +1,96 @@
+import heapq
+
+
+class RangeMinTree(object):
+    """ segment tree over a list of numbers, adds a value to a range and returns the minimum of a range in O(log n) """
+    def __init__(self, values):
+        self.size = len(values)
+        self.min = [0.0] * (4 * max(self.size, 1))
+        # Value added to all entries below a node that is not passed to its children yet.
+        self.lazy = [0.0] * (4 * max(self.size, 1))
+        if self.size > 0:
+            self.build(1, 0, self.size - 1, values)
+
+    def build(self, node, node_lo, node_hi, values):
+        if node_lo == node_hi:
+            self.min[node] = float(values[node_lo])
+            return
+        node_mid = (node_lo + node_hi) // 2
+        self.build(2 * node, node_lo, node_mid, values)
+        self.build(2 * node + 1, node_mid + 1, node_hi, values)
+        self.min[node] = min(self.min[2 * node], self.min[2 * node + 1])
+
+    def add(self, lo, hi, value, node=1, node_lo=0, node_hi=None):
+        """ adds value to all entries from index lo to hi (both included) """
+        if node_hi is None:
+            node_hi = self.size - 1
+        if hi < node_lo or node_hi < lo:
+            return
+        if lo <= node_lo and node_hi <= hi:
+            self.min[node] += value
+            self.lazy[node] += value
+            return
+        node_mid = (node_lo + node_hi) // 2
+        self.add(lo, hi, value, 2 * node, node_lo, node_mid)
+        self.add(lo, hi, value, 2 * node + 1, node_mid + 1, node_hi)
+        self.min[node] = min(self.min[2 * node], self.min[2 * node + 1]) + self.lazy[node]
+
+    def range_min(self, lo, hi, node=1, node_lo=0, node_hi=None):
+        """ minimum of the entries from index lo to hi (both included) """
+        if node_hi is None:
+            node_hi = self.size - 1
+        if hi < node_lo or node_hi < lo:
+            return float('inf')
+        if lo <= node_lo and node_hi <= hi:
+            return self.min[node]
+        node_mid = (node_lo + node_hi) // 2
+        return min(self.range_min(lo, hi, 2 * node, node_lo, node_mid),
+                   self.range_min(lo, hi, 2 * node + 1, node_mid + 1, node_hi)) + self.lazy[node]
+
+
+def cheapest_hours_production(prices, lower, upper, max_production, tolerance=1e-12):
+    """ production per step that minimizes sum(prices * production), s.t. 0 <= production <= max_production and
+        lower <= accumulated production <= upper at every step
+
+        The steps are gone through in order. Whenever the accumulated production is below the lower bound of a step,
+        the missing amount is produced in the cheapest step up to it that still has capacity left and whose production
+        does not push the accumulated production above the upper bound of any later step. Steps with negative prices
+        are used up to their capacity afterwards. This takes O(n log n) for n steps, the remaining capacity of the upper
+        bounds is kept in a RangeMinTree.
+
+        Returns the list of production values, or None if the lower bounds cannot be met.
+    """
+    num_steps = len(prices)
+    production = [0.0] * num_steps
+    # Distance of the accumulated production to the upper bound of each step.
+    upper_slack = RangeMinTree([upper_bound for upper_bound in upper])
+    produced = 0.0
+    # Steps that can still produce, cheapest first (the latest one on equal prices, it blocks the fewest upper bounds).
+    open_steps = []
+
+    for step in range(num_steps):
+        heapq.heappush(open_steps, (prices[step], -step))
+        missing = lower[step] - produced
+        while missing > tolerance:
+            if not open_steps:
+                return None
+            cheapest_step = -open_steps[0][1]
+            room = min(max_production - production[cheapest_step], upper_slack.range_min(cheapest_step, num_steps - 1))
+            if room <= tolerance:
+                # The step is used up or blocked by an upper bound, which only gets tighter.
+                heapq.heappop(open_steps)
+                continue
+            amount = min(room, missing)
+            production[cheapest_step] += amount
+            upper_slack.add(cheapest_step, num_steps - 1, -amount)
+            produced += amount
+            missing -= amount
+
+    # Producing at negative prices earns money, as far as the upper bounds allow.
+    for price, step in sorted((prices[step], step) for step in range(num_steps) if prices[step] < 0):
+        amount = min(max_production - production[step], upper_slack.range_min(step, num_steps - 1))
+        if amount > tolerance:
+            production[step] += amount
+            upper_slack.add(step, num_steps - 1, -amount)
+
+    return production
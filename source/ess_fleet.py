@@ -0,0 +1,149 @@
+from source.devices import ESS
+from source.devices_methods import ess_capacity_loss_by_aging_array
+import numpy as np
+
+import logging
+ess_fleet_log = logging.getLogger('run_microgrid.ess_fleet')
+
+
+class ESSFleet(object):
+    """ ESS of all households, whose states are updated for the whole fleet in one vector operation per step
+
+        The states and parameters of the ESS (SOC, capacity, charge throughput, efficiencies, ...) are kept as one
+        array entry per household. The households hand over the energy going in (or out) of their ESS in their
+        post-auction round, update then applies the state transition of ESS.update_ess_state to all ESS at once and
+        writes the new states back to the ESS objects, which the strategies read.
+    """
+    def __init__(self, households):
+        self.households = households
+        self.ess_devices = [household.ess for household in households]
+        self.data = households[0].data if households else None
+        self.ids = np.array([household.id for household in households], dtype=np.int64)
+
+        # Parameters.
+        self.max_capacity_init = self.get_array('max_capacity_init')
+        self.charge_eff = self.get_array('charge_eff')
+        self.discharge_eff = self.get_array('discharge_eff')
+        self.c_rate = self.get_array('c_rate')
+        self.cell_voltage = self.get_array('cell_voltage')
+        self.cell_capacity = self.get_array('cell_capacity')
+        self.delta_dod = self.get_array('delta_dod')
+
+        # States.
+        self.soc_actual = self.get_array('soc_actual')
+        self.max_capacity = self.get_array('max_capacity')
+        self.time_in_use = self.get_array('time_in_use')
+        self.total_charge_throughput = self.get_array('total_charge_throughput')
+        self.temperature_sum = self.get_array('temperature_sum')
+        self.temperature_count = self.get_array('temperature_count')
+
+        # Energy going in (positive) or out (negative) of each ESS in this step [kWh], set by the households.
+        self.energy_influx = np.zeros(len(households))
+
+        for index, household in enumerate(households):
+            household.ess_fleet = self
+            household.ess_fleet_index = index
+
+    def get_array(self, name):
+        return np.array([getattr(ess, name) for ess in self.ess_devices], dtype=float)
+
+    def get_charging_limit(self):
+        """ max. energy that can be bought and distributed by each ESS in this step [kWh], see ESS.get_charging_limit """
+        if self.data.constraints_setting == 'on':
+            max_sold = np.minimum(self.soc_actual * self.discharge_eff, self.max_capacity * self.c_rate *
+                                  self.data.market_interval / 60 * self.discharge_eff)
+            max_bought = np.minimum((self.max_capacity - self.soc_actual) / self.charge_eff,
+                                    self.max_capacity * self.c_rate * self.data.market_interval / 60 / self.charge_eff)
+        else:
+            # relaxing of constraints gimmick
+            max_bought = np.full(len(self.households), 10000.0)
+            max_sold = np.full(len(self.households), 10000.0)
+        return max_bought, max_sold
+
+    def update(self, current_step):
+        """ updates all ESS with the energy influx of this step, returns the overflow and deficit of each ESS [kWh] """
+        # Getting the temperature [K].
+        temperature = ESS.get_ess_temperature(None)
+        self.temperature_sum += temperature
+        self.temperature_count += 1
+
+        # Independent charging limits check, should be done at bidding strategy as well.
+        [max_charge, max_discharge] = self.get_charging_limit()
+        energy_influx = self.energy_influx
+        if np.any(energy_influx < -max_discharge):
+            ess_fleet_log.warning("Discharge below the level physically possible tried")
+        if np.any(energy_influx > max_charge):
+            ess_fleet_log.warning("Charge above the level physically possible tried")
+        energy_influx = np.where(energy_influx < -max_discharge, -max_discharge,
+                                 np.where(energy_influx > max_charge, max_charge, energy_influx))
+
+        soc_actual = self.soc_actual
+        storage_space_left = self.max_capacity - soc_actual
+        if not (np.all(0 <= soc_actual) and np.all(soc_actual <= self.max_capacity) and np.all(storage_space_left >= 0)):
+            ess_fleet_log.error("SOC is higher than max capacity of ESS, or negative")
+            exit("ESS physics broken, this should never happen")
+
+        # The cases of ESS.update_ess_state, each one only applies if the ones before do not.
+        charging = (0 < energy_influx * self.charge_eff) & (energy_influx * self.charge_eff < storage_space_left)
+        charging_overflow = ~charging & (energy_influx * self.charge_eff > storage_space_left) & \
+            (storage_space_left > 0)
+        discharging = ~charging & ~charging_overflow & (energy_influx * self.discharge_eff < 0) & \
+            (0 < soc_actual + energy_influx)
+        discharging_depletion = ~charging & ~charging_overflow & ~discharging & \
+            (energy_influx * self.discharge_eff < 0) & (soc_actual + energy_influx * self.discharge_eff < 0)
+
+        # Energy that goes in (or out) of the storage [kWh].
+        abs_throughput = np.zeros(len(self.households))
+        abs_throughput = np.where(charging | discharging, energy_influx * self.discharge_eff, abs_throughput)
+        abs_throughput = np.where(charging_overflow, storage_space_left, abs_throughput)
+        abs_throughput = np.where(discharging_depletion, soc_actual, abs_throughput)
+        rel_throughput = abs_throughput / self.max_capacity
+
+        soc_actual = np.where(charging | discharging, soc_actual + abs_throughput, soc_actual)
+        soc_actual = np.where(charging_overflow, self.max_capacity, soc_actual)
+        soc_actual = np.where(discharging_depletion, 0, soc_actual)
+        overflow = np.where(charging_overflow, np.abs(energy_influx) - storage_space_left, 0)
+        deficit = np.where(discharging_depletion, np.abs(energy_influx), 0)
+
+        if not (np.all(0 <= soc_actual) and np.all(soc_actual <= self.max_capacity)):
+            ess_fleet_log.error("SOC is higher than max capacity of ESS, or ESS builds up deficits/overflows")
+
+        """ Aging of battery """
+        # calculate total charge throughput Q
+        self.total_charge_throughput += np.abs(self.cell_capacity * rel_throughput)
+        # Update the capacity due to aging [kWh].
+        capacity_loss_rel = ess_capacity_loss_by_aging_array(self.cell_voltage,
+                                                             self.temperature_sum / self.temperature_count,
+                                                             self.time_in_use, self.total_charge_throughput,
+                                                             self.delta_dod)
+        self.max_capacity = (1 - capacity_loss_rel) * self.max_capacity_init
+        self.soc_actual = np.minimum(soc_actual, self.max_capacity)
+        # Update the time the battery was used [d].
+        self.time_in_use += self.data.market_interval / 60 / 24
+
+        self.data.soc_list_over_time[self.ids, current_step] = self.soc_actual
+        self.data.overflow_over_time[self.ids, current_step] = overflow
+        self.data.deficit_over_time[self.ids, current_step] = deficit
+        self.write_back(temperature, overflow, deficit)
+
+        assert np.all(0 <= self.soc_actual) and np.all(self.soc_actual <= self.max_capacity)
+        return overflow, deficit
+
+    def write_back(self, temperature, overflow, deficit):
+        # Hand the new states to the ESS objects and the overflow and deficit to the households.
+        for household, ess, soc_actual, max_capacity, time_in_use, total_charge_throughput, this_overflow, \
+                this_deficit in zip(self.households, self.ess_devices, self.soc_actual.tolist(),
+                                    self.max_capacity.tolist(), self.time_in_use.tolist(),
+                                    self.total_charge_throughput.tolist(), overflow.tolist(), deficit.tolist()):
+            ess.soc_actual = soc_actual
+            ess.max_capacity = max_capacity
+            ess.time_in_use = time_in_use
+            ess.total_charge_throughput = total_charge_throughput
+            ess.temperature_sum += temperature
+            ess.temperature_count += 1
+            if ess.temperature is not None:
+                ess.temperature.append(temperature)
+            household.overflow = this_overflow
+            household.deficit = this_deficit
+            household.overflow_tot += this_overflow
+            household.deficit_tot += this_deficit
@@ -1,7 +1,6 @@
 from source.devices import *
 from source.wallet import Wallet
-from source.strategies.simple_strategy import simple_strategy
-from source.strategies.smart_ess_strategy import smart_ess_strategy
+from source.strategies.strategy_registry import get_household_strategy
 
 import scipy.optimize as optimize
 from mesa import Agent
@@ -36,6 +35,12 @@ class HouseholdAgent(Agent):
         self.load_on_step = 0
         self.generation_on_step = 0
         self.ess_demand_on_step = 0
+        # Set by the HouseholdFleet, if the household is part of one.
+        self.fleet = None
+        self.fleet_index = None
+        # Set by the ESSFleet, if the ESS of the household is part of one.
+        self.ess_fleet = None
+        self.ess_fleet_index = None
 
         """ Tracking values """
         self.demand_tot = 0
@@ -82,11 +87,19 @@ class HouseholdAgent(Agent):
 
         self.bidding_method = "price_curve"
         # self.bidding_method = "utility_function"
+        # self.bidding_method = "utility_function_analytic"
+        # Utility function custom_utility_function(household, [allocation, price]) to optimize instead of the one of
+        # price_point_optimization. It has no closed form, "utility_function_analytic" optimizes it numerically.
+        self.custom_utility_function = None
 
         """ Initialise trade """
         self.trading_state = None
         self.bids = None
         self.offers = None
+        # Price curve [mmr, base, trade volume, number of bids] smart_ess_strategy_batch generates for this step.
+        self.price_curve = None
+        # Utility function point [mmr, surplus or demand, trade volume] smart_ess_strategy_batch computes.
+        self.price_point = None
         self.energy_trade_flux = 0
         self.net_energy_in = None
         self.overflow = None
@@ -99,6 +112,18 @@ class HouseholdAgent(Agent):
         """ updates the household agent on the state of household devices """
         current_step = self.model.step_count
 
+        if self.fleet is not None:
+            # Load and generation of all households are computed at once by the fleet, read the entry of this house.
+            if self.has_pv is True:
+                self.pv_production_on_step = self.fleet.generation_on_step[self.fleet_index]
+                self.pv_production_tot += self.pv_production_on_step
+                self.generation_tot += self.pv_production_on_step
+            self.generation_on_step = self.fleet.generation_on_step[self.fleet_index]
+            self.load_on_step = self.fleet.load_on_step[self.fleet_index]
+            if self.has_load is True:
+                self.demand_tot += abs(self.load_on_step)
+            return
+
         # if self.has_load is True:
         #     self.load_on_step = self.load.get_load(current_step)
         #     self.demand_tot += float(self.load_data[current_step])
@@ -134,18 +159,15 @@ class HouseholdAgent(Agent):
             how to come up with price-quantity points on the auction platform (aka the market)
         """
 
-
-        if self.has_ess is True and self.selected_strategy == 'smart_ess_strategy':
-            smart_ess_strategy(self)
-
-        elif self.selected_strategy == 'simple_strategy':
-            simple_strategy(self)
-
-        elif self.selected_strategy == 'no_trade':
-            self.offers = None
-            self.bids = None
-
-        self.announce_bid_and_offers()
+        strategy = get_household_strategy(self)
+        if self.data.strategy_batches is True and self.fleet is not None:
+            # The household fleet announces the bids and offers of all households, strategies with a batch entry
+            # point make them for all their households at once (see HouseholdFleet.announce_bids_and_offers).
+            if strategy.batch_function is None:
+                strategy.agent_function(self)
+        else:
+            strategy.agent_function(self)
+            self.announce_bid_and_offers()
 
     def post_auction_round(self):
         """ after auctioneer gives clearing signal """
@@ -160,23 +182,28 @@ class HouseholdAgent(Agent):
         assert self.load_on_step <= 0
 
         """ update ESS and unmatched loads """
-        if self.has_ess is True:
-            self.overflow, self.deficit = self.ess.update_ess_state(self.net_energy_in)
-
+        if self.ess_fleet is not None:
+            # The ESS of all households are updated at once after the post-auction round (see ESSFleet.update), which
+            # also logs the overflow and deficit of this house.
+            self.ess_fleet.energy_influx[self.ess_fleet_index] = self.net_energy_in
         else:
-            if self.net_energy_in > 0:
-                self.overflow = abs(self.net_energy_in)
-                self.deficit = 0
-            else:
-                self.overflow = 0
-                self.deficit = abs(self.net_energy_in)
+            if self.has_ess is True:
+                self.overflow, self.deficit = self.ess.update_ess_state(self.net_energy_in)
 
-        """ data logging """
-        self.data.overflow_over_time[self.id][self.model.step_count] = self.overflow
-        self.data.deficit_over_time[self.id][self.model.step_count] = self.deficit
-
-        self.overflow_tot += self.overflow
-        self.deficit_tot += self.deficit
+            else:
+                if self.net_energy_in > 0:
+                    self.overflow = abs(self.net_energy_in)
+                    self.deficit = 0
+                else:
+                    self.overflow = 0
+                    self.deficit = abs(self.net_energy_in)
+
+            """ data logging """
+            self.data.overflow_over_time[self.id][self.model.step_count] = self.overflow
+            self.data.deficit_over_time[self.id][self.model.step_count] = self.deficit
+
+            self.overflow_tot += self.overflow
+            self.deficit_tot += self.deficit
 
         traded_energy = sum(self.model.auction.who_gets_what_dict[self.id])
         self.model.data.agent_measurements[self.id]["traded_volume_over_time"][self.model.step_count] = traded_energy
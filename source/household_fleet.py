@@ -0,0 +1,125 @@
+from source.data_methods import ScaledProfile
+from source.strategies.strategy_registry import get_household_strategy
+import numpy as np
+
+import logging
+house_log = logging.getLogger('run_microgrid.house')
+
+
+class HouseholdFleet(object):
+    """ load and PV generation of all households, computed for the whole fleet in one vector operation per step
+
+        The load profiles are kept as one households x steps array. The PV profiles are kept as their (shared) base
+        time series plus a multiplier per household, see ScaledProfile. Every household reads its entry of the fleet
+        values instead of calling its GeneralLoad and PVPanel devices.
+    """
+    def __init__(self, households):
+        self.households = households
+        num_households = len(households)
+        self.has_load = np.array([household.has_load for household in households], dtype=bool)
+        self.has_pv = np.array([household.has_pv for household in households], dtype=bool)
+        self.has_ess = np.array([household.has_ess for household in households], dtype=bool)
+
+        # Load profiles [kWh], zero for households without load.
+        num_steps = max([len(household.load_data) for household in households if household.has_load] + [0])
+        self.load = np.zeros((num_households, num_steps))
+        for index, household in enumerate(households):
+            if household.has_load:
+                self.load[index, :len(household.load_data)] = household.load_data
+
+        # PV profiles [kWh]: households that share a base time series share its row.
+        pv_bases = []
+        pv_base_rows = {}
+        self.pv_base_index = np.zeros(num_households, dtype=np.int64)
+        self.pv_multiplier = np.zeros(num_households)
+        for index, household in enumerate(households):
+            if not household.has_pv:
+                continue
+            pv_data = household.pv_data
+            if not isinstance(pv_data, ScaledProfile):
+                pv_data = ScaledProfile(np.asarray(pv_data, dtype=float))
+            if id(pv_data.base) not in pv_base_rows:
+                pv_base_rows[id(pv_data.base)] = len(pv_bases)
+                pv_bases.append(pv_data.base)
+            self.pv_base_index[index] = pv_base_rows[id(pv_data.base)]
+            self.pv_multiplier[index] = pv_data.multiplier
+        num_pv_steps = max([len(pv_base) for pv_base in pv_bases] + [0])
+        self.pv_base = np.zeros((max(len(pv_bases), 1), num_pv_steps))
+        for row, pv_base in enumerate(pv_bases):
+            self.pv_base[row, :len(pv_base)] = pv_base
+
+        for index, household in enumerate(households):
+            household.fleet = self
+            household.fleet_index = index
+
+        # Values of the current step, as lists of floats (one entry per household).
+        self.generation_on_step = None
+        self.load_on_step = None
+        self.surplus_on_step = None
+        # Generation and load of the current step as arrays, for the strategies' batch entry points.
+        self.generation_on_step_array = None
+        self.load_on_step_array = None
+
+    def update(self, current_step):
+        """ computes generation (positive), load (negative) and their sum for all households for this step """
+        generation = np.zeros(len(self.households))
+        if self.has_pv.any():
+            generation[self.has_pv] = np.abs(self.pv_base[self.pv_base_index[self.has_pv], current_step] *
+                                             self.pv_multiplier[self.has_pv])
+
+        load = np.zeros(len(self.households))
+        if self.has_load.any():
+            load[self.has_load] = - self.load[self.has_load, current_step]
+            assert np.all(load[self.has_load] < 0)
+
+        self.generation_on_step_array = generation
+        self.load_on_step_array = load
+        self.generation_on_step = generation.tolist()
+        self.load_on_step = load.tolist()
+        self.surplus_on_step = (generation + load).tolist()
+
+    def announce_bids_and_offers(self, auction):
+        """ announces the bids and offers of all households to the auction (see HouseholdAgent.announce_bid_and_offers)
+
+            The strategies with a batch entry point make the bids and offers of all their households in one call (see
+            Strategy), the orders of all households are appended to the order books as one batch per side, in the
+            order of the households.
+        """
+        # Orders of the households whose strategy has no batch entry point, [prices, quantities, owners] per side.
+        agent_orders = {'supplying': [[], [], []], 'buying': [[], [], []]}
+        batches = {}
+        for index, household in enumerate(self.households):
+            strategy = get_household_strategy(household)
+            if strategy.batch_function is not None:
+                batches.setdefault(strategy.name, [strategy, []])[1].append(index)
+            elif household.trading_state in agent_orders:
+                prices, quantities, owners = agent_orders[household.trading_state]
+                for order in household.offers if household.trading_state == 'supplying' else household.bids:
+                    prices.append(order[0])
+                    quantities.append(order[1])
+                    owners.append(index)
+
+        # Column arrays of all orders, per side.
+        sides = {}
+        for trading_state, [prices, quantities, owners] in agent_orders.items():
+            sides[trading_state] = [[np.array(prices, dtype=float)], [np.array(quantities, dtype=float)],
+                                    [np.array(owners, dtype=np.int64)]]
+        for strategy, indices in batches.values():
+            indices = np.array(indices, dtype=np.int64)
+            orders = strategy.batch_function([self.households[index] for index in indices.tolist()])
+            for trading_state, [prices, quantities, owners] in orders.items():
+                sides[trading_state][0].append(prices)
+                sides[trading_state][1].append(quantities)
+                sides[trading_state][2].append(indices[owners])
+
+        for household in self.households:
+            house_log.info('house%d is %s', household.id, household.trading_state)
+
+        for trading_state, order_list in [['supplying', auction.offer_list], ['buying', auction.bid_list]]:
+            prices, quantities, owners = [np.concatenate(column) for column in sides[trading_state]]
+            if len(prices) == 0:
+                continue
+            # The orders of a household stay together, in the order it posts them.
+            order = np.argsort(owners, kind='stable')
+            order_list.append_many(prices[order], quantities[order],
+                                   [self.households[owner].id for owner in owners[order].tolist()])
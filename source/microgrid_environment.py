@@ -2,13 +2,18 @@ from mesa.datacollection import DataCollector
 from source.auctioneer_agent import Auctioneer
 from source.utility_agent import UtilityAgent
 from source.household_agent import HouseholdAgent
+from source.household_fleet import HouseholdFleet
+from source.devices import update_ess_aging
+from source.ess_fleet import ESSFleet
 from source.electrolyzer import Electrolyzer
 from source.battery import Battery
 from source.pv import Pv
 from source.data import Data
+from source.solver_pool import SolverPool
 
 from mesa import Model
 import random
+import time
 
 import logging
 env_log = logging.getLogger('run_microgrid.microgrid_env')
@@ -35,6 +40,13 @@ class MicroGrid(Model):
         """ create N agents """
         for house_id in range(self.data.num_households):
             self.agents[house_id] = HouseholdAgent(house_id, self)
+        self.household_fleet = HouseholdFleet([self.agents[house_id] for house_id in range(self.data.num_households)])
+        self.ess_devices = [self.agents[house_id].ess for house_id in range(self.data.num_households)
+                            if self.agents[house_id].has_ess]
+        self.ess_fleet = None
+        if self.data.ess_fleet is True and len(self.ess_devices) > 0:
+            self.ess_fleet = ESSFleet([self.agents[house_id] for house_id in range(self.data.num_households)
+                                       if self.agents[house_id].has_ess])
 
         """ Electrolyzer """
         if self.data.electrolyzer_presence is True:
@@ -52,18 +64,35 @@ class MicroGrid(Model):
             pv_id = 'CommercialPv'
             self.agents[pv_id] = Pv(pv_id, self)
 
+        """ Solver pool for the bidding optimizations of the storage agents """
+        self.solver_pool = SolverPool(self.data.solver_pool_workers) if self.data.solver_pool_workers > 0 else None
+
         self.data.initiate_measurement_dict()
         self.data_collector = DataCollector()
 
     def sim_step(self):
         """advances the model by one step"""
+        self.pre_auction_phase()
+        self.auction_phase()
+        self.post_auction_phase()
 
+    def pre_auction_phase(self):
         """ pre-auction round """
         # print("Phase [1] Pre-Auction Round")
+        self.household_fleet.update(self.step_count)
+        if self.solver_pool is not None:
+            # Solve the optimizations of all storage agents at once, their pre-auction rounds use the solutions.
+            pool_start = time.perf_counter()
+            solve_time = self.solver_pool.solve([agent for agent in self.agents.values()
+                                                 if hasattr(agent, 'get_optimization_problem')])
+            self.data.fill_solve_time(solve_time, time.perf_counter() - pool_start)
         pre_agent_id = []
         for agent_id in self.agents:
             self.agents[agent_id].pre_auction_round()
             pre_agent_id.append(agent_id)
+            if self.data.strategy_batches is True and agent_id == self.data.num_households - 1:
+                # All households have made their bids and offers, post them at once in the order of the households.
+                self.household_fleet.announce_bids_and_offers(self.auction)
 
         """ Utility grid treatment """
         self.agents["Utility"].append_utility_offer(self.auction.bid_list, self.auction.offer_list)
@@ -117,19 +146,25 @@ class MicroGrid(Model):
         # print(info_string.format(*pre_agent_id))
         # print("")
 
+    def auction_phase(self, sorting_result=None):
         """ auction round """
         # print("Phase [2] Start Auction Round")
-        self.auction.auction_round()
-        info_string = 'Auction round done for agent IDs:' + ' | {}' * len(pre_agent_id) + ' |'
-        # print(info_string.format(*pre_agent_id))
+        self.auction.auction_round(sorting_result)
         # print("")
 
+    def post_auction_phase(self):
         """ post-auction round """
         # print("Phase [3] Start Post-Auction Round")
         updated_agent_id = []
         for agent_id in self.agents:
             self.agents[agent_id].post_auction_round()
             updated_agent_id.append(agent_id)
+        if self.ess_fleet is not None:
+            # Update all ESS at once with the energy the households handed over in their post-auction round.
+            self.ess_fleet.update(self.step_count)
+        elif self.data.battery_aging == 'on':
+            # Age all ESS at once (see ESS.update_aging).
+            update_ess_aging(self.ess_devices)
 
         info_string = 'Agents updated with following IDs:' + ' | {}' * len(updated_agent_id) + ' |'
         # print(info_string.format(*updated_agent_id))
@@ -151,4 +186,20 @@ class MicroGrid(Model):
         self.step_count += 1
 
 
+def sim_step_batched(microgrids):
+    """advances independent microgrids (e.g. the scenarios of a parameter sweep) by one step in lockstep, clearing
+        the auctions of the microgrids with the 'order_book' sorting engine in one batched call, the others with
+        their own sorting engine"""
+    for microgrid in microgrids:
+        microgrid.pre_auction_phase()
+
+    batched = [microgrid for microgrid in microgrids if microgrid.auction.sorting_engine == 'order_book']
+    sorting_results = {}
+    if batched:
+        sorting_results = dict(zip([id(microgrid) for microgrid in batched],
+                                   Auctioneer.order_book_sorting_batched([microgrid.auction for microgrid in batched])))
 
+    for microgrid in microgrids:
+        # Without a sorting result, the auctioneer sorts with its sorting engine.
+        microgrid.auction_phase(sorting_results.get(id(microgrid)))
+        microgrid.post_auction_phase()
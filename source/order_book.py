@@ -0,0 +1,434 @@
+import numpy as np
+
+import logging
+order_book_log = logging.getLogger('run_microgrid.order_book')
+
+
+class AgentIndex(object):
+    """ maps agent ids (household numbers, 'Utility', 'Electrolyzer', ...) to integer indices and back """
+    def __init__(self):
+        self.ids = []
+        self.indices = {}
+
+    def index(self, agent_id):
+        try:
+            return self.indices[agent_id]
+        except KeyError:
+            self.indices[agent_id] = len(self.ids)
+            self.ids.append(agent_id)
+            return self.indices[agent_id]
+
+
+class OrderBook(object):
+    """ columnar store for the bids or offers [price, quantity, id] posted to the auctioneer in one step
+
+        The book behaves like the list of [price, quantity, id] orders it replaces (append, insert, iteration,
+        indexing, len), while prices, quantities and agent indices are kept in NumPy arrays for the auction itself.
+    """
+    def __init__(self, agent_index=None, capacity=64):
+        # Bid and offer book of one auctioneer share the agent index, so buyer and seller indices can be compared.
+        self.agent_index = agent_index if agent_index is not None else AgentIndex()
+        self.size = 0
+        self.price = np.empty(capacity)
+        self.quantity = np.empty(capacity)
+        self.agent = np.empty(capacity, dtype=np.int64)
+
+    @classmethod
+    def from_orders(cls, orders, agent_index=None):
+        order_book = cls(agent_index, capacity=max(len(orders), 1))
+        order_book.extend(orders)
+        return order_book
+
+    def _reserve(self, capacity):
+        # Grow the columns geometrically, so appending stays amortised O(1).
+        if capacity <= len(self.price):
+            return
+        capacity = max(capacity, 2 * len(self.price))
+        for column in ('price', 'quantity', 'agent'):
+            old = getattr(self, column)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, column, new)
+
+    def append(self, order):
+        # Empty orders do not add information and are not stored.
+        if len(order) == 0:
+            return
+        self._reserve(self.size + 1)
+        self.price[self.size] = order[0]
+        self.quantity[self.size] = order[1]
+        self.agent[self.size] = self.agent_index.index(order[2])
+        self.size += 1
+
+    def extend(self, orders):
+        for order in orders:
+            self.append(order)
+
+    def append_many(self, prices, quantities, agent_ids):
+        """ appends a batch of orders given as columns (e.g. all bids of one strategy for this step) """
+        prices = np.asarray(prices, dtype=float)
+        quantities = np.asarray(quantities, dtype=float)
+        agents = np.fromiter((self.agent_index.index(agent_id) for agent_id in agent_ids), dtype=np.int64,
+                             count=len(prices))
+        self._reserve(self.size + len(prices))
+        self.price[self.size:self.size + len(prices)] = prices
+        self.quantity[self.size:self.size + len(prices)] = quantities
+        self.agent[self.size:self.size + len(prices)] = agents
+        self.size += len(prices)
+
+    def insert(self, position, order):
+        if len(order) == 0:
+            return
+        position = min(max(position, 0), self.size)
+        self._reserve(self.size + 1)
+        for column, value in ((self.price, order[0]), (self.quantity, order[1]),
+                              (self.agent, self.agent_index.index(order[2]))):
+            column[position + 1:self.size + 1] = column[position:self.size]
+            column[position] = value
+        self.size += 1
+
+    def clear(self):
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, position):
+        if position < 0:
+            position += self.size
+        if not 0 <= position < self.size:
+            raise IndexError('order book index out of range')
+        return [self.price[position].item(), self.quantity[position].item(),
+                self.agent_index.ids[self.agent[position]]]
+
+    def __iter__(self):
+        # Like a list iterator, check the length on every step, so orders inserted while iterating are visited.
+        position = 0
+        while position < self.size:
+            yield self[position]
+            position += 1
+
+    def columns(self):
+        return self.price[:self.size], self.quantity[:self.size], self.agent[:self.size]
+
+    def to_list(self, order=None):
+        price, quantity, agent = self.columns()
+        if order is not None:
+            price, quantity, agent = price[order], quantity[order], agent[order]
+        ids = self.agent_index.ids
+        return [[p, q, ids[a]] for p, q, a in zip(price.tolist(), quantity.tolist(), agent.tolist())]
+
+
+class IncrementalSort(object):
+    """ keeps the sorted order of the bids (descending) or offers (ascending) of an order book from step to step
+
+        Agents post their orders anew in every step, but many of them (utility, commercial PV, idle households, ...)
+        post the same prices as in the previous step. sort compares the posted book with the one of the previous step
+        agent by agent: the sorted orders of agents with unchanged prices are kept, only the orders of the changed
+        agents are removed, sorted and merged back in. The result is the same as np.argsort(..., kind='stable'): on
+        equal prices the posting order decides, which is the order of the agents and the order within each agent as
+        long as every agent posts its orders in one block. If that does not hold, the agents post in a different order
+        than in the previous step or most orders changed, the order is rebuilt with a full sort. Books with less than
+        min_orders orders are always sorted in full, which is faster for them than keeping track of the changes.
+    """
+    def __init__(self, descending, min_orders=10000):
+        self.descending = descending
+        self.min_orders = min_orders
+        # Posted prices of the previous step and start/number of orders of each agent index in them (-1/0 if absent).
+        self.price = np.empty(0)
+        self.agent_start = np.empty(0, dtype=np.int64)
+        self.agent_length = np.empty(0, dtype=np.int64)
+        self.agent_rank = np.empty(0, dtype=np.int64)
+        # Previous sorted order as [sort key, agent index, position within the orders of the agent].
+        self.sorted_key = np.empty(0)
+        self.sorted_agent = np.empty(0, dtype=np.int64)
+        self.sorted_within = np.empty(0, dtype=np.int64)
+        # Number of steps sorted incrementally and with a full rebuild.
+        self.num_updates = 0
+        self.num_rebuilds = 0
+
+    def sort(self, order_book):
+        """ returns the sort order of the orders of the book (indices into its columns) """
+        price, _, agent = order_book.columns()
+        key = -price if self.descending else price
+        num_orders = len(price)
+        if num_orders < self.min_orders:
+            # Forget the previous step, the next book is sorted in full as well (or is the first one of an update).
+            self.sorted_key = np.empty(0)
+            self.num_rebuilds += 1
+            return np.argsort(key, kind='stable')
+        num_agents = len(order_book.agent_index.ids)
+
+        # Blocks of orders of the same agent, in posting order.
+        block_start = np.flatnonzero(np.concatenate(([True], agent[1:] != agent[:-1]))) if num_orders else \
+            np.empty(0, dtype=np.int64)
+        block_agent = agent[block_start]
+        block_length = np.diff(np.append(block_start, num_orders))
+        agent_start = np.full(num_agents, -1, dtype=np.int64)
+        agent_length = np.zeros(num_agents, dtype=np.int64)
+        agent_rank = np.full(num_agents, -1, dtype=np.int64)
+        agent_start[block_agent] = block_start
+        agent_length[block_agent] = block_length
+        agent_rank[block_agent] = np.arange(len(block_agent))
+        within = np.arange(num_orders) - np.repeat(block_start, block_length)
+
+        # Each agent has one block if no block assignment above was overwritten by a later block of the same agent.
+        in_blocks = np.array_equal(agent_rank[block_agent], np.arange(len(block_agent)))
+        if in_blocks:
+            order = self.update(key, price, agent, within, block_start, block_agent, agent_start)
+        else:
+            order_book_log.debug('agents do not post their orders in blocks, full rebuild of the sort order')
+            order = None
+        if order is None:
+            order = np.argsort(key, kind='stable')
+            self.num_rebuilds += 1
+        else:
+            self.num_updates += 1
+
+        self.price = price.copy()
+        self.agent_start = agent_start
+        self.agent_length = agent_length
+        self.agent_rank = agent_rank
+        self.sorted_key = key[order]
+        self.sorted_agent = agent[order]
+        self.sorted_within = within[order]
+        if not in_blocks:
+            # The agent positions above only hold the last block of each agent, the next book is sorted in full.
+            self.sorted_key = np.empty(0)
+        return order
+
+    def update(self, key, price, agent, within, block_start, block_agent, agent_start):
+        # Sort order from the one of the previous step, or None if a full rebuild is needed.
+        num_orders = len(key)
+        if num_orders == 0 or len(self.sorted_key) == 0:
+            return None
+
+        # Agents with the same number of orders at the same prices as in the previous step, indexed by agent index.
+        num_previous_agents = len(self.agent_start)
+        previous_start = np.zeros(len(agent_start), dtype=np.int64)
+        previous_length = np.zeros(len(agent_start), dtype=np.int64)
+        previous_start[:num_previous_agents] = np.maximum(self.agent_start, 0)
+        previous_length[:num_previous_agents] = self.agent_length
+        block_length = np.diff(np.append(block_start, num_orders))
+        block_same_length = previous_length[block_agent] == block_length
+        # Position of each order in the previous book (clipped for agents whose number of orders changed).
+        previous_position = np.repeat(previous_start[block_agent] - block_start, block_length) + np.arange(num_orders)
+        same_price = np.take(self.price, previous_position, mode='clip') == price
+        block_unchanged = block_same_length & np.logical_and.reduceat(same_price, block_start)
+        unchanged = np.zeros(len(agent_start), dtype=bool)
+        unchanged[block_agent[block_unchanged]] = True
+
+        changed_orders = np.flatnonzero(~unchanged[agent])
+        if 2 * len(changed_orders) > num_orders:
+            return None
+        # The unchanged agents must post in the same order as before, so their ties are still broken the same way.
+        previous_rank = self.agent_rank[block_agent[block_unchanged]]
+        if np.any(np.diff(previous_rank) <= 0):
+            return None
+
+        # Keep the sorted orders of the unchanged agents, at their new positions in the book.
+        kept = unchanged[self.sorted_agent]
+        kept_key = self.sorted_key[kept]
+        kept_position = agent_start[self.sorted_agent[kept]] + self.sorted_within[kept]
+
+        # Sort the orders of the changed agents (stable, thus in posting order on equal keys) and merge them in.
+        # Complex numbers compare lexicographically, [key, posting position] is the order of the stable sort.
+        changed_position = changed_orders[np.argsort(key[changed_orders], kind='stable')]
+        insert_at = np.searchsorted(kept_key + 1j * kept_position, key[changed_position] + 1j * changed_position)
+        return np.insert(kept_position, insert_at, changed_position)
+
+
+class MergedCurve(object):
+    """ aggregated demand/supply curve of one auction round, stored column-wise
+
+        Each segment i corresponds to one row [x[i], bid_price[i], offer_price[i], buyer[i], seller[i]] of the
+        sorted_x_y_y_pairs_list. Missing bid/offer prices are NaN, missing buyer/seller indices are -1.
+    """
+    def __init__(self, x, bid_price, offer_price, buyer, seller, agent_index):
+        self.x = x
+        self.bid_price = bid_price
+        self.offer_price = offer_price
+        self.buyer = buyer
+        self.seller = seller
+        self.agent_index = agent_index
+
+    def __len__(self):
+        return len(self.x)
+
+    def market_rules(self):
+        """ no zero volume trade pairs and no self-trades (see Auctioneer.market_rules) """
+        keep = (self.buyer != self.seller) & (self.x != 0)
+        return MergedCurve(self.x[keep], self.bid_price[keep], self.offer_price[keep], self.buyer[keep],
+                           self.seller[keep], self.agent_index)
+
+    def break_even(self):
+        """ returns clearing quantity, clearing price and break even index, as clearing_quantity_calc does """
+        # Missing bids/offers only occur at the tail of the curve, they don't add information.
+        complete = ~(np.isnan(self.bid_price) | np.isnan(self.offer_price))
+        num_complete = int(np.searchsorted(~complete, True))
+        if num_complete == 0:
+            return None, None, None
+
+        # Bid prices are non-increasing and offer prices non-decreasing along the curve, thus the segments where the
+        # bid is lower than the offer form a contiguous tail and the first of them is found by bisection.
+        bid_below_offer = self.bid_price[:num_complete] < self.offer_price[:num_complete]
+        num_executed = int(np.searchsorted(bid_below_offer, True))
+        if num_executed == 0:
+            # execute nothing: all bids prices are lower than offer prices
+            return None, None, None
+
+        break_even_index = num_executed - 1
+        return self.x[break_even_index].item(), self.bid_price[break_even_index].item(), break_even_index
+
+    def to_list(self):
+        """ converts the curve to the sorted_x_y_y_pairs_list format used by the pricing rules """
+        ids = self.agent_index.ids + [None]
+        bid_price = np.where(np.isnan(self.bid_price), None, self.bid_price.astype(object))
+        offer_price = np.where(np.isnan(self.offer_price), None, self.offer_price.astype(object))
+        return [[x, b, o, ids[buyer], ids[seller]] for x, b, o, buyer, seller in
+                zip(self.x.tolist(), bid_price.tolist(), offer_price.tolist(), self.buyer.tolist(),
+                    self.seller.tolist())]
+
+
+def sort_order_books(bid_book, offer_book, bid_order=None, offer_order=None):
+    """ sorts bids (descending) and offers (ascending) and merges them into one aggregated demand/supply curve
+
+        Equivalent to merge_sorting, but driven by np.argsort, np.cumsum and np.searchsorted on the columns. The sort
+        orders can be given if they are already known (see IncrementalSort).
+    """
+    bid_price, bid_quantity, bid_agent = bid_book.columns()
+    offer_price, offer_quantity, offer_agent = offer_book.columns()
+
+    # Stable sorts keep the posting order of equally priced orders, as sorted() does.
+    if bid_order is None:
+        bid_order = np.argsort(-bid_price, kind='stable')
+    if offer_order is None:
+        offer_order = np.argsort(offer_price, kind='stable')
+    bid_price, bid_agent = bid_price[bid_order], bid_agent[bid_order]
+    offer_price, offer_agent = offer_price[offer_order], offer_agent[offer_order]
+
+    # x-axis location of each bid and offer on the aggregate demand and supply curve.
+    bid_x = np.cumsum(bid_quantity[bid_order])
+    offer_x = np.cumsum(offer_quantity[offer_order])
+
+    # Number of offers in front of each bid (on equal x the bid goes first) and number of bids in front of each offer.
+    # These are at the same time the index of the next offer/bid each point is linked to.
+    next_offer = np.searchsorted(offer_x, bid_x, side='left')
+    next_bid = np.searchsorted(bid_x, offer_x, side='right')
+
+    num_bids = len(bid_x)
+    num_offers = len(offer_x)
+    bid_position = np.arange(num_bids) + next_offer
+    offer_position = np.arange(num_offers) + next_bid
+
+    # Pad the columns with a missing entry (NaN / -1), which is what points behind the end of the other curve link to.
+    bid_price_padded = np.append(bid_price, np.nan)
+    offer_price_padded = np.append(offer_price, np.nan)
+    bid_agent_padded = np.append(bid_agent, -1)
+    offer_agent_padded = np.append(offer_agent, -1)
+
+    num_segments = num_bids + num_offers
+    x = np.empty(num_segments)
+    segment_bid_price = np.empty(num_segments)
+    segment_offer_price = np.empty(num_segments)
+    buyer = np.empty(num_segments, dtype=np.int64)
+    seller = np.empty(num_segments, dtype=np.int64)
+
+    x[bid_position] = bid_x
+    segment_bid_price[bid_position] = bid_price
+    segment_offer_price[bid_position] = offer_price_padded[next_offer]
+    buyer[bid_position] = bid_agent
+    seller[bid_position] = offer_agent_padded[next_offer]
+
+    x[offer_position] = offer_x
+    segment_bid_price[offer_position] = bid_price_padded[next_bid]
+    segment_offer_price[offer_position] = offer_price
+    buyer[offer_position] = bid_agent_padded[next_bid]
+    seller[offer_position] = offer_agent
+
+    merged_curve = MergedCurve(x, segment_bid_price, segment_offer_price, buyer, seller, bid_book.agent_index)
+    return bid_book.to_list(bid_order), offer_book.to_list(offer_order), merged_curve
+
+
+def _sort_padded(order_books, descending):
+    # Sort the order books of all scenarios at once in a K x N matrix; rows are padded with NaN prices, zero quantities
+    # and agent index -1. Padding gets an infinite sort key, so the stable sort keeps it behind the real orders.
+    num_books = len(order_books)
+    width = max([len(order_book) for order_book in order_books] + [0])
+    lengths = np.array([len(order_book) for order_book in order_books], dtype=np.int64)
+    real = np.arange(width) < lengths[:, None]
+
+    price = np.full((num_books, width), np.nan)
+    quantity = np.zeros((num_books, width))
+    agent = np.full((num_books, width), -1, dtype=np.int64)
+    for k, order_book in enumerate(order_books):
+        price[k, :lengths[k]], quantity[k, :lengths[k]], agent[k, :lengths[k]] = order_book.columns()
+
+    key = np.where(real, -price if descending else price, np.inf)
+    order = np.argsort(key, axis=1, kind='stable')
+    price = np.take_along_axis(price, order, axis=1)
+    agent = np.take_along_axis(agent, order, axis=1)
+    x = np.where(real, np.cumsum(np.take_along_axis(quantity, order, axis=1), axis=1), np.inf)
+    return order, lengths, price, agent, x
+
+
+def clear_order_books_batched(bid_books, offer_books):
+    """ sort_order_books, market rules and break even for K independent auctions of the same step in one call
+
+        The auctions (e.g. the scenarios of a parameter sweep) are cleared together in padded K x N arrays: one sort
+        of the bids and offers, one cumsum, one merge sort of the curves and one break even search over the matrix.
+        Returns a list with (sorted_bid_list, sorted_offer_list, merged_curve, clearing_point) per auction, where the
+        merged curve has the market rules applied and the clearing point is the result of its break_even().
+    """
+    assert len(bid_books) == len(offer_books)
+    bid_order, num_bids, bid_price, bid_agent, bid_x = _sort_padded(bid_books, descending=True)
+    offer_order, num_offers, offer_price, offer_agent, offer_x = _sort_padded(offer_books, descending=False)
+    num_books = len(bid_books)
+    bid_width = bid_x.shape[1]
+    offer_width = offer_x.shape[1]
+    num_segments = bid_width + offer_width
+
+    # Merge both curves along the x-axis with a stable sort of [bids, offers]: on equal x the bid goes first and the
+    # (infinite) padding ends up behind the real points of the row.
+    merged_order = np.argsort(np.concatenate((bid_x, offer_x), axis=1), axis=1, kind='stable')
+    is_bid = merged_order < bid_width
+    own_index = np.where(is_bid, merged_order, merged_order - bid_width)
+    # The number of points of the other curve in front of a point is the index of the point it is linked to.
+    other_index = np.arange(num_segments) - own_index
+    bid_index = np.where(is_bid, own_index, other_index)
+    offer_index = np.where(is_bid, other_index, own_index)
+
+    # An additional missing entry (NaN / -1) per row, which points behind the end of the other curve link to.
+    missing_price = np.full((num_books, 1), np.nan)
+    missing_agent = np.full((num_books, 1), -1, dtype=np.int64)
+    x = np.take_along_axis(np.concatenate((bid_x, offer_x), axis=1), merged_order, axis=1)
+    segment_bid_price = np.take_along_axis(np.concatenate((bid_price, missing_price), axis=1), bid_index, axis=1)
+    segment_offer_price = np.take_along_axis(np.concatenate((offer_price, missing_price), axis=1), offer_index, axis=1)
+    buyer = np.take_along_axis(np.concatenate((bid_agent, missing_agent), axis=1), bid_index, axis=1)
+    seller = np.take_along_axis(np.concatenate((offer_agent, missing_agent), axis=1), offer_index, axis=1)
+
+    # Market rules: no padding, no zero volume trade pairs and no self-trades.
+    positions = np.arange(num_segments)
+    keep = (positions < (num_bids + num_offers)[:, None]) & (buyer != seller) & (x != 0)
+
+    # The clearing stops at the first kept segment without bid or offer (NaN) or with a bid lower than the offer.
+    stop = keep & ~(segment_bid_price >= segment_offer_price)
+    first_stop = np.where(stop.any(axis=1), np.argmax(stop, axis=1) if num_segments else 0, num_segments)
+    executed = keep & (positions < first_stop[:, None])
+    num_executed = executed.sum(axis=1)
+    last_executed = np.where(executed, positions, -1).max(axis=1, initial=-1)
+
+    results = []
+    for k in range(num_books):
+        merged_curve = MergedCurve(x[k, keep[k]], segment_bid_price[k, keep[k]], segment_offer_price[k, keep[k]],
+                                   buyer[k, keep[k]], seller[k, keep[k]], bid_books[k].agent_index)
+        if num_executed[k] == 0:
+            # execute nothing: all bids prices are lower than offer prices
+            clearing_point = (None, None, None)
+        else:
+            clearing_point = (x[k, last_executed[k]].item(), segment_bid_price[k, last_executed[k]].item(),
+                              int(num_executed[k]) - 1)
+        results.append((bid_books[k].to_list(bid_order[k, :num_bids[k]]),
+                        offer_books[k].to_list(offer_order[k, :num_offers[k]]), merged_curve, clearing_point))
+
+    return results
@@ -0,0 +1,81 @@
+from multiprocessing import shared_memory
+import numpy as np
+
+import logging
+profile_store_log = logging.getLogger('run_microgrid.profile_store')
+
+
+class ProfileStore(object):
+    """ time series (load, PV, utility price, H2 demand profiles) parsed once and kept in shared memory
+
+        The process that creates the store owns the shared memory blocks. The store can be handed to other processes
+        (e.g. the workers of a sweep) by pickling, only the names of the blocks are transferred. There the profiles are
+        attached to lazily, as read-only NumPy arrays on the shared memory, without copying or parsing them again.
+        Set it as profile_store of the configuration to let Data read the profiles from it.
+    """
+    def __init__(self):
+        # key -> [shared memory block name, length of the time series]
+        self.descriptors = {}
+        self.blocks = {}
+        self.owner = True
+
+    def __getstate__(self):
+        return {'descriptors': self.descriptors}
+
+    def __setstate__(self, state):
+        self.descriptors = state['descriptors']
+        self.blocks = {}
+        self.owner = False
+
+    def __contains__(self, key):
+        return key in self.descriptors
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def put(self, key, time_series):
+        time_series = np.asarray(time_series, dtype=float)
+        block = shared_memory.SharedMemory(create=True, size=max(time_series.nbytes, 1))
+        np.ndarray(time_series.shape, dtype=float, buffer=block.buf)[:] = time_series
+        self.blocks[key] = block
+        self.descriptors[key] = [block.name, len(time_series)]
+
+    def get(self, key, loader):
+        """ returns the time series stored under key, which is parsed by calling loader if it is not stored yet """
+        if key not in self.descriptors:
+            if not self.owner:
+                # Only the owner can add profiles, other processes parse missing ones themselves.
+                profile_store_log.warning("profile %s not in the profile store, it is parsed again", str(key))
+                return np.asarray(loader(), dtype=float)
+            self.put(key, loader())
+
+        name, length = self.descriptors[key]
+        if key not in self.blocks:
+            self.blocks[key] = shared_memory.SharedMemory(name=name)
+        time_series = np.ndarray((length,), dtype=float, buffer=self.blocks[key].buf)
+        # The profiles are shared by all runs, no run may change them.
+        time_series.flags.writeable = False
+        return time_series
+
+    def preload(self, run_configuration):
+        """ parses all profiles the given configuration uses into the store """
+        from source.data import Data
+        run_configuration.profile_store = self
+        Data(run_configuration, None)
+
+    def close(self):
+        """ detaches from the shared memory blocks, the owner also frees them """
+        for block in self.blocks.values():
+            try:
+                block.close()
+            except BufferError:
+                # Arrays on the block are still in use, the memory is released once they are gone.
+                pass
+            if self.owner:
+                block.unlink()
+        self.blocks = {}
+        if self.owner:
+            self.descriptors = {}
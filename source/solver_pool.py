@@ -0,0 +1,53 @@
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+import logging
+solver_pool_log = logging.getLogger('run_microgrid.solver_pool')
+
+
+class SolverPool(object):
+    """ solves the bidding optimizations of all storage agents of a step in parallel, in a pool of worker threads
+
+        A storage agent hands over its optimization problem of the step by get_optimization_problem, as a function and
+        its arguments (or None if there is nothing to solve). All problems are solved at the same time, scipy and cvxopt
+        release the GIL in their native code. The solution and the solve time are handed back to the agent by
+        set_optimization_solution, its update_bid then uses the solution instead of solving the problem itself.
+    """
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        # The worker threads are started with the first problems to solve.
+        self.executor = None
+
+    def __getstate__(self):
+        # Threads can't be pickled (e.g. with the microgrid of a finished run), they are started again when needed.
+        state = self.__dict__.copy()
+        state['executor'] = None
+        return state
+
+    def solve(self, agents):
+        """ solves the optimization problems of this step of the agents, returns {agent ID: solve time [s]} """
+        problems = []
+        for agent in agents:
+            problem = agent.get_optimization_problem()
+            if problem is not None:
+                problems.append([agent, problem])
+        if not problems:
+            return {}
+
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        futures = [self.executor.submit(timed_call, *problem) for _, problem in problems]
+
+        solve_time = {}
+        for [agent, _], future in zip(problems, futures):
+            solution, solve_time[agent.id] = future.result()
+            agent.set_optimization_solution(solution, solve_time[agent.id])
+        solver_pool_log.debug('solved the optimizations of %d agents', len(problems))
+        return solve_time
+
+
+def timed_call(function, args):
+    """ calls function with the arguments, returns its result and how long it took [s] """
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
@@ -1,3 +1,4 @@
+import numpy as np
 import logging
 
 strategy_log = logging.getLogger('run_microgrid.house')
@@ -54,3 +55,32 @@ def simple_strategy(self):
 
     # wait for clearing of the market, evaluate what has been bought / sold
     # add the rest to or from the ESS
+
+
+def simple_strategy_batch(households):
+    """ simple strategy of several households at once (see Strategy), e.g. of all pure consumers and PV-only prosumers:
+        the net energy of the households is one array (read from their HouseholdFleet), the trading states are
+        decided by masks and the bids and offers are returned as columns
+    """
+    fleet = households[0].fleet
+    fleet_index = np.array([household.fleet_index for household in households], dtype=np.int64)
+    net_energy = fleet.generation_on_step_array[fleet_index] - np.abs(fleet.load_on_step_array[fleet_index])
+
+    # Households with an ESS only get here if the smart ESS strategy is overridden, they are handled one by one.
+    for position in np.flatnonzero(fleet.has_ess[fleet_index]).tolist():
+        simple_strategy(households[position])
+        net_energy[position] = households[position].net_energy_in_simple_strategy
+
+    supplying = net_energy > 0
+    buying = net_energy < 0
+    trading_states = ('passive', 'supplying', 'buying')
+    for household, trading_state, net_energy_in in zip(households, (supplying + 2 * buying).tolist(),
+                                                        net_energy.tolist()):
+        household.trading_state = trading_states[trading_state]
+        household.net_energy_in_simple_strategy = net_energy_in
+
+    # Offers at a marginal cost of zero, bids at the price of the utility.
+    price_sell = households[0].model.agents["Utility"].price_sell
+    return {'supplying': [np.zeros(np.count_nonzero(supplying)), net_energy[supplying], np.flatnonzero(supplying)],
+            'buying': [np.full(np.count_nonzero(buying), price_sell, dtype=float), np.abs(net_energy[buying]),
+                       np.flatnonzero(buying)]}
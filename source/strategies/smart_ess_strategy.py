@@ -1,16 +1,19 @@
 import scipy.optimize as optimize
+import functools
 import logging
 import numpy as np
 
 strategy_log = logging.getLogger('run_microgrid.house')
 
 
-def smart_ess_strategy(self):
+def smart_ess_strategy(self, batch=False):
     """ smart ESS strategy, calls:
             get_charging_limit: checks what is the max (dis)charging rate
             ess_demand_calc: decides whether buying or selling, and how much;
             price_point_optimization: decides on what quantity and for what price;
+            utility_function_point: the same, with the optimum in closed form;
             utility_function: governs the trade-off that the optimization optimizes.
+        With batch, the price curve (or utility function point) is only recorded for smart_ess_strategy_batch.
     """
 
     """ Determine Volume """
@@ -70,11 +73,27 @@ def smart_ess_strategy(self):
             """ Determine Price """
             discrete_offer_list = price_point_optimization(self)
 
+        elif self.bidding_method == "utility_function_analytic" and offer_volume > 0:
+            """ Determine Price: optimum of the utility function in closed form """
+            if self.custom_utility_function is not None:
+                # A custom utility function has no closed form, it is optimized numerically.
+                discrete_offer_list = price_point_optimization(self, self.custom_utility_function)
+            elif batch is True:
+                # The points of all households are computed at once, see smart_ess_strategy_batch.
+                self.price_point = [utility_price_sell, self.ess.surplus, offer_volume]
+            else:
+                discrete_offer_list = utility_function_point(self, utility_price_sell, offer_volume)
+
         elif self.bidding_method is "price_curve" and offer_volume > 0:
             """ Discrete offer curve: multiple bids """
             number_of_offers = max(max_entries_to_market, int(self.ess.surplus))
             assert self.ess.surplus > 0
-            discrete_offer_list = battery_price_curve(self, utility_price_sell, base, offer_volume,  number_of_offers)
+            if batch is True:
+                # The curves of all households are generated at once, see smart_ess_strategy_batch.
+                self.price_curve = [utility_price_sell, base, offer_volume, number_of_offers]
+            else:
+                discrete_offer_list = battery_price_curve(self, utility_price_sell, base, offer_volume,
+                                                          number_of_offers)
 
         for offer in discrete_offer_list:
             if offer[0] is not 0:
@@ -116,6 +135,17 @@ def smart_ess_strategy(self):
             """ bid approach, using utility function: only 1 bid """
             discrete_bid_list = price_point_optimization(self)
 
+        elif self.bidding_method == "utility_function_analytic" and bidding_volume > 0:
+            """ bid approach, using the optimum of the utility function in closed form: only 1 bid """
+            if self.custom_utility_function is not None:
+                # A custom utility function has no closed form, it is optimized numerically.
+                discrete_bid_list = price_point_optimization(self, self.custom_utility_function)
+            elif batch is True:
+                # The points of all households are computed at once, see smart_ess_strategy_batch.
+                self.price_point = [utility_price_sell, abs(self.ess.surplus), bidding_volume]
+            else:
+                discrete_bid_list = utility_function_point(self, utility_price_sell, bidding_volume)
+
         elif self.bidding_method is "price_curve" and bidding_volume > 0:
             """ bid approach, using discrete offer curve: multiple bids
                 constrained by lower and higher bounds"""
@@ -131,7 +161,11 @@ def smart_ess_strategy(self):
             except AssertionError:
                 exit("AssertionError: soc_leftover_space >= 0")
             base = 0
-            discrete_bid_list = battery_price_curve(self, utility_price_sell, base, bidding_volume, number_of_bids)
+            if batch is True:
+                # The curves of all households are generated at once, see smart_ess_strategy_batch.
+                self.price_curve = [utility_price_sell, base, bidding_volume, number_of_bids]
+            else:
+                discrete_bid_list = battery_price_curve(self, utility_price_sell, base, bidding_volume, number_of_bids)
 
         for bid in discrete_bid_list:
             if bid[0] is not 0:
@@ -144,8 +178,62 @@ def smart_ess_strategy(self):
         self.offers = None
 
 
-def price_point_optimization(self):
-    """optimization set-up, utility function pick-up and solver"""
+def smart_ess_strategy_batch(households):
+    """ smart ESS strategy of several households at once (see Strategy): the volumes are decided per household, the
+        price curves and utility function points of all households are computed in one call each
+    """
+    for household in households:
+        household.price_curve = None
+        household.price_point = None
+        smart_ess_strategy(household, batch=True)
+
+    orders = {}
+    for trading_state in ['supplying', 'buying']:
+        prices, quantities, owners, curves, points = [], [], [], [], []
+        for position, household in enumerate(households):
+            if household.trading_state != trading_state:
+                continue
+            for order in household.offers if trading_state == 'supplying' else household.bids:
+                prices.append(order[0])
+                quantities.append(order[1])
+                owners.append(position)
+            if household.price_curve is not None:
+                curves.append([position] + household.price_curve)
+            if household.price_point is not None:
+                points.append([position] + household.price_point)
+
+        prices = [np.array(prices, dtype=float)]
+        quantities = [np.array(quantities, dtype=float)]
+        owners = [np.array(owners, dtype=np.int64)]
+        if curves:
+            [curve_owners, mmr, base, trade_volume, number_of_bids] = [np.array(column) for column in zip(*curves)]
+            curve_prices, curve_quantities, curve = battery_price_curves(
+                np.full(len(curves), trading_state == 'supplying'), mmr, base, trade_volume, number_of_bids)
+            prices.append(curve_prices)
+            quantities.append(curve_quantities)
+            owners.append(curve_owners[curve])
+        if points:
+            [point_owners, mmr, energy, trade_volume] = [np.array(column) for column in zip(*points)]
+            point_prices, point_quantities = utility_function_points(
+                np.full(len(points), trading_state == 'supplying'), mmr, energy, trade_volume)
+            coin_balance = np.array([households[owner].wallet.coin_balance for owner in point_owners])
+            if np.any(point_prices * point_quantities > coin_balance):
+                strategy_log.warning('cannot afford such a bid')
+            prices.append(point_prices)
+            quantities.append(point_quantities)
+            owners.append(point_owners)
+
+        # The orders of a household stay together, its other orders (e.g. essential ones) first.
+        owners = np.concatenate(owners)
+        order = np.argsort(owners, kind='stable')
+        orders[trading_state] = [np.concatenate(prices)[order], np.concatenate(quantities)[order], owners[order]]
+    return orders
+
+
+def price_point_optimization(self, custom_utility_function=None):
+    """optimization set-up, utility function pick-up and solver
+        custom_utility_function(household, [allocation, price]) replaces the utility function below, if given
+    """
 
     def utility_function(params):
         """agent-individual utility function generates 1 quantity for 1 price"""
@@ -182,9 +270,12 @@ def price_point_optimization(self):
     """initialisation values"""
     x0 = [0.1, 0.1]
 
+    if custom_utility_function is not None:
+        utility_function = functools.partial(custom_utility_function, self)
+
     """solver using SLSQP quadratic solver"""
     price_quantity_point = optimize.minimize(utility_function, x0, constraints=cons, method='SLSQP')
-    price, quantity = price_quantity_point.x
+    quantity, price = price_quantity_point.x
     if quantity < 0:
         quantity = 0
 
@@ -194,6 +285,34 @@ def price_point_optimization(self):
     return [[price, quantity]]
 
 
+def utility_function_point(self, mmr, trade_volume):
+    """ optimum of the utility function of price_point_optimization in closed form, see utility_function_points """
+    prices, quantities = utility_function_points(np.array([self.trading_state == 'supplying']), mmr,
+                                                 abs(self.ess.surplus), trade_volume)
+    if prices[0] * quantities[0] > self.wallet.coin_balance:
+        strategy_log.warning('cannot afford such a bid')
+
+    return [[prices[0].item(), quantities[0].item()]]
+
+
+def utility_function_points(supplying, mmr, energy, trade_volume):
+    """ optimal price and quantity of the utility functions of price_point_optimization, for one or several ESS at once
+        (given as arrays with one entry per ESS; energy is the surplus of a supplying ESS or the demand of a buying one)
+
+        The utilities are quadratic in the allocation, for a price p the best allocation is energy + p/2 (supplying)
+        or energy - 0.0005*p (buying), bounded by the trade volume. The utility of supplying decreases with the price
+        and the one of buying increases with it, so the optimal price is the upper bound mmr (the utility price) when
+        supplying and 0 when buying.
+    """
+    supplying = np.asarray(supplying, dtype=bool)
+    mmr = np.broadcast_to(np.asarray(mmr, dtype=float), len(supplying))
+    price = np.where(supplying, mmr, 0.0)
+    allocation = np.where(supplying, energy + price / 2, energy - 0.0005 * price)
+    quantity = np.clip(allocation, 0, trade_volume)
+
+    return price, quantity
+
+
 def battery_price_curve(self, mmr, base, trade_volume, number_of_bids):
     # TODO: check whether number_of_bids is integer!
     assert type(number_of_bids) is int
@@ -205,8 +324,27 @@ def battery_price_curve(self, mmr, base, trade_volume, number_of_bids):
         print(number_of_bids)
         exit("Operation with zero")
 
-    increment = trade_volume/number_of_bids
-    bid_range = np.arange(increment, trade_volume, increment)
+    prices, volumes, _ = battery_price_curves(np.array([self.trading_state == 'supplying']), mmr, base, trade_volume,
+                                              number_of_bids)
+    return [[price, volume] for price, volume in zip(prices.tolist(), volumes.tolist())]
+
+
+def battery_price_curves(supplying, mmr, base, trade_volume, number_of_bids):
+    """ price curves of one or several ESS at once, given as arrays with one entry per curve (supplying is True for a
+        supplying ESS and False for a buying one), returns the prices, the volumes and the curve index of all points
+    """
+    supplying = np.asarray(supplying, dtype=bool)
+    num_curves = len(supplying)
+    mmr = np.broadcast_to(np.asarray(mmr, dtype=float), num_curves)
+    base = np.broadcast_to(np.asarray(base, dtype=float), num_curves)
+    trade_volume = np.broadcast_to(np.asarray(trade_volume, dtype=float), num_curves)
+    increment = trade_volume / number_of_bids
+
+    # The points of np.arange(increment, trade_volume, increment) of each curve, all curves one after another.
+    num_points = np.maximum(np.ceil((trade_volume - increment) / increment), 0).astype(np.int64)
+    curve = np.repeat(np.arange(num_curves), num_points)
+    point = np.arange(len(curve)) - np.repeat(np.cumsum(num_points) - num_points, num_points)
+    volume = increment[curve] + point * increment[curve]
 
     # risk parameter in case of selling:
     #   high: risk averse, battery really wants to sell and not be a price pusher
@@ -216,23 +354,17 @@ def battery_price_curve(self, mmr, base, trade_volume, number_of_bids):
     clamp = lambda value, minn, maxn: max(min(maxn, value), minn)
     risk_parameter = clamp(risk_parameter, 0.1, 10)
 
-    discrete_bid_curve = []
-    volume_prev = 0
-    volume_total = 0
-    for volume in bid_range:
-        price = None
-        if self.trading_state is 'supplying':
-            price = (mmr - base)/trade_volume**risk_parameter * volume**risk_parameter + base
-        elif self.trading_state is 'buying':
-            price = mmr - (mmr - base)/trade_volume**risk_parameter * volume**risk_parameter  # + 0.01
-
-        # assert price <= mmr
-        if volume > 0:
-            # Check if the clearing price is not above the grid price. Due to rounding errors a correction might be
-            # done.
-            assert price < mmr * 1.0000001
-            price = mmr if price > mmr else price
-            discrete_bid_curve.append([price, volume - volume_prev])
-        volume_prev = volume
-
-    return discrete_bid_curve
+    # np.float_power computes the same powers as the scalar ** of a single curve (the SIMD loops of ** on arrays can
+    # differ in the last bit), so the curves do not depend on how many are generated at once.
+    price_range = ((mmr - base) / np.float_power(trade_volume, risk_parameter))[curve] * \
+        np.float_power(volume, risk_parameter)
+    price = np.where(supplying[curve], price_range + base[curve], mmr[curve] - price_range)
+
+    # Check if the clearing price is not above the grid price. Due to rounding errors a correction might be done.
+    assert np.all(price < mmr[curve] * 1.0000001)
+    price = np.minimum(price, mmr[curve])
+    # Each point offers the volume between the previous point of its curve and itself.
+    volume_step = np.diff(volume, prepend=0)
+    volume_step[point == 0] = volume[point == 0]
+
+    return price, volume_step, curve
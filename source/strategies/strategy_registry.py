@@ -0,0 +1,61 @@
+from source.strategies.simple_strategy import simple_strategy, simple_strategy_batch
+from source.strategies.smart_ess_strategy import smart_ess_strategy, smart_ess_strategy_batch
+
+import logging
+strategy_log = logging.getLogger('run_microgrid.house')
+
+
+class Strategy(object):
+    """ bidding strategy of the households, selected by its name (HouseholdAgent.selected_strategy)
+
+        agent_function(household) makes the bids and offers of one household in its pre-auction round.
+        batch_function(households), if given, makes the bids and offers of all households using the strategy in one
+        call after their pre-auction rounds (see HouseholdFleet.announce_bids_and_offers). It sets the trading state
+        of the households and returns the orders of both sides as {'supplying': [prices, quantities, owners],
+        'buying': [...]}, with owners the positions of the households in the given list and the orders of each
+        household in the order it posts them.
+        A strategy with needs_ess only trades for households with an ESS (see get_household_strategy).
+    """
+    def __init__(self, name, agent_function, batch_function=None, needs_ess=False):
+        self.name = name
+        self.agent_function = agent_function
+        self.batch_function = batch_function
+        self.needs_ess = needs_ess
+
+
+# Strategies by their name.
+strategy_registry = {}
+
+
+def register_strategy(name, agent_function, batch_function=None, needs_ess=False):
+    """ adds a strategy to the registry (or replaces the one with this name) """
+    strategy_registry[name] = Strategy(name, agent_function, batch_function, needs_ess)
+    strategy_log.debug('strategy %s registered', name)
+
+
+def get_strategy(name):
+    try:
+        return strategy_registry[name]
+    except KeyError:
+        strategy_log.error('strategy %s is not registered', name)
+        raise
+
+
+def get_household_strategy(household):
+    """ strategy the household uses, a household without ESS does not trade with a strategy that needs one """
+    strategy = get_strategy(household.selected_strategy)
+    if strategy.needs_ess is True and household.has_ess is not True:
+        strategy_log.debug('house%d has no ESS for strategy %s, it does not trade', household.id, strategy.name)
+        return strategy_registry['no_trade']
+    return strategy
+
+
+def no_trade(self):
+    """ household does not trade """
+    self.offers = None
+    self.bids = None
+
+
+register_strategy('smart_ess_strategy', smart_ess_strategy, smart_ess_strategy_batch, needs_ess=True)
+register_strategy('simple_strategy', simple_strategy, simple_strategy_batch)
+register_strategy('no_trade', no_trade)
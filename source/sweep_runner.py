@@ -0,0 +1,100 @@
+from source import microgrid_environment
+from eval_result.get_kpi import get_kpi
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import itertools
+import os
+import pickle
+
+import logging
+sweep_log = logging.getLogger('run_microgrid.sweep')
+
+
+def parameter_grid(param_grid):
+    """ expands {config attribute: [values]} into a list with one {config attribute: value} dict per run """
+    names = list(param_grid)
+    return [dict(zip(names, values)) for values in itertools.product(*[param_grid[name] for name in names])]
+
+
+def result_file_name(params):
+    """ name of the result file of one run, e.g. result_ely_stepwise_bid_price_0.06_0.12_0.18_0.24.pkl """
+    name_parts = []
+    for name, value in params.items():
+        values = value if isinstance(value, (list, tuple)) else [value]
+        name_parts += [name] + [str(this_value) for this_value in values]
+    return 'result_' + '_'.join(name_parts) + '.pkl'
+
+
+def run_single(config_class, params, profile_store=None):
+    """ runs one microgrid of the configuration class with the given config attributes overwritten, returns its KPI """
+    config = config_class()
+    for name, value in params.items():
+        setattr(config, name, value)
+    if profile_store is not None:
+        config.profile_store = profile_store
+
+    microgrid = microgrid_environment.MicroGrid(config)
+    for _ in range(microgrid.data.num_steps):
+        microgrid.sim_step()
+    assert microgrid.step_count == microgrid.data.num_steps
+
+    return get_kpi(microgrid)
+
+
+def save_result(result_loc, params, kpi):
+    # Write to a temporary file first, so a crash while writing does not leave a result that looks complete.
+    temp_loc = result_loc + '.tmp'
+    with open(temp_loc, 'wb') as filehandler:
+        pickle.dump({'params': params, 'kpi': kpi}, filehandler)
+    os.replace(temp_loc, result_loc)
+
+
+def load_result(result_loc):
+    with open(result_loc, 'rb') as filehandler:
+        result = pickle.load(filehandler)
+    return result['params'], result['kpi']
+
+
+def run_sweep(config_class, param_grid, result_dir, max_workers=None, profile_store=None, failed_runs=None):
+    """ runs a microgrid for every parameter combination of param_grid in a pool of worker processes
+
+        Yields (params, kpi) for each run as soon as it is finished, the KPI dict is the one of get_kpi. Each result is
+        stored in result_dir; runs whose result file already exists (e.g. from a sweep that crashed) are not run again,
+        their stored result is yielded instead. If a ProfileStore is given, the workers read the profiles from it.
+        A run that raises an error is logged and left out, the sweep goes on with the other runs. The params of the
+        failed runs are appended to failed_runs if a list is given (they are run again by the next sweep).
+    """
+    os.makedirs(result_dir, exist_ok=True)
+
+    runs_to_do = []
+    for params in parameter_grid(param_grid):
+        result_loc = os.path.join(result_dir, result_file_name(params))
+        if os.path.exists(result_loc):
+            sweep_log.info('result %s exists, run is skipped', result_loc)
+            yield load_result(result_loc)
+        else:
+            runs_to_do.append((params, result_loc))
+
+    if not runs_to_do:
+        return
+
+    failed_params = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(run_single, config_class, params, profile_store): (params, result_loc)
+                   for params, result_loc in runs_to_do}
+        for future in as_completed(futures):
+            params, result_loc = futures[future]
+            try:
+                kpi = future.result()
+            except Exception:
+                sweep_log.exception('run with params %s failed', params)
+                failed_params.append(params)
+                continue
+            save_result(result_loc, params, kpi)
+            sweep_log.info('run finished, result saved at %s', result_loc)
+            yield params, kpi
+
+    if failed_params:
+        sweep_log.error('%d of %d runs failed: %s', len(failed_params), len(runs_to_do), failed_params)
+        if failed_runs is not None:
+            failed_runs.extend(failed_params)
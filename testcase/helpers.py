@@ -0,0 +1,71 @@
+""" stubs and runs shared by the tests """
+import numpy as np
+
+from source import microgrid_environment
+from source.devices import ESS
+
+
+class Data:
+    """ data with only the attributes the ESS reads """
+    def __init__(self, num_households, num_steps=10, constraints_setting='off', ess_temperature_history=0):
+        self.horizon = 24
+        self.market_interval = 15
+        self.constraints_setting = constraints_setting
+        self.battery_aging = 'off'
+        self.ess_temperature_history = ess_temperature_history
+        self.forecast_prefix_sums = [[None, None]] * num_households
+        self.soc_list_over_time = np.zeros([num_households, num_steps])
+        self.overflow_over_time = np.zeros([num_households, num_steps])
+        self.deficit_over_time = np.zeros([num_households, num_steps])
+
+
+class Household:
+    """ household with only the attributes the ESS and the ESS fleet read """
+    def __init__(self, _unique_id, data, ess_data):
+        self.id = _unique_id
+        self.data = data
+        self.model = self
+        self.step_count = 0
+        self.overflow_tot = 0
+        self.deficit_tot = 0
+        self.ess = ESS(self, ess_data)
+
+
+def create_households(ess_data, num_steps=10, constraints_setting='off', ess_temperature_history=0):
+    """ households with an ESS of the given [initial soc, max capacity] each, sharing one data stub """
+    data = Data(len(ess_data), num_steps, constraints_setting, ess_temperature_history)
+    return [Household(house_id, data, ess_data[house_id]) for house_id in range(len(ess_data))]
+
+
+def short_configuration(config_class, num_steps, **attributes):
+    """ configuration of the profile that only runs num_steps steps, with the given config attributes overwritten
+
+        functools.partial(short_configuration, config_class, num_steps) can be used as configuration class, e.g. by
+        the sweep runner.
+    """
+    config = config_class()
+    config.num_steps = num_steps
+    for name, value in attributes.items():
+        setattr(config, name, value)
+    return config
+
+
+def run_and_collect_orders(config, prepare=None, collect=None):
+    """ runs the microgrid of the configuration and returns it with the orders [bids, offers] of each step
+
+        prepare(microgrid) is called before the first step. If collect is given, collect(microgrid) is added to the
+        orders of each step, after the pre-auction phase like the orders.
+    """
+    microgrid = microgrid_environment.MicroGrid(config)
+    if prepare is not None:
+        prepare(microgrid)
+    orders = []
+    for _ in range(microgrid.data.num_steps):
+        microgrid.pre_auction_phase()
+        step_orders = [microgrid.auction.bid_list.to_list(), microgrid.auction.offer_list.to_list()]
+        if collect is not None:
+            step_orders.append(collect(microgrid))
+        orders.append(step_orders)
+        microgrid.auction_phase()
+        microgrid.post_auction_phase()
+    return microgrid, orders
@@ -0,0 +1,250 @@
+import random
+
+import numpy as np
+
+from grid_config_profile import ConfigurationUtility50prosumer
+from source import microgrid_environment
+from source.auctioneer_agent import Auctioneer
+from source.auctioneer_methods import merge_sorting, clearing_quantity_calc, clearing_quantity_bisect
+from source.order_book import OrderBook, IncrementalSort, sort_order_books, clear_order_books_batched
+from testcase.helpers import short_configuration
+
+
+class DepthVar:
+    """ Class that allows to create a sub-class structure (e.g. a.b.c = d) """
+    def add_method(self, method_name, val=None):
+        if val is None:
+            val = DepthVar()
+
+        return self.__setattr__(method_name, val)
+
+
+def create_auctioneer(sorting_engine='scan'):
+    # The auctioneer only needs the pricing rule and the sorting engine from the model data.
+    model = DepthVar()
+    model.add_method("data")
+    model.data.add_method("pricing_rule", 'pac')
+    model.data.add_method("sorting_engine", sorting_engine)
+
+    return Auctioneer('test auction', model)
+
+
+def random_orders(num_orders, agent_ids, rng):
+    # Orders in the format [price, quantity, id]. Prices are drawn from a small set to provoke ties in price, rounded
+    # quantities provoke ties on the x-axis of the aggregated curves.
+    return [[rng.choice([0, 0.05, 0.1, 0.15, 0.2, 0.25]), round(rng.uniform(0, 3), 1), rng.choice(agent_ids)]
+            for _ in range(num_orders)]
+
+
+def test_merge_sorting_matches_scan_sorting():
+    rng = random.Random(42)
+    agent_ids = list(range(10)) + ['Utility', 'Electrolyzer']
+    auctioneer = create_auctioneer()
+
+    for _ in range(500):
+        bid_list = random_orders(rng.randint(1, 30), agent_ids, rng)
+        offer_list = random_orders(rng.randint(1, 30), agent_ids, rng)
+
+        auctioneer.bid_list = [bid[:] for bid in bid_list]
+        auctioneer.offer_list = [offer[:] for offer in offer_list]
+        expected = auctioneer.scan_sorting()
+
+        assert merge_sorting(bid_list, offer_list) == expected
+
+
+def test_merge_sorting_partial_execution():
+    bid_list = [[54, 1, 'buyer 1'], [53, 2, 'buyer 2'], [38, 2, 'buyer 3']]
+    offer_list = [[39, 6, 'seller 1'], [51, 1, 'seller 2']]
+
+    _, _, sorted_x_y_y_pairs_list = merge_sorting(bid_list, offer_list)
+
+    assert sorted_x_y_y_pairs_list == [
+        [1, 54, 39, 'buyer 1', 'seller 1'],
+        [3, 53, 39, 'buyer 2', 'seller 1'],
+        [5, 38, 39, 'buyer 3', 'seller 1'],
+        [6, None, 39, None, 'seller 1'],
+        [7, None, 51, None, 'seller 2'],
+    ]
+
+
+def test_order_book_matches_merge_sorting():
+    rng = random.Random(7)
+    agent_ids = list(range(10)) + ['Utility', 'Electrolyzer']
+
+    for _ in range(500):
+        bid_list = random_orders(rng.randint(1, 30), agent_ids, rng)
+        offer_list = random_orders(rng.randint(1, 30), agent_ids, rng)
+        bid_book = OrderBook()
+        offer_book = OrderBook(bid_book.agent_index)
+        for bid in bid_list:
+            bid_book.append(bid)
+        # Offers may be inserted at a position (as the utility does), the book has to keep list semantics.
+        inserted_offer_list = []
+        for offer in offer_list:
+            position = rng.randint(0, len(offer_book))
+            offer_book.insert(position, offer)
+            inserted_offer_list.insert(position, offer)
+        assert list(offer_book) == inserted_offer_list
+
+        expected = merge_sorting(bid_list=list(bid_book), offer_list=list(offer_book))
+        sorted_bid_list, sorted_offer_list, merged_curve = sort_order_books(bid_book, offer_book)
+        assert (sorted_bid_list, sorted_offer_list, merged_curve.to_list()) == expected
+
+        expected_segments = Auctioneer.market_rules(expected[2])
+        merged_curve = merged_curve.market_rules()
+        assert merged_curve.to_list() == expected_segments
+        # clearing_quantity_calc can only handle curves with at least one complete segment
+        if any(segment[1] is not None and segment[2] is not None for segment in expected_segments):
+            assert merged_curve.break_even() == clearing_quantity_calc(expected_segments)
+
+
+def test_clearing_quantity_bisect_matches_clearing_quantity_calc():
+    rng = random.Random(3)
+    agent_ids = list(range(10)) + ['Utility', 'Electrolyzer']
+
+    for _ in range(1000):
+        bid_list = random_orders(rng.randint(1, 30), agent_ids, rng)
+        offer_list = random_orders(rng.randint(1, 30), agent_ids, rng)
+        _, _, sorted_x_y_y_pairs_list = merge_sorting(bid_list, offer_list)
+        sorted_x_y_y_pairs_list = Auctioneer.market_rules(sorted_x_y_y_pairs_list)
+        # clearing_quantity_calc can only handle curves with at least one complete segment
+        if any(segment[1] is not None and segment[2] is not None for segment in sorted_x_y_y_pairs_list):
+            assert clearing_quantity_bisect(sorted_x_y_y_pairs_list) == \
+                clearing_quantity_calc(sorted_x_y_y_pairs_list)
+
+
+def test_clear_order_books_batched_matches_sort_order_books():
+    rng = random.Random(11)
+    agent_ids = list(range(10)) + ['Utility', 'Electrolyzer']
+
+    for _ in range(100):
+        bid_books = []
+        offer_books = []
+        # Scenarios of different size, including empty order books, are padded to a common width.
+        for _ in range(rng.randint(1, 12)):
+            bid_book = OrderBook.from_orders(random_orders(rng.randint(0, 30), agent_ids, rng))
+            bid_books.append(bid_book)
+            offer_books.append(OrderBook.from_orders(random_orders(rng.randint(0, 30), agent_ids, rng),
+                                                     bid_book.agent_index))
+
+        results = clear_order_books_batched(bid_books, offer_books)
+
+        assert len(results) == len(bid_books)
+        for bid_book, offer_book, result in zip(bid_books, offer_books, results):
+            sorted_bid_list, sorted_offer_list, merged_curve = sort_order_books(bid_book, offer_book)
+            merged_curve = merged_curve.market_rules()
+            assert (result[0], result[1], result[2].to_list()) == \
+                (sorted_bid_list, sorted_offer_list, merged_curve.to_list())
+            assert result[3] == merged_curve.break_even()
+
+
+def test_incremental_sort_matches_full_sort():
+    rng = random.Random(13)
+    agent_ids = list(range(20)) + ['Utility', 'Electrolyzer']
+    # Orders [price, quantity] of each agent in the current step, agents without orders do not post.
+    agent_orders = {agent_id: [] for agent_id in agent_ids}
+    sorts = [IncrementalSort(descending=True, min_orders=0), IncrementalSort(descending=False, min_orders=0)]
+    order_book = OrderBook()
+
+    for step in range(300):
+        for agent_id in rng.sample(agent_ids, rng.randint(0, 6)):
+            if rng.random() < 0.5:
+                # New prices and quantities.
+                agent_orders[agent_id] = [order[:2] for order in random_orders(rng.randint(0, 4), [agent_id], rng)]
+            else:
+                # Same prices, new quantities: the sort order stays the same.
+                agent_orders[agent_id] = [[price, round(rng.uniform(0, 3), 1)] for price, _ in agent_orders[agent_id]]
+        posting_order = agent_ids[:]
+        if step % 25 == 0:
+            rng.shuffle(posting_order)
+        orders = [[price, quantity, agent_id] for agent_id in posting_order
+                  for price, quantity in agent_orders[agent_id]]
+        if step % 40 == 0:
+            # Orders of an agent that are not posted in one block.
+            rng.shuffle(orders)
+
+        order_book.clear()
+        order_book.extend(orders)
+        for incremental_sort in sorts:
+            price = order_book.columns()[0]
+            expected = np.argsort(-price if incremental_sort.descending else price, kind='stable')
+            assert incremental_sort.sort(order_book).tolist() == expected.tolist()
+
+    for incremental_sort in sorts:
+        assert incremental_sort.num_updates > 100 and incremental_sort.num_rebuilds > 0
+
+
+def test_incremental_sort_after_orders_not_in_blocks():
+    for descending in [True, False]:
+        incremental_sort = IncrementalSort(descending=descending, min_orders=0)
+        order_book = OrderBook()
+        # The orders of agent A are not posted in one block.
+        order_book.extend([[0.3, 1, 'A'], [0.2, 1, 'B'], [0.3, 1, 'A']])
+        incremental_sort.sort(order_book)
+
+        order_book.clear()
+        order_book.extend([[0.3, 1, 'A']])
+        assert incremental_sort.sort(order_book).tolist() == [0]
+
+
+def test_incremental_sorting_engine_matches_order_book():
+    rng = random.Random(17)
+    agent_ids = list(range(10)) + ['Utility', 'Electrolyzer']
+    agent_orders = {agent_id: [[], []] for agent_id in agent_ids}
+    auctioneers = {sorting_engine: create_auctioneer(sorting_engine) for sorting_engine in ['order_book', 'incremental']}
+    # Keep track of the changes also for these small books.
+    auctioneers['incremental'].bid_sort.min_orders = 0
+    auctioneers['incremental'].offer_sort.min_orders = 0
+
+    for _ in range(100):
+        for agent_id in rng.sample(agent_ids, 3):
+            agent_orders[agent_id] = [random_orders(rng.randint(0, 3), [agent_id], rng),
+                                      random_orders(rng.randint(0, 3), [agent_id], rng)]
+        results = []
+        for auctioneer in auctioneers.values():
+            auctioneer.bid_list.clear()
+            auctioneer.offer_list.clear()
+            for agent_id in agent_ids:
+                auctioneer.bid_list.extend(agent_orders[agent_id][0])
+                auctioneer.offer_list.extend(agent_orders[agent_id][1])
+            results.append(list(auctioneer.sorting()) + [auctioneer.clearing_point])
+        assert results[1] == results[0]
+    assert auctioneers['incremental'].bid_sort.num_updates > 0 and auctioneers['incremental'].offer_sort.num_updates > 0
+
+
+def test_sim_step_batched_keeps_sorting_engine():
+    sorting_engines = ['order_book', 'scan', 'order_book']
+    results = {}
+    for batched in [False, True]:
+        microgrids = [microgrid_environment.MicroGrid(short_configuration(ConfigurationUtility50prosumer, 6,
+                                                                          sorting_engine=sorting_engine))
+                      for sorting_engine in sorting_engines]
+        scan_calls = []
+        scan_sorting = microgrids[1].auction.scan_sorting
+        microgrids[1].auction.scan_sorting = lambda: scan_calls.append(1) or scan_sorting()
+        results[batched] = []
+        for _ in range(6):
+            if batched:
+                microgrid_environment.sim_step_batched(microgrids)
+            else:
+                for microgrid in microgrids:
+                    microgrid.sim_step()
+            results[batched].append([[microgrid.auction.clearing_quantity, microgrid.auction.clearing_price,
+                                      microgrid.auction.trade_pairs] for microgrid in microgrids])
+        # The grid set to 'scan' is sorted by its own engine in every step.
+        assert len(scan_calls) == 6
+
+    assert results[True] == results[False]
+
+
+def run():
+    test_merge_sorting_matches_scan_sorting()
+    test_merge_sorting_partial_execution()
+    test_order_book_matches_merge_sorting()
+    test_clearing_quantity_bisect_matches_clearing_quantity_calc()
+    test_clear_order_books_batched_matches_sort_order_books()
+    test_incremental_sort_matches_full_sort()
+    test_incremental_sort_after_orders_not_in_blocks()
+    test_incremental_sorting_engine_matches_order_book()
+    test_sim_step_batched_keeps_sorting_engine()
+    print("\nTest finished.")
@@ -0,0 +1,51 @@
+import numpy as np
+
+from grid_config_profile import ConfigurationUtility50prosumer
+from source import microgrid_environment
+from source.data import Data
+
+
+def test_forecast_prefix_sums_match_horizon_sums():
+    config = ConfigurationUtility50prosumer()
+    config.ess_forecast_prefix_sums = True
+    data = Data(config, None)
+    # Differences of prefix sums carry the rounding error of the (larger) prefix sums.
+
+    for agent, (load_prefix_sum, pv_prefix_sum) in enumerate(data.forecast_prefix_sums):
+        load_data, pv_data = data.agent_data_array[agent][0], data.agent_data_array[agent][1]
+        for count in range(0, data.num_steps, 499):
+            for horizon in (1, 24, 96):
+                max_horizon = min(len(load_data), count + horizon)
+                assert np.isclose(load_prefix_sum[max_horizon] - load_prefix_sum[count],
+                                  sum(load_data[count:max_horizon]), atol=1e-9)
+                if pv_data is not None:
+                    max_horizon = min(len(pv_data), count + horizon)
+                    assert np.isclose(pv_prefix_sum[max_horizon] - pv_prefix_sum[count],
+                                      sum(pv_data[count:max_horizon]), atol=1e-9)
+
+
+def test_soc_preferred_is_exact_horizon_sum_by_default():
+    config = ConfigurationUtility50prosumer()
+    config.num_steps = 10
+    microgrid = microgrid_environment.MicroGrid(config)
+    assert all(prefix_sums == [None, None] for prefix_sums in microgrid.data.forecast_prefix_sums)
+
+    for _ in range(microgrid.data.num_steps):
+        microgrid.pre_auction_phase()
+        for house_id in range(microgrid.data.num_households):
+            house = microgrid.agents[house_id]
+            if house.has_ess is False:
+                continue
+            count = microgrid.step_count
+            soc_preferred = sum(house.load_data[count:count + house.ess.horizon])
+            if house.has_pv is True:
+                soc_preferred -= sum(house.pv_data[count:count + house.ess.horizon])
+            assert house.ess.soc_preferred == max(min(house.ess.max_capacity, soc_preferred), house.ess.min_capacity)
+        microgrid.auction_phase()
+        microgrid.post_auction_phase()
+
+
+def run():
+    test_forecast_prefix_sums_match_horizon_sums()
+    test_soc_preferred_is_exact_horizon_sum_by_default()
+    print("\nTest finished.")
@@ -0,0 +1,48 @@
+import numpy as np
+
+from source.devices import update_ess_aging
+from testcase.helpers import create_households
+
+
+def create_ess_devices(num_households, ess_temperature_history=0):
+    households = create_households([[5, 10]] * num_households, ess_temperature_history=ess_temperature_history)
+    return [household.ess for household in households]
+
+
+def test_ess_temperature_running_average():
+    rng = np.random.default_rng(14)
+    ess = create_ess_devices(1, ess_temperature_history=3)[0]
+    temperatures = rng.uniform(270, 310, 20).tolist()
+
+    for temperature in temperatures:
+        ess.track_temperature(temperature)
+
+    assert ess.temperature_sum / ess.temperature_count == sum(temperatures) / len(temperatures)
+    assert list(ess.temperature) == temperatures[-3:]
+    assert create_ess_devices(1)[0].temperature is None
+
+
+def test_update_ess_aging_matches_ess():
+    rng = np.random.default_rng(15)
+    ess_devices = create_ess_devices(6)
+    batched_ess_devices = create_ess_devices(6)
+    batched_ess_devices[0].agent.data.battery_aging = 'on'
+
+    for _ in range(10):
+        energy_influx = rng.uniform(-3, 3, 6)
+        for ess, batched_ess, this_energy_influx in zip(ess_devices, batched_ess_devices, energy_influx):
+            ess.update_ess_state(this_energy_influx)
+            batched_ess.update_ess_state(this_energy_influx)
+        update_ess_aging(batched_ess_devices)
+
+        for ess, batched_ess in zip(ess_devices, batched_ess_devices):
+            assert abs(batched_ess.max_capacity - ess.max_capacity) < 1e-12
+            assert abs(batched_ess.soc_actual - ess.soc_actual) < 1e-12
+            assert batched_ess.time_in_use == ess.time_in_use
+    assert ess_devices[0].max_capacity < ess_devices[0].max_capacity_init
+
+
+def run():
+    test_ess_temperature_running_average()
+    test_update_ess_aging_matches_ess()
+    print("\nTest finished.")
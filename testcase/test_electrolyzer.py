@@ -1,5 +1,13 @@
 
+import itertools
+import math
+import random
+
+import numpy as np
+from scipy.optimize import linprog
+
 from source.electrolyzer import Electrolyzer
+from source.devices_methods import get_v_i, ely_cell_voltage_array
 from source.data import Data
 import source.const as const
 
@@ -17,6 +25,323 @@ class DepthVar:
         return self.__setattr__(method_name, val)
 
 
+def create_electrolyzer():
+    # The electrolyzer physics only need the market interval, the H2 demand, the forecast horizon and the number of
+    # steps from the model.
+    model = DepthVar()
+    model.add_method("data")
+    model.data.add_method("num_steps", 96)
+    model.data.add_method("market_interval", 15)
+    model.data.add_method("electrolyzer_list", [0] * 96)
+    model.data.add_method("forecast_horizon", 96)
+
+    return Electrolyzer('Electrolyzer', model)
+
+
+def exact_cell_voltage(ely, cur_dens, temp):
+    return ely.ely_voltage_u_rev(temp) + ely.ely_voltage_u_act(cur_dens, temp) + ely.ely_voltage_u_ohm(cur_dens, temp)
+
+
+def test_lookup_table_cell_voltage():
+    ely = create_electrolyzer()
+    ely.physics_model = 'lookup_table'
+    rng = random.Random(5)
+
+    for _ in range(2000):
+        cur_dens = math.exp(rng.uniform(math.log(ely.lookup_cur_dens_range[0]), math.log(ely.lookup_cur_dens_range[1])))
+        temp = rng.uniform(ely.temp_min, ely.temp_max)
+        assert abs(ely.lookup_cell_voltage(cur_dens, temp) - exact_cell_voltage(ely, cur_dens, temp)) < 1e-7
+
+    # Outside of the table range there is no lookup value.
+    assert ely.lookup_cell_voltage(ely.lookup_cur_dens_range[1] * 1.01, ely.temp_min) is None
+    assert ely.lookup_cell_voltage(0.1, ely.temp_max + 1) is None
+
+
+def test_lookup_table_matches_iterative_solver():
+    ely = create_electrolyzer()
+    rng = random.Random(6)
+
+    for _ in range(500):
+        power = rng.uniform(0.1, 180)
+        ely.temp = rng.uniform(ely.temp_min, ely.temp_max)
+        ely.physics_model = 'lookup_table'
+        voltage, current, cur_dens, power_lookup = ely.get_electricity_by_power(power)
+        ely.physics_model = 'iterative'
+        _, _, cur_dens_iteration, _ = ely.get_electricity_by_power(power)
+
+        # The state from the tables meets the requested power within the documented bound.
+        assert abs(exact_cell_voltage(ely, cur_dens, ely.temp) * ely.z_cell * current / 1000 - power) < 5e-6
+        assert abs(voltage * current / 1000 - power_lookup) < 1e-9
+        assert abs(cur_dens - cur_dens_iteration) / cur_dens_iteration < 1e-5
+
+    # The physics model is chosen at each call, each model was used for every power.
+    assert ely.solver_stats['lookups'] == 500 and ely.solver_stats['calls'] == 500
+
+    # Powers outside of the table range are handled by the iterative solver.
+    ely.physics_model = 'lookup_table'
+    assert ely.get_electricity_by_power_lookup(1000) is None
+    assert ely.get_electricity_by_power(0) == [0, 0, 0, 0]
+
+
+def test_iterative_physics_model_is_default():
+    ely = create_electrolyzer()
+    ely.temp = 330
+
+    # The tables are only built if the lookup table model is used.
+    ely.get_electricity_by_power(120)
+    assert ely.physics_model == 'iterative' and ely.lookup_tables is None
+    # Newton's method has to be chosen, the default stays with the results of the fixed point iteration.
+    assert ely.iterative_solver == 'fixed_point'
+    assert ely.solver_stats['lookups'] == 0 and ely.solver_stats['calls'] == 1
+    assert ely.lookup_cell_voltage(0.2, 330) is None
+
+
+def test_newton_matches_fixed_point_iteration():
+    ely = create_electrolyzer()
+    rng = random.Random(7)
+
+    for _ in range(500):
+        power = rng.choice([rng.uniform(1e-3, 1), rng.uniform(1, 250)])
+        ely.temp = rng.uniform(ely.temp_min, ely.temp_max)
+        # Warm start at the current density of a random last step (0: start at the efficiency based estimate).
+        ely.cur_dens = rng.choice([0, rng.uniform(1e-4, 0.5)])
+        ely.iterative_solver = 'newton'
+        _, _, cur_dens, power_newton = ely.get_electricity_by_power(power)
+        ely.iterative_solver = 'fixed_point'
+        _, _, cur_dens_iteration, _ = ely.get_electricity_by_power(power)
+
+        assert abs(power_newton - power) <= 1e-5
+        assert abs(exact_cell_voltage(ely, cur_dens, ely.temp) * cur_dens * ely.area_cell * ely.z_cell / 1000 - power) \
+            <= 1e-5
+        # Both solvers accept a power deviation of 1e-5 kW, which is large compared to very low powers.
+        assert abs(cur_dens - cur_dens_iteration) < 1e-4 * cur_dens_iteration + 1e-7
+
+    assert ely.solver_stats['calls'] == 1000
+    assert ely.solver_stats['converged'] == 1000
+
+
+def test_get_v_i_newton():
+    ely = create_electrolyzer()
+    ely.temp = 330
+    ely.power = 120
+    get_v_i(ely)
+    # Warm started at the last current density, the solver converges within a few iterations.
+    ely.power = 125
+    iterations = ely.solver_stats['iterations']
+    get_v_i(ely)
+
+    assert ely.solver_stats['iterations'] - iterations <= 3
+    assert abs(ely.power - 125) <= 1e-5
+    assert abs(ely.voltage * ely.current / 1000 - ely.power) < 1e-9
+    assert abs(exact_cell_voltage(ely, ely.cur_dens, ely.temp) * ely.z_cell - ely.voltage) < 1e-12
+
+
+def test_voltage_arrays_match_scalar_functions():
+    ely = create_electrolyzer()
+    rng = np.random.default_rng(8)
+    cur_dens = np.exp(rng.uniform(math.log(1e-5), math.log(0.5), 50))
+    temps = rng.uniform(ely.temp_min, ely.temp_max, 20)
+
+    # A column of current densities and a row of temperatures give the whole grid.
+    cell_voltage = ely_cell_voltage_array(ely, cur_dens[:, np.newaxis], temps[np.newaxis, :])
+
+    assert cell_voltage.shape == (50, 20)
+    for i_cur_dens, i_temp in itertools.product(range(50), range(20)):
+        assert abs(cell_voltage[i_cur_dens, i_temp] -
+                   exact_cell_voltage(ely, cur_dens[i_cur_dens], temps[i_temp])) < 1e-12
+
+
+def test_power_by_production_curve():
+    ely = create_electrolyzer()
+    ely.temp = 320
+    h2_production = [0, 1e-3, 0.1, 0.5, ely.max_production_per_step]
+
+    for physics_model in ['iterative', 'lookup_table']:
+        ely.physics_model = physics_model
+        power = ely.get_power_by_production_curve(h2_production)
+
+        assert power[0] == 0
+        # The bids are derived from the curve, they stay within the power tolerance of the solvers.
+        for this_power, this_production in zip(power, h2_production):
+            assert abs(this_power - ely.get_power_by_production(this_production)) < 1e-5
+
+    # One temperature per production.
+    temps = np.linspace(ely.temp_min, ely.temp_max, len(h2_production))
+    power = ely.get_power_by_production_curve(h2_production, temps)
+    for this_power, this_production, temp in zip(power, h2_production, temps):
+        ely.temp = temp
+        assert abs(this_power - ely.get_power_by_production(this_production)) < 1e-5
+
+
+def dense_forecast_bidding(ely, solver):
+    # The forecast bidding problem over x as formulated with dense matrices, solved for reference.
+    n_step = ely.forecast_horizon
+    c = np.asarray(ely.model.data.utility_pricing_profile[:n_step])
+    lower_triangular = np.tril(np.ones((n_step, n_step)))
+    A = np.vstack([-lower_triangular, lower_triangular])
+    cumsum_h2_demand = np.cumsum([-x for x in ely.h2_demand[:n_step]])
+    b = cumsum_h2_demand + ely.stored_hydrogen - ely.storage_buffer
+    b_append = -b + ely.storage_size
+    b[-1] -= ely.stored_hydrogen - ely.storage_buffer
+    b = np.concatenate((b, b_append))
+    if solver in ['linprog', 'greedy']:
+        return linprog(c, A, b, bounds=((0, ely.max_production_per_step),) * n_step).x
+
+    from cvxopt import matrix, solvers
+    G = np.vstack([A, np.eye(n_step), -np.eye(n_step)])
+    d = np.concatenate((b, np.full(n_step, ely.max_production_per_step), np.zeros(n_step)))
+    q = 1.5 * ely.max_production_per_step / 0.4 * 2 * c
+    solvers.options['show_progress'] = False
+    return np.array(solvers.qp(matrix(np.diag(c)), matrix(q), matrix(G), matrix(d))['x'])[:, 0]
+
+
+def test_forecast_bidding_matches_dense_formulation():
+    rng = np.random.default_rng(9)
+    ely = create_electrolyzer()
+    ely.forecast_horizon = 48
+    # The first step is the cheapest one, so hydrogen is produced in it.
+    ely.model.data.add_method("utility_pricing_profile", [0.01] + rng.uniform(0.02, 0.3, 95).tolist())
+    ely.h2_demand = rng.uniform(0, 1.2, 96).tolist()
+    ely.stored_hydrogen = 60
+    ely.current_step = 0
+
+    solvers = ['linprog', 'greedy']
+    try:
+        import cvxopt
+        solvers.append('quadprog')
+    except ImportError:
+        pass
+    for solver in solvers:
+        ely.bidding_solver = solver
+        ely.update_bid()
+        expected_production = dense_forecast_bidding(ely, solver)[0]
+        expected_energy = ely.get_power_by_production(expected_production) * ely.interval_time / 60
+        assert abs(ely.bid[1] - expected_energy) < 1e-4 * expected_energy
+        # The constraint matrices are built once per horizon (the greedy solver does not need them).
+        matrix_solvers = [name for name in solvers[:solvers.index(solver) + 1] if name != 'greedy']
+        assert list(ely.constraint_matrices) == [(name, 48) for name in matrix_solvers]
+
+
+def test_receding_horizon_replans():
+    rng = np.random.default_rng(10)
+    ely = create_electrolyzer()
+    ely.forecast_horizon = 48
+    ely.model.data.add_method("utility_pricing_profile", rng.uniform(0.02, 0.3, 96).tolist())
+    ely.h2_demand = rng.uniform(0, 1.2, 96).tolist()
+    ely.stored_hydrogen = 60
+    ely.bidding_solver = 'linprog'
+    ely.receding_horizon = True
+    ely.replan_interval = 4
+
+    for step in range(10):
+        ely.current_step = step
+        if step == 6:
+            # The storage deviates from the plan, e.g. because the bid was not met.
+            ely.stored_hydrogen -= 1
+        ely.update_bid()
+        planned_production = ely.plan['production'][step - ely.plan['step']]
+        ely.stored_hydrogen += planned_production - ely.h2_demand[step]
+
+    # The plan is followed for replan_interval steps, and optimized again as soon as the storage deviates from it.
+    assert ely.track_bidding_solved == [True, False, False, False, True, False, True, False, False, False]
+    assert len(ely.track_solve_time) == 10
+
+
+def test_idle_steps_match_power_update():
+    rng = np.random.default_rng(17)
+    ely = create_electrolyzer()
+    ely.h2_demand = rng.uniform(0, 1.2, 96).tolist()
+    ely.stored_hydrogen = 20
+    idle_ely = create_electrolyzer()
+    idle_ely.h2_demand = ely.h2_demand
+    idle_ely.stored_hydrogen = 20
+    bought_energy = [30, 25, 0, 0, 0, 40] + [0] * 34
+
+    for step, energy in enumerate(bought_energy):
+        # Reference: the full power and storage update.
+        ely.current_step = step
+        ely.update_power(energy)
+        ely.update_storage()
+        idle_ely.current_step = step
+        if energy == 0:
+            idle_ely.advance_idle()
+        else:
+            idle_ely.track_bought_energy.append(energy)
+            idle_ely.update_power(energy)
+            idle_ely.update_storage()
+            idle_ely.track_on_off()
+        assert idle_ely.temp == ely.temp and idle_ely.stored_hydrogen == ely.stored_hydrogen
+    assert idle_ely.demand_not_fulfilled == ely.demand_not_fulfilled > 0
+    assert idle_ely.track_stored_hydrogen == ely.track_stored_hydrogen
+    assert idle_ely.track_on_off_events == [[0, 'on'], [2, 'off'], [5, 'on'], [6, 'off']]
+
+    # The closed form cool-down and depletion over several idle steps at once.
+    multi_step_ely = create_electrolyzer()
+    multi_step_ely.h2_demand = ely.h2_demand
+    multi_step_ely.stored_hydrogen = 20
+    for step, energy in enumerate(bought_energy[:6]):
+        multi_step_ely.current_step = step
+        multi_step_ely.update_power(energy)
+        multi_step_ely.update_storage()
+    multi_step_ely.current_step = 6
+    multi_step_ely.advance_idle(34)
+    assert multi_step_ely.current_step == 6
+    assert abs(multi_step_ely.temp - ely.temp) < 1e-9
+    assert abs(multi_step_ely.demand_not_fulfilled - ely.demand_not_fulfilled) < 1e-9
+    assert np.abs(np.array(multi_step_ely.track_stored_hydrogen) - ely.track_stored_hydrogen).max() < 1e-9
+    assert multi_step_ely.track_demand == ely.track_demand
+
+
+def run_auction_rounds(ely):
+    # Run the auction rounds of the electrolyzer, the bids are always met.
+    ely.model.add_method("auction")
+    bids = []
+    for step in range(ely.model.data.num_steps):
+        ely.model.step_count = step
+        ely.model.auction.bid_list = []
+        ely.pre_auction_round()
+        bids.append(ely.model.auction.bid_list)
+        ely.model.auction.who_gets_what_dict = {ely.id: [bid[1] for bid in ely.model.auction.bid_list]}
+        ely.post_auction_round()
+    return bids
+
+
+def test_receding_horizon_idle_runs():
+    rng = np.random.default_rng(21)
+    # Electricity is only cheap every 12 steps, the plan does not buy in between.
+    prices = np.where(np.arange(120) % 12 == 0, 0.02, rng.uniform(0.2, 0.3, 120)).tolist()
+    ely_list = []
+    for idle_runs in [True, False]:
+        ely = create_electrolyzer()
+        ely.model.data.add_method("utility_pricing_profile", prices)
+        ely.h2_demand = rng.uniform(0, 0.1, 120).tolist() if idle_runs else ely_list[0].h2_demand
+        ely.stored_hydrogen = 60
+        # The greedy solver plans exact zeros (linprog plans tiny productions, which are bid).
+        ely.bidding_solver = 'greedy'
+        ely.forecast_horizon = 24
+        ely.receding_horizon = True
+        ely.replan_interval = 16
+        if not idle_runs:
+            # Reference: the idle steps are advanced one by one.
+            ely.get_idle_steps = lambda planned_energy: 1
+        ely_list.append(ely)
+    [ely, reference_ely] = ely_list
+
+    # The closed form cool-down deviates from the steps by rounding errors, which slightly change the later bids.
+    for bids, reference_bids in zip(run_auction_rounds(ely), run_auction_rounds(reference_ely)):
+        assert len(bids) == len(reference_bids)
+        for bid, reference_bid in zip(bids, reference_bids):
+            assert bid[0] == reference_bid[0] and abs(bid[1] - reference_bid[1]) < 1e-9
+    assert ely.track_bidding_solved == reference_ely.track_bidding_solved
+    assert ely.track_demand == reference_ely.track_demand
+    assert ely.track_on_off_events == reference_ely.track_on_off_events
+    for track in ['track_bought_energy', 'track_stored_hydrogen']:
+        assert np.abs(np.array(getattr(ely, track)) - getattr(reference_ely, track)).max() < 1e-9
+    assert abs(ely.temp - reference_ely.temp) < 1e-9
+    # The steps of an idle run are not optimized.
+    assert ely.track_solve_time.count(0.0) > 48
+
+
 def run():
     # While the creation of the electrolyzer instance requires a model instance, it has to be created
     ts_data = Data()
@@ -0,0 +1,60 @@
+import numpy as np
+from scipy.optimize import linprog
+
+from source.electrolyzer_methods import RangeMinTree, cheapest_hours_production
+
+
+def test_range_min_tree():
+    rng = np.random.default_rng(12)
+    values = rng.uniform(-1, 1, 37)
+    tree = RangeMinTree(values.tolist())
+
+    for _ in range(300):
+        lo, hi = sorted(rng.integers(0, 37, 2))
+        if rng.random() < 0.5:
+            value = rng.uniform(-1, 1)
+            tree.add(lo, hi, value)
+            values[lo:hi + 1] += value
+        else:
+            assert abs(tree.range_min(lo, hi) - values[lo:hi + 1].min()) < 1e-12
+
+
+def test_cheapest_hours_production_matches_linprog():
+    rng = np.random.default_rng(13)
+    num_feasible = 0
+
+    for _ in range(500):
+        num_steps = int(rng.integers(1, 30))
+        max_production = rng.choice([0.8, 1.5])
+        # Prices with ties and negative prices, storage bounds as in the electrolyzer bidding (see
+        # Electrolyzer.get_constraint_bounds).
+        prices = rng.choice([rng.uniform(0, 0.3, num_steps), rng.integers(0, 4, num_steps) / 10,
+                             rng.uniform(-0.05, 0.3, num_steps)])
+        cumsum_h2_demand = -np.cumsum(rng.uniform(0, 1.2, num_steps))
+        stored_hydrogen = rng.uniform(56, 150)
+        b = cumsum_h2_demand + stored_hydrogen - 56
+        b_append = -b + rng.choice([200, 70])
+        b[-1] -= stored_hydrogen - 56
+
+        production = cheapest_hours_production(prices.tolist(), (-b).tolist(), b_append.tolist(), max_production)
+        lower_triangular = np.tril(np.ones((num_steps, num_steps)))
+        expected = linprog(prices, np.vstack([-lower_triangular, lower_triangular]), np.concatenate((b, b_append)),
+                           bounds=[(0, max_production)] * num_steps)
+
+        assert (production is not None) == (expected.status == 0)
+        if production is None:
+            continue
+        num_feasible += 1
+        production = np.array(production)
+        accumulated_production = np.cumsum(production)
+        assert np.all(production >= 0) and np.all(production <= max_production + 1e-9)
+        assert np.all(accumulated_production >= -b - 1e-9) and np.all(accumulated_production <= b_append + 1e-9)
+        assert prices @ production <= expected.fun + 1e-9
+
+    assert num_feasible > 100
+
+
+def run():
+    test_range_min_tree()
+    test_cheapest_hours_production_matches_linprog()
+    print("\nTest finished.")
@@ -0,0 +1,48 @@
+import numpy as np
+
+from source.ess_fleet import ESSFleet
+from testcase.helpers import create_households
+
+
+ESS_DATA = [[0, 10], [5, 10], [10, 10], [1, 4], [3.5, 7], [0.5, 2]]
+
+
+def test_ess_fleet_matches_ess():
+    rng = np.random.default_rng(16)
+    num_steps = 40
+
+    for constraints_setting in ['off', 'on']:
+        households = create_households(ESS_DATA, num_steps, constraints_setting, ess_temperature_history=2)
+        fleet_households = create_households(ESS_DATA, num_steps, constraints_setting, ess_temperature_history=2)
+        fleet = ESSFleet(fleet_households)
+
+        for step in range(num_steps):
+            energy_influx = rng.uniform(-6, 6, len(households))
+            for household, this_energy_influx in zip(households, energy_influx):
+                household.step_count = step
+                overflow, deficit = household.ess.update_ess_state(this_energy_influx)
+                household.data.overflow_over_time[household.id][step] = overflow
+                household.data.deficit_over_time[household.id][step] = deficit
+                household.overflow_tot += overflow
+                household.deficit_tot += deficit
+            fleet.energy_influx[:] = energy_influx
+            fleet.update(step)
+
+            for household, fleet_household in zip(households, fleet_households):
+                assert fleet_household.ess_fleet is fleet
+                for name in ['soc_actual', 'max_capacity', 'time_in_use', 'total_charge_throughput',
+                             'temperature_sum', 'temperature_count']:
+                    assert abs(getattr(fleet_household.ess, name) - getattr(household.ess, name)) < 1e-12
+                assert list(fleet_household.ess.temperature) == list(household.ess.temperature)
+                assert abs(fleet_household.overflow_tot - household.overflow_tot) < 1e-12
+                assert abs(fleet_household.deficit_tot - household.deficit_tot) < 1e-12
+        for name in ['soc_list_over_time', 'overflow_over_time', 'deficit_over_time']:
+            assert np.abs(getattr(fleet_households[0].data, name) - getattr(households[0].data, name)).max() < 1e-12
+        if constraints_setting == 'off':
+            # Without the charging limits, the influxes lead to overflows and depletions.
+            assert households[0].data.overflow_over_time.any() and households[0].data.deficit_over_time.any()
+
+
+def run():
+    test_ess_fleet_matches_ess()
+    print("\nTest finished.")
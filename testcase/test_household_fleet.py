@@ -0,0 +1,42 @@
+import numpy as np
+
+from source.data_methods import ScaledProfile
+from source.household_fleet import HouseholdFleet
+
+
+class Household:
+    """ household with only the attributes the fleet reads """
+    def __init__(self, load_data, pv_data):
+        self.load_data = load_data
+        self.pv_data = pv_data
+        self.has_ess = False
+        self.has_load = load_data is not None
+        self.has_pv = pv_data is not None
+
+
+def test_household_fleet_matches_devices():
+    rng = np.random.default_rng(5)
+    num_steps = 20
+    pv_base = rng.uniform(0, 2, num_steps)
+    households = [Household(rng.uniform(0.1, 1, num_steps).tolist(), ScaledProfile(pv_base, 1)),
+                  Household(rng.uniform(0.1, 1, num_steps).tolist(), None),
+                  Household(rng.uniform(0.1, 1, num_steps).tolist(), ScaledProfile(pv_base, 2.5)),
+                  Household(rng.uniform(0.1, 1, num_steps).tolist(), rng.uniform(0, 2, num_steps).tolist())]
+    fleet = HouseholdFleet(households)
+
+    for step in range(num_steps):
+        fleet.update(step)
+        for index, household in enumerate(households):
+            # What the GeneralLoad and PVPanel devices return for this household.
+            load = - float(household.load_data[step])
+            generation = abs(float(household.pv_data[step])) if household.has_pv else 0
+
+            assert household.fleet is fleet and household.fleet_index == index
+            assert fleet.load_on_step[index] == load
+            assert fleet.generation_on_step[index] == generation
+            assert fleet.surplus_on_step[index] == load + generation
+
+
+def run():
+    test_household_fleet_matches_devices()
+    print("\nTest finished.")
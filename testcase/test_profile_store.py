@@ -0,0 +1,133 @@
+import multiprocessing
+import os
+import pickle
+import tempfile
+import time
+
+import numpy as np
+
+from grid_config_profile import ConfigurationUtility50prosumer, ConfigurationUtilityElyPv
+from source import data_methods
+from source.data import Data
+from source.profile_store import ProfileStore
+
+
+def test_profile_store_shares_profiles():
+    with ProfileStore() as profile_store:
+        time_series = profile_store.get('profile', lambda: [0.0, 1.5, 3.0])
+        assert time_series.tolist() == [0.0, 1.5, 3.0]
+        # Stored profiles are not parsed again.
+        assert profile_store.get('profile', lambda: [9.9]).tolist() == [0.0, 1.5, 3.0]
+
+        # A pickled store (as handed to a worker process) attaches to the same memory.
+        attached_store = pickle.loads(pickle.dumps(profile_store))
+        assert attached_store.get('profile', lambda: [9.9]).tolist() == [0.0, 1.5, 3.0]
+        assert not attached_store.get('profile', lambda: [9.9]).flags.writeable
+        attached_store.close()
+
+
+def test_data_from_profile_store_matches_csv():
+    expected = Data(ConfigurationUtilityElyPv(), None)
+
+    with ProfileStore() as profile_store:
+        profile_store.preload(ConfigurationUtilityElyPv())
+        config = ConfigurationUtilityElyPv()
+        config.profile_store = pickle.loads(pickle.dumps(profile_store))
+        data = Data(config, None)
+
+        for attribute in ['load_array', 'pv_gen_array', 'electrolyzer_list', 'pv_commercial_list',
+                          'utility_pricing_profile']:
+            assert np.array_equal(getattr(data, attribute), getattr(expected, attribute))
+            assert type(getattr(data, attribute)) == type(getattr(expected, attribute))
+        assert data.agent_data_array == expected.agent_data_array
+
+
+def test_households_share_profiles_of_profile_store():
+    with ProfileStore() as profile_store:
+        profile_store.preload(ConfigurationUtility50prosumer())
+        config = ConfigurationUtility50prosumer()
+        config.profile_store = profile_store
+        data = Data(config, None)
+
+        load_profiles = [profile_store.get(('household_load', config.household_loads_folder, profile), None)
+                         for profile in data_methods.household_load_profile_names(config.num_households,
+                                                                                  config.household_loads_folder)]
+        pv_profile = profile_store.get(('pv_output', config.pv_output_profile), None)
+        for load_data, pv_data, _ in data.agent_data_array:
+            # The households read the profiles of the store, without copies they could change.
+            assert any(np.shares_memory(load_data, load_profile) for load_profile in load_profiles)
+            assert not load_data.flags.writeable
+            if pv_data is not None:
+                assert np.shares_memory(pv_data.base, pv_profile) and not pv_data.base.flags.writeable
+        assert np.shares_memory(data.electrolyzer_list, profile_store.get(('fuel_station_load',
+                                                                           config.fuel_station_load), None))
+
+
+def test_npy_cached_follows_csv_file():
+    profiles_path, cache_path = data_methods.path, data_methods.cache_path
+    with tempfile.TemporaryDirectory() as profiles_dir:
+        data_methods.path = profiles_dir
+        data_methods.cache_path = profiles_dir + '/.profile_cache'
+        try:
+            csv_file = profiles_dir + '/profile.csv'
+            with open(csv_file, 'w') as file:
+                file.write('0,1.5\n1,2.5\n')
+            parse = lambda: data_methods.csv_load_file(profiles_dir, 'profile.csv')
+
+            assert data_methods.npy_cached(csv_file, 'load', parse).tolist() == [1.5, 2.5]
+            # The binary is used from now on, the csv file is not parsed anymore.
+            assert data_methods.npy_cached(csv_file, 'load', lambda: [9.9]).tolist() == [1.5, 2.5]
+
+            # A changed csv file gets a new binary, the old one is left for processes that may still use it.
+            with open(csv_file, 'w') as file:
+                file.write('0,1.5\n1,2.5\n2,3.5\n')
+            assert data_methods.npy_cached(csv_file, 'load', parse).tolist() == [1.5, 2.5, 3.5]
+            assert len(os.listdir(data_methods.cache_path)) == 2
+        finally:
+            data_methods.path, data_methods.cache_path = profiles_path, cache_path
+
+
+def npy_cached_in_process(profiles_dir):
+    # Reads the profile through a cold cache, parsing slowly so the processes create the binary at the same time.
+    data_methods.path = profiles_dir
+    data_methods.cache_path = profiles_dir + '/.profile_cache'
+
+    def parse():
+        time.sleep(0.2)
+        return data_methods.csv_load_file(profiles_dir, 'profile.csv')
+
+    return data_methods.npy_cached(profiles_dir + '/profile.csv', 'load', parse).tolist()
+
+
+def test_npy_cached_in_parallel_processes():
+    with tempfile.TemporaryDirectory() as profiles_dir:
+        with open(profiles_dir + '/profile.csv', 'w') as file:
+            file.write('0,1.5\n1,2.5\n2,3.5\n')
+
+        with multiprocessing.Pool(8) as pool:
+            results = pool.map(npy_cached_in_process, [profiles_dir] * 16)
+
+        assert results == [[1.5, 2.5, 3.5]] * 16
+        # One binary, no temporary files left behind.
+        assert len(os.listdir(profiles_dir + '/.profile_cache')) == 1
+
+
+def test_scaled_profile_matches_scaled_list():
+    base = np.array([0.0, 0.25, 1.3, 0.7])
+    scaled_list = [value * 1.7 for value in base.tolist()]
+    scaled_profile = data_methods.ScaledProfile(base, 1.7)
+
+    assert len(scaled_profile) == len(scaled_list)
+    assert [scaled_profile[i] for i in range(len(base))] == scaled_list
+    assert scaled_profile[1:3] == scaled_list[1:3]
+    assert list(scaled_profile) == scaled_list
+
+
+def run():
+    test_profile_store_shares_profiles()
+    test_data_from_profile_store_matches_csv()
+    test_households_share_profiles_of_profile_store()
+    test_npy_cached_follows_csv_file()
+    test_npy_cached_in_parallel_processes()
+    test_scaled_profile_matches_scaled_list()
+    print("\nTest finished.")
@@ -0,0 +1,126 @@
+import numpy as np
+import scipy.optimize as optimize
+
+from grid_config_profile import ConfigurationUtility50prosumer
+from source.strategies.smart_ess_strategy import battery_price_curve, battery_price_curves, \
+    price_point_optimization, utility_function_points
+from source.wallet import Wallet
+from testcase.helpers import run_and_collect_orders, short_configuration
+
+
+class ESS:
+    """ ESS with only the surplus the utility function reads """
+    def __init__(self, surplus):
+        self.surplus = surplus
+
+
+class Household:
+    """ household with only the attributes the price curve and the utility function read """
+    def __init__(self, trading_state, surplus=0):
+        self.trading_state = trading_state
+        self.ess = ESS(surplus)
+        self.wallet = Wallet(0)
+
+
+def price_curve_loop(trading_state, mmr, base, trade_volume, number_of_bids):
+    """ price curve point by point, as a reference """
+    increment = trade_volume / number_of_bids
+    curve = []
+    volume_prev = 0
+    for volume in np.arange(increment, trade_volume, increment):
+        if trading_state == 'supplying':
+            price = (mmr - base) / trade_volume**4 * volume**4 + base
+        else:
+            price = mmr - (mmr - base) / trade_volume**4 * volume**4
+        curve.append([min(price, mmr), volume - volume_prev])
+        volume_prev = volume
+    return curve
+
+
+def test_battery_price_curve_matches_loop():
+    rng = np.random.default_rng(17)
+    for trading_state in ['supplying', 'buying']:
+        for _ in range(300):
+            mmr = rng.uniform(0.05, 0.4)
+            base = rng.choice([0, rng.uniform(0, 0.05)])
+            trade_volume = rng.uniform(1e-3, 30)
+            number_of_bids = int(rng.integers(1, 30))
+            assert battery_price_curve(Household(trading_state), mmr, base, trade_volume, number_of_bids) == \
+                price_curve_loop(trading_state, mmr, base, trade_volume, number_of_bids)
+
+
+def test_battery_price_curves_match_single_curves():
+    rng = np.random.default_rng(18)
+    num_curves = 40
+    supplying = rng.random(num_curves) < 0.5
+    mmr = rng.uniform(0.05, 0.4, num_curves)
+    base = np.where(supplying, rng.uniform(0, 0.05, num_curves), 0)
+    trade_volume = rng.uniform(1e-3, 30, num_curves)
+    number_of_bids = rng.integers(1, 30, num_curves)
+
+    prices, volumes, curve = battery_price_curves(supplying, mmr, base, trade_volume, number_of_bids)
+
+    assert np.all(np.diff(curve) >= 0)
+    for index in range(num_curves):
+        trading_state = 'supplying' if supplying[index] else 'buying'
+        single_curve = battery_price_curve(Household(trading_state), mmr[index], base[index], trade_volume[index],
+                                           int(number_of_bids[index]))
+        assert [[price, volume] for price, volume in zip(prices[curve == index].tolist(),
+                                                          volumes[curve == index].tolist())] == single_curve
+
+
+def test_utility_function_points_are_optimal():
+    rng = np.random.default_rng(19)
+    for supplying in [True, False]:
+        for _ in range(50):
+            mmr = rng.uniform(0.05, 0.4)
+            energy = rng.uniform(0.01, 10)
+            trade_volume = energy * rng.uniform(0.2, 1)
+
+            def utility(params):
+                allocation, price = params
+                if supplying:
+                    return (energy - allocation) ** 2 - allocation * price
+                return (energy - allocation) ** 2 + allocation * price * 0.001
+
+            [price], [quantity] = utility_function_points(np.array([supplying]), mmr, energy, trade_volume)
+            numerical = optimize.minimize(utility, [0.1, 0.1], method='SLSQP', bounds=[[0, trade_volume], [0, mmr]])
+            assert 0 <= price <= mmr and 0 <= quantity <= trade_volume
+            assert utility([quantity, price]) <= numerical.fun + 1e-6
+
+
+def test_custom_utility_function_is_optimized_numerically():
+    household = Household('buying', surplus=-3)
+
+    [[price, quantity]] = price_point_optimization(
+        household, lambda house, params: (params[0] - abs(house.ess.surplus)) ** 2 + (params[1] - 0.2) ** 2)
+
+    assert abs(price - 0.2) < 1e-4 and abs(quantity - 3) < 1e-4
+
+
+def test_fleet_orders_match_household_orders():
+    orders = {}
+    for bidding_method, strategy_batches in [['price_curve', False], ['price_curve', True],
+                                             ['utility_function_analytic', False],
+                                             ['utility_function_analytic', True]]:
+        def use_bidding_method(microgrid):
+            for house_id in range(microgrid.data.num_households):
+                microgrid.agents[house_id].bidding_method = bidding_method
+
+        _, orders[bidding_method, strategy_batches] = run_and_collect_orders(
+            short_configuration(ConfigurationUtility50prosumer, 30, strategy_batches=strategy_batches),
+            prepare=use_bidding_method)
+
+    for bidding_method in ['price_curve', 'utility_function_analytic']:
+        assert orders[bidding_method, True] == orders[bidding_method, False]
+        # Both sides of the market got orders of the ESS households.
+        assert any(len(bids) > 1 and len(offers) > 1 for bids, offers in orders[bidding_method, True])
+
+
+def run():
+    test_battery_price_curve_matches_loop()
+    test_battery_price_curves_match_single_curves()
+    test_utility_function_points_are_optimal()
+    test_custom_utility_function_is_optimized_numerically()
+    test_fleet_orders_match_household_orders()
+    print("\nTest finished.")
@@ -0,0 +1,63 @@
+import pickle
+
+from grid_config_profile import ConfigurationUtility50prosumerEly
+from source.solver_pool import SolverPool
+from testcase.helpers import run_and_collect_orders, short_configuration
+
+
+class StorageAgent:
+    """ agent with only the solver pool interface """
+    def __init__(self, _unique_id, problem):
+        self.id = _unique_id
+        self.problem = problem
+        self.solution = None
+
+    def get_optimization_problem(self):
+        return self.problem
+
+    def set_optimization_solution(self, solution, solve_time):
+        self.solution = [solution, solve_time]
+
+
+def test_solver_pool_solves_all_problems():
+    agents = [StorageAgent('Electrolyzer', [sum, [[1, 2, 3]]]), StorageAgent('CommercialBattery', None),
+              StorageAgent('Electrolyzer2', [max, [4, 7]])]
+    solver_pool = SolverPool(2)
+
+    solve_time = solver_pool.solve(agents)
+
+    assert sorted(solve_time) == ['Electrolyzer', 'Electrolyzer2']
+    assert agents[0].solution == [6, solve_time['Electrolyzer']]
+    assert agents[1].solution is None
+    assert agents[2].solution == [7, solve_time['Electrolyzer2']]
+    # The worker threads are not pickled, they are started again.
+    solver_pool = pickle.loads(pickle.dumps(solver_pool))
+    assert solver_pool.executor is None
+    assert list(solver_pool.solve(agents[:1])) == ['Electrolyzer']
+    assert solver_pool.executor is not None
+
+
+def use_greedy_solver(microgrid):
+    microgrid.agents['Electrolyzer'].bidding_solver = 'greedy'
+
+
+def test_solver_pool_matches_agent_solving():
+    orders = {}
+    for solver_pool_workers in [0, 2]:
+        # With a dynamic utility price for the electrolyzer optimization.
+        config = short_configuration(ConfigurationUtility50prosumerEly, 4, forecast_horizon=96,
+                                     utility_dynamical_pricing=True, solver_pool_workers=solver_pool_workers)
+        microgrid, orders[solver_pool_workers] = run_and_collect_orders(
+            config, prepare=use_greedy_solver, collect=lambda this_microgrid: this_microgrid.agents['Electrolyzer'].bid)
+
+    assert orders[2] == orders[0]
+    solve_time = microgrid.data.agent_measurements['Electrolyzer']['solve_time_over_time']
+    assert all(solve_time > 0)
+    assert all(microgrid.data.solver_pool_time >= solve_time)
+    assert microgrid.agents['Electrolyzer'].track_solve_time == solve_time.tolist()
+
+
+def run():
+    test_solver_pool_solves_all_problems()
+    test_solver_pool_matches_agent_solving()
+    print("\nTest finished.")
@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+
+from grid_config_profile import ConfigurationUtility50householdPv
+from source.strategies.strategy_registry import get_strategy, register_strategy, strategy_registry
+from testcase.helpers import run_and_collect_orders, short_configuration
+
+
+def flat_price_strategy(self):
+    """ household trades its net energy at a flat price """
+    net_energy = self.generation_on_step + self.load_on_step
+    self.trading_state = 'supplying' if net_energy > 0 else 'buying'
+    self.offers = [[0.1, net_energy, self.id]] if net_energy > 0 else None
+    self.bids = [[0.1, -net_energy, self.id]] if net_energy <= 0 else None
+
+
+def flat_price_strategy_batch(households):
+    net_energy = np.array([household.generation_on_step + household.load_on_step for household in households])
+    supplying = net_energy > 0
+    for household, this_supplying in zip(households, supplying.tolist()):
+        household.trading_state = 'supplying' if this_supplying else 'buying'
+    flat_price_strategy_batch.calls += 1
+    return {'supplying': [np.full(supplying.sum(), 0.1), net_energy[supplying], np.flatnonzero(supplying)],
+            'buying': [np.full((~supplying).sum(), 0.1), -net_energy[~supplying], np.flatnonzero(~supplying)]}
+
+
+def test_unknown_strategy_is_an_error():
+    with pytest.raises(KeyError):
+        get_strategy('no_such_strategy')
+
+
+def use_flat_price_strategy(microgrid):
+    # Every second household without ESS uses the new strategy.
+    for house_id in range(0, microgrid.data.num_households, 2):
+        if microgrid.agents[house_id].selected_strategy == 'simple_strategy':
+            microgrid.agents[house_id].selected_strategy = 'flat_price_strategy'
+
+
+def test_batch_strategy_matches_agent_strategy():
+    orders = {}
+    try:
+        for batch_function in [None, flat_price_strategy_batch]:
+            register_strategy('flat_price_strategy', flat_price_strategy, batch_function)
+            flat_price_strategy_batch.calls = 0
+            microgrid, orders[batch_function] = run_and_collect_orders(
+                short_configuration(ConfigurationUtility50householdPv, 20), prepare=use_flat_price_strategy)
+    finally:
+        strategy_registry.pop('flat_price_strategy')
+
+    assert orders[flat_price_strategy_batch] == orders[None]
+    assert flat_price_strategy_batch.calls == microgrid.data.num_steps
+    assert any(order[0] == 0.1 for bids, offers in orders[None] for order in bids + offers)
+
+
+def trading_states(microgrid):
+    return [[microgrid.agents[house_id].trading_state, microgrid.agents[house_id].net_energy_in_simple_strategy]
+            for house_id in range(microgrid.data.num_households)]
+
+
+def test_simple_strategy_batch_matches_simple_strategy():
+    orders = {}
+    for strategy_batches in [False, True]:
+        # Until midday, so the PV households also sell.
+        _, orders[strategy_batches] = run_and_collect_orders(
+            short_configuration(ConfigurationUtility50householdPv, 60, strategy_batches=strategy_batches),
+            collect=trading_states)
+
+    assert orders[True] == orders[False]
+    # The PV households both buy and sell over the steps.
+    states = [trading_state for _, _, step_states in orders[True] for trading_state, _ in step_states]
+    assert 'supplying' in states and 'buying' in states
+
+
+def use_smart_ess_strategy_without_ess(microgrid):
+    assert microgrid.agents[0].has_ess is False
+    microgrid.agents[0].selected_strategy = 'smart_ess_strategy'
+
+
+def test_household_without_ess_does_not_trade_with_smart_ess_strategy():
+    for strategy_batches in [False, True]:
+        _, orders = run_and_collect_orders(
+            short_configuration(ConfigurationUtility50householdPv, 10, strategy_batches=strategy_batches),
+            prepare=use_smart_ess_strategy_without_ess, collect=lambda microgrid: microgrid.agents[0].trading_state)
+
+        assert all(trading_state is None for _, _, trading_state in orders)
+        assert not any(order[2] == 0 for bids, offers, _ in orders for order in bids + offers)
+        # The other households trade.
+        assert all(len(bids) > 0 for bids, _, _ in orders)
+
+
+def run():
+    test_unknown_strategy_is_an_error()
+    test_batch_strategy_matches_agent_strategy()
+    test_simple_strategy_batch_matches_simple_strategy()
+    test_household_without_ess_does_not_trade_with_smart_ess_strategy()
+    print("\nTest finished.")
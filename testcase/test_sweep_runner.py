@@ -0,0 +1,66 @@
+import functools
+import os
+
+from grid_config_profile import ConfigurationUtility50prosumerEly
+from source.profile_store import ProfileStore
+from source.sweep_runner import parameter_grid, result_file_name, run_sweep, save_result
+from testcase.helpers import short_configuration
+
+# Configuration class of the profile that only runs a few steps.
+ShortConfiguration = functools.partial(short_configuration, ConfigurationUtility50prosumerEly, 4)
+
+
+def test_parameter_grid():
+    param_grid = {'pricing_rule': ['pac', 'pab'], 'ely_stepwise_bid_price': [[0.2, 0.16], [0.1, 0.08]]}
+
+    assert parameter_grid(param_grid) == [
+        {'pricing_rule': 'pac', 'ely_stepwise_bid_price': [0.2, 0.16]},
+        {'pricing_rule': 'pac', 'ely_stepwise_bid_price': [0.1, 0.08]},
+        {'pricing_rule': 'pab', 'ely_stepwise_bid_price': [0.2, 0.16]},
+        {'pricing_rule': 'pab', 'ely_stepwise_bid_price': [0.1, 0.08]},
+    ]
+    assert result_file_name({'pricing_rule': 'pac', 'ely_stepwise_bid_price': [0.2, 0.16]}) == \
+        'result_pricing_rule_pac_ely_stepwise_bid_price_0.2_0.16.pkl'
+
+
+def test_run_sweep_skips_completed_runs(tmp_path):
+    result_dir = str(tmp_path)
+    param_grid = {'pricing_rule': ['pac', 'pab']}
+    # The pac run was completed by an earlier (crashed) sweep.
+    stored_kpi = {'Households': {}}
+    save_result(os.path.join(result_dir, result_file_name({'pricing_rule': 'pac'})), {'pricing_rule': 'pac'},
+                stored_kpi)
+
+    with ProfileStore() as profile_store:
+        profile_store.preload(ShortConfiguration())
+        results = list(run_sweep(ShortConfiguration, param_grid, result_dir, max_workers=1,
+                                 profile_store=profile_store))
+
+    assert [params for params, _ in results] == [{'pricing_rule': 'pac'}, {'pricing_rule': 'pab'}]
+    assert results[0][1] == stored_kpi
+    assert 'Households' in results[1][1] and 'Market' in results[1][1]
+    assert os.path.exists(os.path.join(result_dir, result_file_name({'pricing_rule': 'pab'})))
+
+
+def test_run_sweep_goes_on_after_failed_run(tmp_path):
+    result_dir = str(tmp_path)
+    # The run without a number of steps raises an error in its worker.
+    param_grid = {'num_steps': [None, 4]}
+    failed_runs = []
+
+    results = list(run_sweep(ShortConfiguration, param_grid, result_dir, max_workers=1, failed_runs=failed_runs))
+
+    assert [params for params, _ in results] == [{'num_steps': 4}]
+    assert failed_runs == [{'num_steps': None}]
+    assert os.listdir(result_dir) == [result_file_name({'num_steps': 4})]
+
+
+def run():
+    import tempfile
+    import pathlib
+    test_parameter_grid()
+    with tempfile.TemporaryDirectory() as result_dir:
+        test_run_sweep_skips_completed_runs(pathlib.Path(result_dir))
+    with tempfile.TemporaryDirectory() as result_dir:
+        test_run_sweep_goes_on_after_failed_run(pathlib.Path(result_dir))
+    print("\nTest finished.")